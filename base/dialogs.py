@@ -41,13 +41,12 @@ import matplotlib.pyplot as plt
 from zipfile import ZipFile, BadZipFile
 import os
 import datetime
-from io import BytesIO
 import shutil
 from time import sleep
 
 from .domain import Worker
 from .project import ProjectManager
-from projektcheck.utils.connection import Request
+from projektcheck.utils.connection import Request, file_hash
 from projektcheck.settings import settings
 
 
@@ -407,7 +406,11 @@ class ProgressDialog(Dialog):
         '''
         self.timer.stop()
         if self.worker:
-            self.worker.terminate()
+            # the worker stops by itself at the next safe point
+            if self.worker.cancellable:
+                self.worker.cancel()
+            else:
+                self.worker.terminate()
         self.log_edit.appendHtml('<b> Vorgang abgebrochen </b> <br>')
         self.log_edit.moveCursor(QTextCursor.End)
         self._finished()
@@ -488,7 +491,7 @@ class SettingsDialog(Dialog):
             self.check_basedata_path()
 
         def on_close():
-            if self.download_dialog.permission_error:
+            if self.download_dialog.worker.permission_error:
                 QMessageBox.warning(
                     self, 'Hinweis',
                     'Beim Speichern der Basisdaten ist ein Fehler aufgetreten.'
@@ -497,9 +500,20 @@ class SettingsDialog(Dialog):
                     'Sie den Download erneut (ohne geöffnete Projekte).')
                 self.check_basedata_path()
 
-        self.download_dialog = DownloadDialog(
-            url, path, parent=self, on_success=on_success,
-            auto_close=True, on_close=on_close)
+        # update only the changed files if the versions allow it
+        delta = self.project_manager.basedata_delta(v, base_path)
+        if delta:
+            download, reuse = delta
+            worker = BasedataUpdateWorker(
+                f'{self.settings.BASEDATA_URL}/{v["files_url"]}', path,
+                download, reuse)
+            self.download_dialog = ProgressDialog(
+                worker, parent=self, on_success=on_success, auto_close=True,
+                on_close=on_close)
+        else:
+            self.download_dialog = DownloadDialog(
+                url, path, checksum=v.get('sha256'), parent=self,
+                on_success=on_success, auto_close=True, on_close=on_close)
         self.download_dialog.show()
 
     def check_basedata_path(self):
@@ -626,18 +640,193 @@ class DiagramDialog(Dialog):
                              geometry.width(), geometry.height())
 
 
+class DownloadWorker(Worker):
+    '''
+    worker downloading a zip-file from an url and extracting it to a folder
+
+    the file is streamed into a partial file next to the target folder, an
+    interrupted download is continued on the next run
+    '''
+    def __init__(self, url: str, path: str, checksum: str = None,
+                 parent: QObject = None):
+        '''
+        Parameters
+        ----------
+        url : str
+            url of zip-file to download
+        path : str
+            path to extract the content of the zip-file to, existing content
+            will be removed
+        checksum : str, optional
+            SHA-256 hex digest of the zip-file, the download is verified if
+            given, defaults to no verification
+        parent : QObject, optional
+            parent object of thread, defaults to no parent (global)
+        '''
+        super().__init__(parent=parent)
+        self.url = url
+        self.path = path
+        self.checksum = checksum
+        self.permission_error = False
+        fn = os.path.basename(url.rstrip('/'))
+        self.part_file = os.path.join(
+            os.path.dirname(os.path.abspath(path)), f'{fn}.part')
+
+    def work(self):
+        self.permission_error = False
+        self.log('Starte Download von')
+        self.log(self.url)
+        if os.path.exists(self.part_file):
+            size = os.path.getsize(self.part_file) / 1024 ** 2
+            self.log('Setze abgebrochenen Download fort '
+                     f'({size:.1f} MB bereits heruntergeladen)')
+        request = Request(synchronous=True)
+        # download takes the most time, extraction the rest
+        request.progress.connect(lambda p: self.set_progress(int(p * 0.8)))
+        request.download(self.url, self.part_file)
+
+        if self.checksum:
+            self.log('Überprüfe Prüfsumme...')
+            if file_hash(self.part_file) != self.checksum.lower():
+                os.remove(self.part_file)
+                raise Exception('Die Prüfsumme der heruntergeladenen Datei '
+                                'ist ungültig. Bitte starten Sie den Download '
+                                'erneut.')
+
+        self.log(f'-> {self.path}')
+        try:
+            if os.path.exists(self.path):
+                shutil.rmtree(self.path, ignore_errors=False, onerror=None)
+                sleep(1)
+            os.makedirs(self.path)
+        except PermissionError:
+            self.permission_error = True
+            raise PermissionError('Zugriffsfehler: Alte Daten konnten nicht '
+                                  'restlos entfernt werden.')
+        try:
+            with ZipFile(self.part_file) as zf:
+                members = zf.infolist()
+                for i, member in enumerate(members):
+                    zf.extract(member, self.path)
+                    if not member.is_dir():
+                        self.log(f'Entpackt: {member.filename}')
+                    self.set_progress(80 + int(20 * (i + 1) / len(members)))
+        except BadZipFile as e:
+            # corrupted download, start over next time
+            os.remove(self.part_file)
+            raise e
+        os.remove(self.part_file)
+
+
+class BasedataUpdateWorker(Worker):
+    '''
+    worker updating the base data to a new version by downloading only the
+    changed files, the unchanged files are taken over from the previous local
+    version (hard-linked if possible, copied otherwise)
+
+    files already downloaded completely into the target folder are kept on
+    the next run, interrupted downloads of single files are continued
+    '''
+    def __init__(self, url: str, path: str, download: dict, reuse: dict,
+                 parent: QObject = None):
+        '''
+        Parameters
+        ----------
+        url : str
+            url of the folder containing the files of the version on the server
+        path : str
+            path of the folder of the new version
+        download : dict
+            the files to download, relative file paths as keys and metadata
+            with the SHA-256 hash ("sha256") and the "size" as values
+        reuse : dict
+            the unchanged files, relative file paths as keys and the paths to
+            the files of the previous version as values
+        parent : QObject, optional
+            parent object of thread, defaults to no parent (global)
+        '''
+        super().__init__(parent=parent)
+        self.url = url.rstrip('/')
+        self.path = path
+        self.download = download
+        self.reuse = reuse
+        self.permission_error = False
+
+    def work(self):
+        self.permission_error = False
+        try:
+            self._take_over_files()
+        except PermissionError:
+            self.permission_error = True
+            raise PermissionError('Zugriffsfehler: Alte Daten konnten nicht '
+                                  'restlos entfernt werden.')
+        self._download_files()
+
+    def _take_over_files(self):
+        '''
+        link or copy the unchanged files into the new version folder
+        '''
+        self.log(f'Übernehme {len(self.reuse)} unveränderte Dateien...')
+        for fn, source in self.reuse.items():
+            target = os.path.join(self.path, fn)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            if os.path.exists(target):
+                os.remove(target)
+            try:
+                os.link(source, target)
+            # file system doesn't support hard links
+            except OSError:
+                shutil.copy2(source, target)
+
+    def _download_files(self):
+        '''
+        download the changed files and verify them
+        '''
+        total = sum(meta.get('size', 0) for meta in self.download.values())
+        done = 0
+        for i, (fn, meta) in enumerate(self.download.items()):
+            target = os.path.join(self.path, fn)
+            size = meta.get('size', 0)
+            if (os.path.exists(target) and
+                    file_hash(target) == meta['sha256'].lower()):
+                self.log(f'{fn} ist bereits aktuell')
+            else:
+                self.log(f'Lade {fn} herunter '
+                         f'({i + 1}/{len(self.download)})...')
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                part_file = f'{target}.part'
+                request = Request(synchronous=True)
+                if total:
+                    request.progress.connect(
+                        lambda p, done=done, size=size: self.set_progress(
+                            int(100 * (done + p / 100 * size) / total)))
+                request.download(f'{self.url}/{fn}', part_file)
+                if file_hash(part_file) != meta['sha256'].lower():
+                    os.remove(part_file)
+                    raise Exception(f'Die Prüfsumme von {fn} ist ungültig. '
+                                    'Bitte starten Sie den Download erneut.')
+                os.replace(part_file, target)
+            done += size
+            if total:
+                self.set_progress(int(100 * done / total))
+
+
 class DownloadDialog(ProgressDialog):
     '''
-    dialog for downloading a file from an url
+    dialog for downloading a zip-file from an url and extracting it, the
+    download and extraction run in a background thread
     '''
-    def __init__(self, url, path, **kwargs):
+    def __init__(self, url: str, path: str, checksum: str = None, **kwargs):
         '''
         Parameters
         ----------
         url : str
-            url of file to download
+            url of zip-file to download
         path : str
-            path to download file to
+            path to extract the downloaded file to
+        checksum : str, optional
+            SHA-256 hex digest to verify the downloaded file with, defaults to
+            no verification
         parent : QObject, optional
             parent ui element of the dialog, defaults to no parent
         auto_close : bool, optional
@@ -654,58 +843,14 @@ class DownloadDialog(ProgressDialog):
             function to call when closing the dialog, defaults to no callback on
             closing
         '''
-        super().__init__(None, **kwargs)
+        worker = DownloadWorker(url, path, checksum=checksum)
+        super().__init__(worker, **kwargs)
         self.url = url
         self.path = path
 
-    def run(self):
-        '''
-        start the download
-        '''
-        self.permission_error = False
-        self.status_code = 0
-        self.stop_button.setVisible(False)
-        self.start_button.setVisible(False)
-        self.close_button.setVisible(True)
-        self.close_button.setEnabled(False)
-
-        self.show_status('Starte Download von')
-        self.show_status(self.url)
-        self.start_timer()
-        try:
-            request = Request(synchronous=False)
-            request.progress.connect(self.progress)
-            request.finished.connect(self._save)
-            request.error.connect(self.on_error)
-            request.get(self.url)
-        except Exception as e:
-            self.on_error(str(e))
-
-    def _save(self, reply):
+    @property
+    def permission_error(self) -> bool:
         '''
-        save the reply of the server to the given path
+        True if the old data couldn't be removed
         '''
-        self.status_code = reply.status_code
-        if reply.status_code != 200:
-            self.on_error(reply.status_code)
-            return
-        self.show_status(f'-> {self.path}')
-        # ToDo: catch errors (file permission->message to restart)
-        try:
-            if os.path.exists(self.path):
-                shutil.rmtree(self.path, ignore_errors=False, onerror=None)
-                sleep(1)
-            os.makedirs(self.path)
-            with ZipFile(BytesIO(reply.raw_data)) as zf:
-                zf.extractall(self.path)
-            self._success()
-        except PermissionError as e:
-            self.permission_error = True
-            self.on_error('Zugriffsfehler: Alte Daten konnten nicht restlos '
-                          'entfernt werden.')
-        except BadZipFile as e:
-            self.on_error(str(e))
-
-
-
-
+        return self.worker.permission_error
@@ -25,12 +25,17 @@ from qgis.PyQt import QtWidgets, uic
 from qgis.PyQt.QtCore import pyqtSignal, Qt, QObject, QThread
 from qgis import utils
 from qgis.gui import QgisInterface, QgsMapCanvas
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import List, Union
 import os
+import importlib
 
 from .project import (ProjectManager, ProjectLayer,
                       Project, Settings)
 from .database import Database
 from projektcheck.settings import settings
+from projektcheck.utils.processes import run_parallel
+from projektcheck.utils.instrumentation import Run
 
 
 class PCDockWidget(QObject):
@@ -256,6 +261,86 @@ class Domain(PCDockWidget):
                     parent.setItemVisibilityChecked(False)
 
 
+class LazyDomain:
+    '''
+    placeholder of a domain holding the information needed to list it in the
+    ui, the module of the domain is imported and the domain is set up only when
+    it is accessed for the first time
+
+    Attributes
+    ----------
+    domain : Domain
+        the domain, None as long as it wasn't accessed
+    '''
+    def __init__(self, module: str, class_name: str, ui_label: str,
+                 ui_icon: str = '', layer_group: str = ''):
+        '''
+        Parameters
+        ----------
+        module : str
+            full import path of the module containing the domain class
+        class_name : str
+            name of the domain class
+        ui_label : str
+            label of the domain displayed in ui, should match the one of the
+            domain class
+        ui_icon : str, optional
+            path to the icon of the domain, should match the one of the domain
+            class
+        layer_group : str, optional
+            layer group of the domain, should match the one of the domain class
+        '''
+        self.module = module
+        self.class_name = class_name
+        self.ui_label = ui_label
+        self.ui_icon = ui_icon
+        self.layer_group = layer_group
+        self.domain = None
+
+    @property
+    def domain_class(self) -> type:
+        '''
+        the class of the domain, imports the module of the domain
+        '''
+        module = importlib.import_module(self.module)
+        return getattr(module, self.class_name)
+
+    def get(self) -> Domain:
+        '''
+        the domain, set up on first call
+
+        Returns
+        -------
+        Domain
+            the set up domain
+        '''
+        if not self.domain:
+            self.domain = self.domain_class()
+        return self.domain
+
+    def close(self):
+        '''
+        close the domain, if it was set up
+        '''
+        if self.domain:
+            self.domain.close()
+
+    def unload(self):
+        '''
+        unload the domain, if it was set up
+        '''
+        if self.domain:
+            self.domain.unload()
+            self.domain.deleteLater()
+            self.domain = None
+
+
+class WorkerCancelled(Exception):
+    '''
+    raised by a worker when it was cancelled
+    '''
+
+
 class Worker(QThread):
     '''
     abstract worker
@@ -270,6 +355,16 @@ class Worker(QThread):
         emitted when a message is send, message text
     progress : pyqtSignal
         emitted on progress, progress in percent
+    inputs : list
+        project tables (ProjectTable classes) and workspaces of the base data
+        (names) the worker reads from, used for scheduling in a Pipeline
+    outputs : list
+        project tables and workspaces of the base data the worker writes to,
+        used for scheduling in a Pipeline
+    run_statistics : Run
+        statistics of the current or last run (duration of the logged stages,
+        rows read and written, requests), saved in the folder of the project
+        of the worker after each run
     '''
 
     # available signals to be used in the concrete worker
@@ -278,6 +373,13 @@ class Worker(QThread):
     message = pyqtSignal(str)
     progress = pyqtSignal(float)
 
+    inputs = []
+    outputs = []
+    # the worker checks for cancellation by itself at points it can safely be
+    # stopped at, it has to be terminated otherwise
+    cancellable = False
+    run_statistics = None
+
     def __init__(self, parent: QObject = None):
         '''
         Parameters
@@ -287,6 +389,7 @@ class Worker(QThread):
         '''
         #parent = parent or utils.iface.mainWindow()
         super().__init__(parent=parent)
+        self._cancelled = False
 
     def run(self, on_success: object = None):
         '''
@@ -299,13 +402,44 @@ class Worker(QThread):
         on_success : function
             function to execute on success
         '''
+        self.start_statistics()
         try:
             result = self.work()
             self.finished.emit(result)
             if on_success:
                 on_success()
+        # the cancellation was requested by the caller, nothing to report
+        except WorkerCancelled:
+            pass
         except Exception as e:
             self.error.emit(str(e))
+        finally:
+            self.save_statistics()
+
+    def start_statistics(self):
+        '''
+        start the statistics of a new run (in the thread of the worker)
+        '''
+        self.run_statistics = Run(
+            type(self).__name__,
+            profile=getattr(settings, 'PROFILE_WORKERS', False))
+        self.run_statistics.start()
+
+    def save_statistics(self):
+        '''
+        stop the statistics of the current run and save them in the folder of
+        the project of the worker (if it has one)
+        '''
+        self.run_statistics.stop()
+        project = getattr(self, 'project', None)
+        path = getattr(project, 'path', None)
+        if not path or not os.path.isdir(path):
+            return
+        try:
+            self.run_statistics.save(path)
+        # the statistics are not worth failing for
+        except OSError:
+            pass
 
     def work(self) -> object:
         '''
@@ -319,6 +453,75 @@ class Worker(QThread):
         '''
         raise NotImplementedError
 
+    def cancel(self):
+        '''
+        request the cancellation of the work, a cancellable worker stops at
+        its next check (see check_cancelled)
+        '''
+        self._cancelled = True
+
+    def check_cancelled(self):
+        '''
+        stop the work if the cancellation was requested, call this at points
+        the work can be stopped at without losing results (e.g. between the
+        steps of a loop with the results of each step stored)
+
+        Raises
+        ------
+        WorkerCancelled
+            the cancellation was requested
+        '''
+        if self._cancelled:
+            raise WorkerCancelled('Vorgang abgebrochen')
+
+    def up_to_date(self) -> bool:
+        '''
+        override
+        check if the results of a previous run are still valid, a Pipeline
+        skips the worker then
+
+        Returns
+        -------
+        bool
+            True if the results are up to date, defaults to False
+        '''
+        return False
+
+    def run_in_processes(self, calls: List[tuple], progress_start: int = 0,
+                         progress_end: int = 100) -> list:
+        '''
+        run CPU-bound functions in parallel in separate processes and wait for
+        their results, the functions and their arguments have to be picklable
+        (see utils.processes). The messages reported by the functions are
+        logged, their progress is mapped to the progress of the worker
+
+        Parameters
+        ----------
+        calls : list
+            tuples of function and arguments
+        progress_start : int, optional
+            progress of the worker when starting the functions, defaults to 0
+        progress_end : int, optional
+            progress of the worker when all functions are done, defaults to 100
+
+        Returns
+        -------
+        list
+            the results of the functions in the order of the calls
+        '''
+        progress = [0] * len(calls)
+
+        def on_report(i, message, p):
+            if message:
+                self.log(message)
+            if p is not None:
+                progress[i] = p
+                self.set_progress(int(
+                    progress_start + (progress_end - progress_start) *
+                    sum(progress) / (100 * len(calls))))
+
+        return run_parallel(calls, callback=on_report)
+
     def log(self, message):
         '''
         emits message
@@ -327,6 +530,9 @@ class Worker(QThread):
         ----------
         message : str
         '''
+        # the logged messages mark the stages of the work
+        if self.run_statistics is not None:
+            self.run_statistics.stage(str(message))
         self.message.emit(str(message))
 
     def set_progress(self, progress: int):
@@ -341,3 +547,173 @@ class Worker(QThread):
         self.progress.emit(progress)
 
 
+class Pipeline(Worker):
+    '''
+    worker running a graph of workers in a shared thread pool
+
+    a worker depends on the workers before it in the list writing its inputs
+    or reading or writing its outputs, it is started when all of them are
+    done. Independent workers run at the same time unless they access the
+    same workspace (the connection to a GeoPackage can't be used by multiple
+    threads at once). Workers without declared inputs and outputs are run
+    exclusively and in order. Workers with up-to-date results are skipped
+    '''
+    cancellable = True
+
+    def __init__(self, workers: List[Worker], max_workers: int = None,
+                 parent: QObject = None):
+        '''
+        Parameters
+        ----------
+        workers : list
+            the workers to run, in the order they would run one after another
+        max_workers : int, optional
+            maximum number of workers running at the same time, defaults to
+            the number of processors
+        parent : QObject, optional
+            parent object of thread, defaults to no parent (global)
+        '''
+        super().__init__(parent=parent)
+        self.workers = workers
+        self.max_workers = max_workers or os.cpu_count()
+        self.dependencies = [
+            set(j for j in range(i) if self._depends(worker, workers[j]))
+            for i, worker in enumerate(workers)
+        ]
+        self._progress = [0] * len(workers)
+        self._error = None
+
+    @staticmethod
+    def _depends(worker: Worker, other: Worker) -> bool:
+        '''
+        check if the worker has to wait for the other (preceding) worker
+        '''
+        if (not (worker.inputs or worker.outputs) or
+                not (other.inputs or other.outputs)):
+            return True
+        inputs, outputs = set(worker.inputs), set(worker.outputs)
+        return bool(inputs & set(other.outputs) or
+                    outputs & set(other.inputs) or
+                    outputs & set(other.outputs))
+
+    @staticmethod
+    def _workspaces(worker: Worker) -> set:
+        '''
+        workspaces accessed by the worker
+        '''
+        workspaces = set()
+        for table in list(worker.inputs) + list(worker.outputs):
+            if isinstance(table, str):
+                workspaces.add(('basedata', table))
+            else:
+                workspaces.add(
+                    ('project', getattr(table.Meta, 'workspace', 'default')))
+        return workspaces
+
+    def _ready(self, i: int, done: set, running: List[int]) -> bool:
+        '''
+        check if the worker at given index can be started
+        '''
+        if not self.dependencies[i] <= done:
+            return False
+        if not running:
+            return True
+        workspaces = self._workspaces(self.workers[i])
+        if not workspaces:
+            return False
+        for j in running:
+            other = self._workspaces(self.workers[j])
+            if not other or workspaces & other:
+                return False
+        return True
+
+    def work(self):
+        n = len(self.workers)
+        results = [None] * n
+        pending = list(range(n))
+        running = {}
+        done = set()
+        for i, worker in enumerate(self.workers):
+            # the workers run in the threads of the pool, their signals are
+            # passed on directly (their stages are part of their own
+            # statistics)
+            worker.message.connect(self.message, Qt.DirectConnection)
+            worker.progress.connect(
+                lambda progress, i=i: self._set_worker_progress(i, progress),
+                Qt.DirectConnection)
+            worker.error.connect(self._on_worker_error, Qt.DirectConnection)
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while pending or running:
+                if not self._cancelled:
+                    for i in list(pending):
+                        if self._ready(i, done, list(running.values())):
+                            future = executor.submit(self._run_worker, i)
+                            running[future] = i
+                            pending.remove(i)
+                if not running:
+                    break
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    i = running.pop(future)
+                    try:
+                        results[i] = future.result()
+                    except WorkerCancelled:
+                        self._cancelled = True
+                    except Exception as e:
+                        self._on_worker_error(e)
+                    done.add(i)
+
+        # the exception of the worker is passed on with its traceback
+        if isinstance(self._error, Exception):
+            raise self._error
+        if self._error:
+            raise Exception(self._error)
+        self.check_cancelled()
+        self.set_progress(100)
+        return results
+
+    def _run_worker(self, i: int) -> object:
+        '''
+        run the worker at given index (in the current thread), the statistics
+        of the run are saved in the project of the worker
+        '''
+        worker = self.workers[i]
+        worker.start_statistics()
+        try:
+            if worker.up_to_date():
+                worker.log(f'{type(worker).__name__}: die Ergebnisse sind '
+                           'aktuell, die Berechnung wird übersprungen.')
+                result = None
+            else:
+                result = worker.work()
+        finally:
+            worker.save_statistics()
+        self._set_worker_progress(i, 100)
+        return result
+
+    def _set_worker_progress(self, i: int, progress: float):
+        '''
+        set progress of single worker and emit the overall progress
+        '''
+        self._progress[i] = progress
+        self.set_progress(int(sum(self._progress) / len(self._progress)))
+
+    def _on_worker_error(self, error: Union[str, Exception]):
+        '''
+        remember first error of a worker (the emitted message or the raised
+        exception), the pipeline is cancelled then
+        '''
+        if not self._error:
+            self._error = error
+        self.cancel()
+
+    def cancel(self):
+        '''
+        cancel the pipeline, no more workers are started, the running ones are
+        cancelled if they are cancellable and finished otherwise
+        '''
+        super().cancel()
+        for worker in self.workers:
+            if worker.cancellable:
+                worker.cancel()
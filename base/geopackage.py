@@ -27,10 +27,12 @@ from qgis.core import QgsGeometry
 import pandas as pd
 from typing import Union, List
 from collections import OrderedDict
+from contextlib import contextmanager
 import numpy as np
 import datetime
 
 from .database import Database, Table, Workspace, Field
+from projektcheck.utils.instrumentation import count_read, count_written
 
 driver = ogr.GetDriverByName('GPKG')
 
@@ -75,6 +77,7 @@ class GeopackageWorkspace(Workspace):
         if not os.path.exists(self.path):
             raise FileNotFoundError(f'{self.path} does not exist')
         self._conn = None
+        self._transaction_depth = 0
 
     @property
     def conn(self) -> ogr.DataSource:
@@ -84,6 +87,37 @@ class GeopackageWorkspace(Workspace):
                 self.path, 0 if self.database.read_only else 1)
         return self._conn
 
+    @contextmanager
+    def transaction(self):
+        '''
+        context manager bundling all changes made to the tables of this
+        workspace inside of it into a single transaction, the changes are
+        rolled back if an error occurs. Nested calls join the outermost
+        transaction
+
+        e.g.
+        with workspace.transaction():
+            for row in rows:
+                table.add(**row)
+        '''
+        if self._transaction_depth == 0:
+            self.conn.StartTransaction()
+        self._transaction_depth += 1
+        failed = False
+        try:
+            yield
+        # also roll back on interruptions (e.g. KeyboardInterrupt)
+        except BaseException:
+            failed = True
+            raise
+        finally:
+            self._transaction_depth -= 1
+            if self._transaction_depth == 0:
+                if failed:
+                    self.conn.RollbackTransaction()
+                else:
+                    self.conn.CommitTransaction()
+
     @staticmethod
     def _fn(database: Database, name: str) -> str:
         '''
@@ -243,6 +277,7 @@ class GeopackageWorkspace(Workspace):
         # self._conn.Destroy()
         del(self._conn)
         self._conn = None
+        self._transaction_depth = 0
         super().close()
 
 
@@ -278,6 +313,8 @@ class GeopackageTable(Table):
         '''
         self.workspace = workspace
         self.name = name
+        # name the rows read and written are counted by
+        self._stats_name = f'{workspace.name}.{name}'
         self._where = ''
         self._layer = self.workspace.conn.GetLayerByName(self.name)
         if self._layer is None:
@@ -334,6 +371,7 @@ class GeopackageTable(Table):
         if not cursor:
             self.reset_cursor()
             raise StopIteration
+        count_read(self._stats_name)
         return self._ogr_feat_to_row(cursor)
 
     def __getitem__(self, idx):
@@ -581,6 +619,7 @@ class GeopackageTable(Table):
         if ret != 0:
             raise Exception(f'Feature could not be created in table {self.name}. '
                             f'Ogr declined creation with error code {ret}')
+        count_written(self._stats_name)
         return self._ogr_feat_to_row(feature)
 
     def add_field(self, field: Field):
@@ -626,6 +665,7 @@ class GeopackageTable(Table):
             id (as given by ogr) of feature to delete
         '''
         self._layer.DeleteFeature(id)
+        count_written(self._stats_name)
 
     def truncate(self):
         '''
@@ -674,6 +714,7 @@ class GeopackageTable(Table):
                 value = float(value)
             feature.SetField(field_name, value)
         self._layer.SetFeature(feature)
+        count_written(self._stats_name)
         return True
 
     def get(self, id: int) -> dict:
@@ -687,6 +728,7 @@ class GeopackageTable(Table):
         '''
 
         feat = self._layer.GetFeature(id)
+        count_read(self._stats_name)
         return self._ogr_feat_to_row(feat)
 
     def delete_rows(self, **kwargs) -> int:
@@ -711,6 +753,7 @@ class GeopackageTable(Table):
         for feature in self._layer:
             self._layer.DeleteFeature(feature.GetFID())
             i += 1
+        count_written(self._stats_name, i)
         self.where = prev_where
         return i
 
@@ -735,6 +778,7 @@ class GeopackageTable(Table):
                 continue
             self._cursor.SetField(field_name, value)
         self._layer.SetFeature(self._cursor)
+        count_written(self._stats_name)
 
     def to_pandas(self, columns: List[str] = []) -> pd.DataFrame:
         '''
@@ -759,13 +803,25 @@ class GeopackageTable(Table):
         df = pd.DataFrame.from_records(rows, columns=columns)
         return df
 
+    def transaction(self):
+        '''
+        context manager bundling all changes made inside of it into a single
+        transaction (of the workspace of this table)
+
+        e.g.
+        with table.transaction():
+            for row in rows:
+                table.add(**row)
+        '''
+        return self.workspace.transaction()
+
     def update_pandas(self, dataframe: pd.DataFrame, pkeys: List[str] = None):
         '''
         updates table with data in given dataframe. columns of dataframe
         should match the field names, otherwise they will be ignored.
         Rows matching existing rows in the database (identified by the passed
         pkeys or the column named like the database id field by default)
-        will be updated
+        will be updated. All rows are written in a single transaction
 
         Parameters
         ----------
@@ -774,6 +830,13 @@ class GeopackageTable(Table):
         pkeys : list, optional
             list of strings with column names used as primary keys
         '''
+        with self.transaction():
+            self._update_pandas(dataframe, pkeys=pkeys)
+
+    def _update_pandas(self, dataframe: pd.DataFrame, pkeys: List[str] = None):
+        '''
+        write rows of dataframe to table (without transaction handling)
+        '''
         def isnan(v):
             if isinstance(v, (np.integer, np.floating, float)):
                 return np.isnan(v)
@@ -337,10 +337,19 @@ class ProjectManager(metaclass=Singleton):
             return 0, 'Es wurden keine lokalen Basisdaten gefunden'
         newest_local_v = local_versions[0]
         if newest_server_v['version'] > newest_local_v['version']:
-            return 1, (f'Neue Basisdaten (v{newest_server_v["version"]} '
-                       f'{newest_server_v["date"]}) '
-                       f'sind verfügbar (lokal: v{newest_local_v["version"]} '
-                       f'{newest_local_v["date"]})')
+            msg = (f'Neue Basisdaten (v{newest_server_v["version"]} '
+                   f'{newest_server_v["date"]}) '
+                   f'sind verfügbar (lokal: v{newest_local_v["version"]} '
+                   f'{newest_local_v["date"]})')
+            delta = self.basedata_delta(
+                newest_server_v, path or self.settings.basedata_path)
+            if delta:
+                download, reuse = delta
+                size = sum(f.get('size', 0) for f in download.values())
+                msg += (f'\nAktualisiert werden {len(download)} von '
+                        f'{len(download) + len(reuse)} Dateien '
+                        f'({size / 1024 ** 2:.0f} MB)')
+            return 1, msg
         return 2, ('Die Basisdaten sind auf dem neuesten Stand '
                    f'(v{newest_local_v["version"]} {newest_local_v["date"]})')
 
@@ -366,6 +375,59 @@ class ProjectManager(metaclass=Singleton):
         with open(fp, 'w') as f:
             json.dump(version_meta, f, indent=4, separators=(',', ': '))
 
+    def basedata_delta(self, version_meta: dict, path: str = None
+                       ) -> Tuple[dict, dict]:
+        '''
+        compare the files of a base data version on the server with the files
+        of the newest other local version to update only the changed files
+
+        a delta update is only possible if the metadata of both versions
+        contain a manifest of the files ("files" with the file paths relative
+        to the version folder as keys and dictionaries with the SHA-256 hash
+        "sha256" and the "size" in bytes as values) and the server version
+        provides a folder with the single files ("files_url", relative to the
+        base data url)
+
+        Parameters
+        ----------
+        version_meta : dict
+            metadata of the version as supplied by the server
+        path : str, optional
+            base data path with the local versions, defaults to the currently
+            set path
+
+        Returns
+        ----------
+        (dict, dict)
+            the files to download (relative file paths as keys and the
+            metadata of the files as values) and the unchanged files
+            (relative file paths as keys and the paths to the files in the
+            local version as values), None if no delta update is possible
+        '''
+        files = version_meta.get('files')
+        if not files or not version_meta.get('files_url'):
+            return None
+        local_versions = [
+            v for v in self.local_versions(
+                path or self.settings.basedata_path) or []
+            if v.get('files') and v['version'] != version_meta['version']]
+        if not local_versions:
+            return None
+        local_version = local_versions[0]
+        download = {}
+        reuse = {}
+        for fn, meta in files.items():
+            local_meta = local_version['files'].get(fn)
+            local_fp = os.path.join(local_version['path'], fn)
+            if (local_meta and local_meta['sha256'] == meta['sha256'] and
+                    os.path.exists(local_fp) and
+                    os.path.getsize(local_fp) == local_meta.get(
+                        'size', os.path.getsize(local_fp))):
+                reuse[fn] = local_fp
+            else:
+                download[fn] = meta
+        return download, reuse
+
     def local_versions(self, path: str) -> List[dict]:
         '''
         get metadata of all local base data versions
@@ -160,19 +160,13 @@ class WohnenDevelopment(Worker):
         duration = self.area.aufsiedlungsdauer
         end = begin + self.BETRACHTUNGSZEITRAUM_JAHRE - 1
 
-        df_einwohner_base = self.einwohner_base.to_pandas()
+        df_einwohner_base = self.einwohner_base.to_pandas(
+            columns=['IDGebaeudetyp', 'AlterWE', 'IDAltersklasse',
+                     'Altersklasse', 'Einwohner'])
+        df_gebaeudetypen = self.gebaeudetypen_base.to_pandas()
         df_wohneinheiten_tfl = self.wohneinheiten.filter(
             id_teilflaeche=self.area.id).to_pandas()
 
-        wohnen_struktur_tfl = self.wohnen_struktur.filter(
-            id_teilflaeche=self.area.id)
-        wohnen_struktur_tfl.delete()
-        wohnen_pro_jahr_tfl = self.wohnen_pro_jahr.filter(
-            id_teilflaeche=self.area.id)
-        wohnen_pro_jahr_tfl.delete()
-
-        df_wohnen_struktur = wohnen_struktur_tfl.to_pandas()
-
         flaechen_template = pd.DataFrame()
         geb_types = df_wohneinheiten_tfl['id_gebaeudetyp'].values
         flaechen_template['id_gebaeudetyp'] = geb_types
@@ -182,55 +176,51 @@ class WohnenDevelopment(Worker):
                 df_wohneinheiten_tfl['we'].values.astype(float) *
                 df_wohneinheiten_tfl['ew_je_we'] /
                 duration)
-        for j in range(begin, end + 1):
-            for i in range(1, duration + 1):
-                if j - begin + i - duration + 1 > 0:
-                    df = flaechen_template.copy()
-                    df['jahr'] = j
-                    df['alter_we'] = j - begin + i - duration + 1
-                    df_wohnen_struktur = df_wohnen_struktur.append(df)
 
-        self.wohnen_struktur.update_pandas(df_wohnen_struktur)
+        # cross join of the years with the ages of the housing units built
+        # in the years of the occupancy duration up to that year
+        jahr, i = np.meshgrid(np.arange(begin, end + 1),
+                              np.arange(1, duration + 1), indexing='ij')
+        alter_we = jahr - begin + i - duration + 1
+        valid = alter_we > 0
+        jahr, alter_we = jahr[valid], alter_we[valid]
+        n_types = len(flaechen_template)
+        df_wohnen_struktur = flaechen_template.iloc[
+            np.tile(np.arange(n_types), len(jahr))].reset_index(drop=True)
+        df_wohnen_struktur['jahr'] = np.repeat(jahr, n_types)
+        df_wohnen_struktur['alter_we'] = np.repeat(alter_we, n_types)
 
         # Apply weight factor based on user-defined proportion of persons < 18
-        for bt in self.gebaeudetypen_base:
-            bt_idx = df_einwohner_base['IDGebaeudetyp'] == bt.IDGebaeudetyp
-            df_einwohner_bt = df_einwohner_base[bt_idx]
-            base_factor_u18 = float(bt.default_anteil_u18)
-            user_bt_settings = df_wohneinheiten_tfl[
-                    df_wohneinheiten_tfl['id_gebaeudetyp'] == bt.IDGebaeudetyp]
-            user_factor_u18 = user_bt_settings['anteil_u18'].values[0]
-            weight_u18 = user_factor_u18 / base_factor_u18
-            for age_we, group in df_einwohner_bt.groupby('AlterWE'):
-                # just one value, but easier to write the sum
-                u18 = group[group['IDAltersklasse'] == 1]['Einwohner'].sum()
-                # weight over 18 as relation of number of inhabitants of age
-                # groups under 18 and over 18 in specific year of housing
-                sum_o18 = group[group['IDAltersklasse'] > 1]['Einwohner'].sum()
-                weight_o18 = (u18 * (1 - weight_u18) + sum_o18) / sum_o18
-                # apply correction factor to age groups over 18 for year of
-                # housing
-                df_einwohner_base.loc[
-                    (df_einwohner_base['IDAltersklasse'] > 1) & bt_idx &
-                    (df_einwohner_base['AlterWE'] == age_we), ["Einwohner"]
-                    ] *= weight_o18
-            # apply correction factor of age group under 18, stays the same
-            # for every year of housing
-            df_einwohner_base.loc[
-                (df_einwohner_base['IDAltersklasse'] == 1) & bt_idx,
-                ["Einwohner"]] *= weight_u18
+        default_u18 = df_gebaeudetypen.set_index(
+            'IDGebaeudetyp')['default_anteil_u18'].astype(float)
+        user_u18 = df_wohneinheiten_tfl.groupby(
+            'id_gebaeudetyp')['anteil_u18'].first()
+        weight_u18 = (user_u18 / default_u18).reindex(
+            df_einwohner_base['IDGebaeudetyp'].values).fillna(1).values
+        einwohner = df_einwohner_base['Einwohner'].values.astype(float)
+        is_u18 = df_einwohner_base['IDAltersklasse'].values == 1
+        is_o18 = df_einwohner_base['IDAltersklasse'].values > 1
+        df_einwohner_base['u18'] = np.where(is_u18, einwohner, 0)
+        df_einwohner_base['o18'] = np.where(is_o18, einwohner, 0)
+        # weight over 18 as relation of number of inhabitants of age
+        # groups under 18 and over 18 in specific year of housing
+        sums = df_einwohner_base.groupby(
+            ['IDGebaeudetyp', 'AlterWE'])[['u18', 'o18']].transform('sum')
+        weight_o18 = ((sums['u18'].values * (1 - weight_u18) +
+                       sums['o18'].values) / sums['o18'].values)
+        # correction factor of age group under 18 stays the same for every
+        # year of housing
+        df_einwohner_base['Einwohner'] = einwohner * np.where(
+            is_u18, weight_u18, np.where(is_o18, weight_o18, 1))
 
         # prepare the base table, take duration as age reference for development
         # over years
-        df_einwohner_base['reference'] = 1
-        for geb_typ, group in df_einwohner_base.groupby('IDGebaeudetyp'):
-            reference = group[group['AlterWE'] == 3]['Einwohner'].sum()
-            df_einwohner_base.loc[df_einwohner_base['IDGebaeudetyp'] == geb_typ,
-                                  'reference'] = reference
+        df_einwohner_base['reference'] = df_einwohner_base['Einwohner'].where(
+            df_einwohner_base['AlterWE'] == 3, 0).groupby(
+                df_einwohner_base['IDGebaeudetyp']).transform('sum')
 
         # fun with great column names in base data
-        df_einwohner_base.rename(columns={'Jahr': 'jahr',
-                                          'IDGebaeudetyp': 'id_gebaeudetyp',
+        df_einwohner_base.rename(columns={'IDGebaeudetyp': 'id_gebaeudetyp',
                                           'AlterWE': 'alter_we',
                                           'Altersklasse': 'altersklasse',
                                           'IDAltersklasse': 'id_altersklasse',},
@@ -238,25 +228,23 @@ class WohnenDevelopment(Worker):
 
         joined = df_wohnen_struktur.merge(df_einwohner_base, how='left',
                                           on=['id_gebaeudetyp', 'alter_we'])
-        grouped = joined.groupby(['jahr', 'id_altersklasse'])
-        # make an appendable copy of the (empty) bewohner dataframe
-        df_wohnen_pro_jahr = wohnen_pro_jahr_tfl.to_pandas()
-        group_template = df_wohnen_pro_jahr.copy()
-
-        for idx, group in grouped:
-            entry = group_template.copy()
-            # corresponding SQL:  Sum([Einwohner]*[Wohnungen])
-            n_bewohner = (group['wohnungen'] * group['Einwohner']
-                          / group['reference']).sum()
-            entry['bewohner'] = [n_bewohner]
-            entry['id_altersklasse'] = group['id_altersklasse'].unique()
-            entry['altersklasse'] = group['altersklasse'].unique()
-            entry['jahr'] = group['jahr'].unique()
-            entry['id_teilflaeche'] = self.area.id
-            entry['name_teilflaeche'] = self.area.name
-            df_wohnen_pro_jahr = df_wohnen_pro_jahr.append(entry)
+        # corresponding SQL:  Sum([Einwohner]*[Wohnungen])
+        joined['bewohner'] = (joined['wohnungen'] * joined['Einwohner'] /
+                              joined['reference'])
+        df_wohnen_pro_jahr = joined.groupby(
+            ['jahr', 'id_altersklasse', 'altersklasse'],
+            as_index=False)['bewohner'].sum()
+        df_wohnen_pro_jahr['id_altersklasse'] = \
+            df_wohnen_pro_jahr['id_altersklasse'].astype(int)
+        df_wohnen_pro_jahr['id_teilflaeche'] = self.area.id
+        df_wohnen_pro_jahr['name_teilflaeche'] = self.area.name
         df_wohnen_pro_jahr = df_wohnen_pro_jahr.round({'bewohner': 1})
-        self.wohnen_pro_jahr.update_pandas(df_wohnen_pro_jahr)
+
+        with self.wohnen_struktur.table.transaction():
+            self.wohnen_struktur.filter(id_teilflaeche=self.area.id).delete()
+            self.wohnen_pro_jahr.filter(id_teilflaeche=self.area.id).delete()
+            self.wohnen_struktur.update_pandas(df_wohnen_struktur)
+            self.wohnen_pro_jahr.update_pandas(df_wohnen_pro_jahr)
 
 
     def set_ways(self):
@@ -27,7 +27,10 @@ from qgis.core import (QgsCoordinateReferenceSystem, QgsPointXY,
                        QgsProcessingException)
 from datetime import datetime
 import numpy as np
+import pandas as pd
+from scipy.spatial.distance import pdist
 import shutil
+import os
 import processing
 
 from projektcheck.base.project import ProjectManager
@@ -35,7 +38,7 @@ from projektcheck.base.domain import Worker
 from projektcheck.domains.traffic.tables import Connectors
 from projektcheck.domains.marketcompetition.tables import Centers
 from projektcheck.domains.constants import Nutzungsart
-from projektcheck.utils.utils import get_ags
+from projektcheck.utils.utils import get_ags, reflink, copy_sqlite
 from projektcheck.settings import settings
 from .tables import Teilflaechen, Projektrahmendaten
 
@@ -124,13 +127,8 @@ class ProjectInitialization(Worker):
 
         self.log(f'Überprüfe die Flächenlage...')
         if max_dist is not None and len(layer_features) > 1:
-            distances = []
-            for i in range(len(layer_features)):
-                for j in range(i):
-                    dist = np.linalg.norm(
-                        np.subtract((xs[i], ys[i]), (xs[j], ys[j])))
-                    distances.append(dist)
-            if distances and max(distances) > max_dist:
+            distances = pdist(np.column_stack([xs, ys]))
+            if distances.max() > max_dist:
                 raise Exception("Der Abstand zwischen den Schwerpunkten der "
                                 "Teilflächen darf nicht größer "
                                 "als {} m sein!".format(max_dist))
@@ -142,23 +140,25 @@ class ProjectInitialization(Worker):
         self.log(f'Berechne Projektrahmendaten...')
         # create areas and connections to roads
         now = datetime.now()
-        for i, feature in enumerate(layer_features):
-            area = self.project_areas.add(
-                nutzungsart=Nutzungsart.UNDEFINIERT.value,
-                name=f'Flaeche_{i+1}',
-                validiert=0,
-                aufsiedlungsdauer=1,
-                beginn_nutzung=now.year,
-                ags_bkg=ags[i],
-                gemeinde_name=gem_names[i],
-                gemeinde_typ=gem_types[i],
-                geom=trans_geoms[i]
-            )
-            traffic_connectors.add(
-                id_teilflaeche=area.id,
-                name_teilflaeche=area.name,
-                geom=centroids[i]
-            )
+        with self.project_areas.table.transaction(), \
+             traffic_connectors.table.transaction():
+            for i, feature in enumerate(layer_features):
+                area = self.project_areas.add(
+                    nutzungsart=Nutzungsart.UNDEFINIERT.value,
+                    name=f'Flaeche_{i+1}',
+                    validiert=0,
+                    aufsiedlungsdauer=1,
+                    beginn_nutzung=now.year,
+                    ags_bkg=ags[i],
+                    gemeinde_name=gem_names[i],
+                    gemeinde_typ=gem_types[i],
+                    geom=trans_geoms[i]
+                )
+                traffic_connectors.add(
+                    id_teilflaeche=area.id,
+                    name_teilflaeche=area.name,
+                    geom=centroids[i]
+                )
         self.set_progress(50)
 
         # general project data
@@ -191,40 +191,39 @@ class ProjectInitialization(Worker):
         buffer = QgsGeometry.fromPointXY(
             QgsPointXY(*project_centroid)).buffer(sk_radius, 20)
         vg_table.spatial_filter(buffer.asWkt())
-        centers = Centers.features(project=self.project, create=True)
-        rs_list = []
-        for row in vg_table:
-            centers.add(
-                name=row['GEN'],
-                rs=row['RS'],
-                geom=row['geom'],
-                # -1 indicates that it is a vg for selection and output only
-                nutzerdefiniert=-1
-            )
-            rs_list.append(row['RS'])
-
-        project_rs = None
-        gem_table = workspace.get_table('bkg_gemeinden')
-        for row in gem_table:
-            cut_rs = row['RS'][:9]
-            ags = row['AGS']
-            if cut_rs in rs_list:
-                if ags == project_ags:
-                    project_rs = cut_rs
-                centers.add(
-                    name=row['GEN'],
-                    rs=cut_rs,
-                    ags=ags,
-                    geom=row['geom'],
-                    # 0 indicates gemeinden, for calculations only
-                    nutzerdefiniert=0
-                )
-
+        # -1 indicates that it is a vg for selection and output only
+        df_vg = vg_table.to_pandas(columns=['GEN', 'RS', 'geom'])
+        df_vg['nutzerdefiniert'] = -1
+
+        # only the communities belonging to the vgs are read, they are all
+        # within the bounding box of the vgs (spatial index) and their RS
+        # starts with the RS of the vg
+        df_gem = pd.DataFrame(columns=['GEN', 'RS', 'AGS', 'geom'])
+        if len(df_vg) > 0:
+            gem_table = workspace.get_table('bkg_gemeinden')
+            bbox = QgsGeometry.collectGeometry(
+                list(df_vg['geom'])).boundingBox()
+            gem_table.spatial_filter(QgsGeometry.fromRect(bbox).asWkt())
+            rs_list = ','.join(f"'{rs}'" for rs in df_vg['RS'])
+            gem_table.where = f'substr("RS", 1, 9) in ({rs_list})'
+            df_gem = gem_table.to_pandas(columns=['GEN', 'RS', 'AGS', 'geom'])
+            df_gem['RS'] = df_gem['RS'].str[:9]
+        # 0 indicates gemeinden, for calculations only
+        df_gem['nutzerdefiniert'] = 0
+
+        df_centers = pd.concat([df_vg, df_gem], ignore_index=True)
+        df_centers = df_centers.rename(
+            columns={'GEN': 'name', 'RS': 'rs', 'AGS': 'ags'})
+        df_centers['ags'] = df_centers['ags'].fillna('')
         # preselect the VG the project is in
-        if project_rs:
-            project_vg = centers.get(rs=project_rs, nutzerdefiniert=-1)
-            project_vg.auswahl = -1
-            project_vg.save()
+        project_rs = df_gem.loc[df_gem['AGS'] == project_ags, 'RS']
+        df_centers['auswahl'] = 0
+        if len(project_rs) > 0:
+            df_centers.loc[(df_centers['rs'] == project_rs.iloc[0]) &
+                           (df_centers['nutzerdefiniert'] == -1),
+                           'auswahl'] = -1
+        centers = Centers.features(project=self.project, create=True)
+        centers.update_pandas(df_centers)
 
         self.set_progress(100)
 
@@ -234,7 +233,15 @@ class ProjectInitialization(Worker):
 class CloneProject(Worker):
     '''
     worker for cloning a project
+
+    the files are cloned copy-on-write if the file system supports it (no data
+    is copied until either of the projects changes), otherwise GeoPackages are
+    copied with the backup API of SQLite and all other files are copied
+    regularly
     '''
+    # temporary files of SQLite, their content is part of the backup
+    sqlite_suffixes = ('-wal', '-shm', '-journal')
+
     def __init__(self, project_name, project, parent=None):
         super().__init__(parent=parent)
         self.project_name = project_name
@@ -247,13 +254,53 @@ class CloneProject(Worker):
             self.project_name, create_folder=False)
         self.log('Kopiere Projektordner...')
 
-        # copy template folder
         try:
-            shutil.copytree(self.origin_project.path, cloned_project.path)
+            self.clone_folder(self.origin_project.path, cloned_project.path)
         except Exception as e:
             self.error.emit(str(e))
             self.project_manager.remove_project(self.project_name)
             return
         self.log('Neues Projekt erfolgreich angelegt '
                  f'unter {cloned_project.path}')
-        return cloned_project
\ No newline at end of file
+        return cloned_project
+
+    def clone_folder(self, source, target):
+        '''
+        clone all files in the source folder into the target folder
+        '''
+        files = []
+        for root, dirs, filenames in os.walk(source):
+            for fn in filenames:
+                if fn.endswith(self.sqlite_suffixes):
+                    continue
+                files.append(os.path.relpath(os.path.join(root, fn), source))
+        sizes = [os.path.getsize(os.path.join(source, fn)) for fn in files]
+        total = sum(sizes) or 1
+        done = 0
+        n_cloned = 0
+        os.makedirs(target)
+        for fn, size in zip(files, sizes):
+            src = os.path.join(source, fn)
+            dst = os.path.join(target, fn)
+            os.makedirs(os.path.dirname(dst), exist_ok=True)
+            is_gpkg = fn.endswith('.gpkg')
+            # changes in the write-ahead log are not in the database file yet,
+            # only a backup gets them
+            pending = is_gpkg and os.path.exists(f'{src}-wal') and \
+                os.path.getsize(f'{src}-wal') > 0
+            if not pending and reflink(src, dst):
+                n_cloned += 1
+            elif is_gpkg:
+                self.log(f'Kopiere {fn}...')
+                copy_sqlite(
+                    src, dst,
+                    progress=lambda copied, pages, done=done, size=size:
+                        self.set_progress(
+                            int(100 * (done + size * copied / pages) / total)))
+            else:
+                shutil.copy2(src, dst)
+            done += size
+            self.set_progress(int(100 * done / total))
+        if n_cloned:
+            self.log(f'{n_cloned} von {len(files)} Dateien wurden geklont, '
+                     'ohne die Daten zu kopieren')
\ No newline at end of file
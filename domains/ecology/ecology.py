@@ -27,8 +27,9 @@ from qgis.PyQt.QtCore import Qt
 from qgis.PyQt.QtWidgets import (QMessageBox, QVBoxLayout,
                                  QTableWidget, QTableWidgetItem,
                                  QAbstractScrollArea, QPushButton)
-from qgis.core import QgsWkbTypes
+from qgis.core import QgsWkbTypes, QgsGeometry
 import os
+import pandas as pd
 
 from projektcheck.base.domain import Domain
 from projektcheck.base.layers import TileLayer
@@ -50,15 +51,14 @@ from projektcheck.settings import settings
 def remove_junk(geom):
     #if geom.wkbType() != QgsWkbTypes.GeometryCollection:
         #return geom
-    mp = None
-    for el in geom.asGeometryCollection():
-        if el.wkbType() == QgsWkbTypes.LineString or el.area() < 1:
-            continue
-        if not mp:
-            mp = el
-        else:
-            mp = mp.combine(el)
-    return mp
+    parts = [el for el in geom.asGeometryCollection()
+             if el.wkbType() != QgsWkbTypes.LineString and el.area() >= 1]
+    if not parts:
+        return None
+    if len(parts) == 1:
+        return parts[0]
+    # unite all parts at once instead of combining them one by one
+    return QgsGeometry.unaryUnion(parts)
 
 
 class Ecology(Domain):
@@ -194,6 +194,13 @@ class Ecology(Domain):
         self.boden_nullfall = BodenbedeckungNullfall.features(create=True)
         self.boden_planfall = BodenbedeckungPlanfall.features(create=True)
         self.anteile = BodenbedeckungAnteile.features(create=True)
+        # areas per ground cover type in the drawings and the shares set by
+        # the user, built on first use and kept up to date while drawing and
+        # setting the shares
+        self._areas = {True: None, False: None}
+        self._shares = {True: None, False: None}
+        # output layers whose edits reset the areas
+        self._watched = {True: None, False: None}
         self.bb_types = self.basedata.get_table(
             'Bodenbedeckung', 'Flaeche_und_Oekologie'
         )
@@ -234,9 +241,7 @@ class Ecology(Domain):
             dependency = SumDependency(100)
             for bb_typ in self.bb_types.features():
                 bb_id = bb_typ.IDBodenbedeckung
-                feature = self.anteile.get(IDBodenbedeckung=bb_id,
-                                           planfall=planfall)
-                value = feature.anteil if feature else 0
+                value = self.type_shares(planfall=planfall).get(bb_id, 0)
                 slider = Slider(maximum=100, width=200, lockable=True)
                 param = Param(
                     int(value), slider, label=bb_typ.name,
@@ -350,44 +355,74 @@ class Ecology(Domain):
         if geom.isEmpty() or geom.isNull():
             return
         features = self.boden_planfall if planfall else self.boden_nullfall
-        if not unite:
-            features.add(geom=geom, IDBodenbedeckung=typ, area=geom.area())
-        # merge with existing geometries of same type
-        else:
-            ex_feat = features.get(IDBodenbedeckung=typ)
-            if not ex_feat:
+        areas = self.type_areas(planfall=planfall)
+        # prepared geometry for fast intersection tests
+        engine = QgsGeometry.createGeometryEngine(geom.constGet())
+        engine.prepareGeometry()
+        # all changes are written at once
+        with features.table.transaction():
+            if not unite:
                 features.add(geom=geom, IDBodenbedeckung=typ,
                              area=geom.area())
+                areas[typ] = areas.get(typ, 0) + geom.area()
+            # merge with existing geometries of same type
             else:
-                merged = ex_feat.geom.combine(geom)
-                if not merged.isGeosValid():
-                    merged = merged.makeValid()
-                merged = remove_junk(merged)
-                # ignore geometry if it can not be merged
-                if not merged or merged.isEmpty() or merged.isNull():
-                    return
-                ex_feat.geom = merged
-                ex_feat.area = ex_feat.geom.area()
-                ex_feat.save()
-        # cut existing geometries of a different type at same place
-        if difference:
-            marked_for_deletion = []
-            for feature in features:
-                if feature.IDBodenbedeckung == typ:
-                    continue
-                difference = feature.geom.difference(geom)
-                if not difference.isGeosValid():
-                    difference = difference.makeValid()
-                difference = remove_junk(difference)
-                if (not difference or difference.isNull() or
-                    difference.isEmpty()):
-                    marked_for_deletion.append(feature)
-                    continue
-                feature.geom = difference
-                feature.area = difference.area()
-                feature.save()
-            for feature in marked_for_deletion:
-                feature.delete()
+                ex_feat = features.get(IDBodenbedeckung=typ)
+                if not ex_feat:
+                    features.add(geom=geom, IDBodenbedeckung=typ,
+                                 area=geom.area())
+                    areas[typ] = areas.get(typ, 0) + geom.area()
+                else:
+                    if engine.intersects(ex_feat.geom.constGet()):
+                        merged = ex_feat.geom.combine(geom)
+                    # separate geometries don't need to be united
+                    else:
+                        merged = QgsGeometry.collectGeometry(
+                            [ex_feat.geom, geom])
+                    if not merged.isGeosValid():
+                        merged = merged.makeValid()
+                    merged = remove_junk(merged)
+                    # ignore geometry if it can not be merged
+                    if not merged or merged.isEmpty() or merged.isNull():
+                        return
+                    ex_feat.geom = merged
+                    areas[typ] = (areas.get(typ, 0) - ex_feat.area +
+                                  merged.area())
+                    ex_feat.area = merged.area()
+                    ex_feat.save()
+            # cut existing geometries of a different type at same place
+            if difference:
+                # only the geometries whose bounding boxes intersect the new
+                # one are read (using the spatial index of the table)
+                features.table.spatial_filter(
+                    QgsGeometry.fromRect(geom.boundingBox()).asWkt())
+                marked_for_deletion = []
+                try:
+                    for feature in features:
+                        if feature.IDBodenbedeckung == typ:
+                            continue
+                        # only geometries actually overlapped by the new one
+                        # have to be cut
+                        if not engine.intersects(feature.geom.constGet()):
+                            continue
+                        difference = feature.geom.difference(geom)
+                        if not difference.isGeosValid():
+                            difference = difference.makeValid()
+                        difference = remove_junk(difference)
+                        other_typ = feature.IDBodenbedeckung
+                        if (not difference or difference.isNull() or
+                            difference.isEmpty()):
+                            marked_for_deletion.append(feature)
+                            areas[other_typ] -= feature.area
+                            continue
+                        feature.geom = difference
+                        areas[other_typ] += difference.area() - feature.area
+                        feature.area = difference.area()
+                        feature.save()
+                finally:
+                    features.table.spatial_filter()
+                for feature in marked_for_deletion:
+                    feature.delete()
         self.canvas.refreshAllLayers()
 
         if len(features) == 1:
@@ -408,6 +443,7 @@ class Ecology(Domain):
         for feature in features:
             if feature.IDBodenbedeckung == typ:
                 feature.delete()
+        self.type_areas(planfall=planfall).pop(typ, None)
         self.canvas.refreshAllLayers()
 
     def save(self, prefix):
@@ -417,6 +453,7 @@ class Ecology(Domain):
         '''
         planfall = prefix == 'planfall'
         params = self.params_planfall if planfall else self.params_nullfall
+        shares = self.type_shares(planfall=planfall)
         for bb_typ in self.bb_types.features():
             bb_id = bb_typ.IDBodenbedeckung
             feature = self.anteile.get(IDBodenbedeckung=bb_id,
@@ -427,6 +464,7 @@ class Ecology(Domain):
                 feature.planfall = planfall
             feature.anteil = params.get(f'{prefix}_{bb_id}').value
             feature.save()
+            shares[bb_id] = feature.anteil
 
     def import_nullfall(self):
         '''
@@ -446,6 +484,8 @@ class Ecology(Domain):
             self.boden_planfall.add(geom=feature.geom,
                                     IDBodenbedeckung=feature.IDBodenbedeckung,
                                     area=feature.geom.area())
+        # rebuild on next use
+        self._areas[True] = None
         self.add_output()
 
     def get_selected_type(self, prefix):
@@ -458,15 +498,64 @@ class Ecology(Domain):
                 return typ
         return None
 
+    def type_areas(self, planfall=True):
+        '''
+        areas per ground cover type in the drawing, the features are read only
+        once, the areas are updated when changing the drawing afterwards
+        '''
+        areas = self._areas[planfall]
+        if areas is None:
+            # edits made directly in QGIS are not tracked
+            self.watch_output(planfall=planfall)
+            features = self.boden_planfall if planfall \
+                else self.boden_nullfall
+            areas = {}
+            for feature in features:
+                typ = feature.IDBodenbedeckung
+                areas[typ] = areas.get(typ, 0) + feature.area
+            self._areas[planfall] = areas
+        return areas
+
+    def type_shares(self, planfall=True):
+        '''
+        shares per ground cover type set by the user, the features are read
+        only once, the shares are updated when saving them afterwards
+        '''
+        shares = self._shares[planfall]
+        if shares is None:
+            shares = {feature.IDBodenbedeckung: feature.anteil
+                      for feature in self.anteile.filter(planfall=planfall)}
+            self._shares[planfall] = shares
+        return shares
+
+    def watch_output(self, planfall=True):
+        '''
+        reset the areas per ground cover type when the layer of the drawing is
+        edited in QGIS
+        '''
+        output = self.output_planfall if planfall else self.output_nullfall
+        if not output:
+            return
+        layer = output.layer
+        if not layer:
+            layers = output.find(self.output_label(planfall=planfall),
+                                 groupname=output.groupname)
+            layer = layers[0].layer() if layers else None
+        if not layer or layer is self._watched[planfall]:
+            return
+        def reset():
+            self._areas[planfall] = None
+        # emitted after committing or rolling back the edits
+        layer.editingStopped.connect(reset)
+        self._watched[planfall] = layer
+
     def analyse_shares(self, planfall=True):
         '''
         calculate the share per ground cover type out of the drawing
         '''
-        features = self.boden_planfall if planfall else self.boden_nullfall
-        df = features.to_pandas()
-        grouped = df.groupby('IDBodenbedeckung')
-        grouped_sums = grouped['area'].sum()
-        sum_area = df['area'].sum()
+        areas = self.type_areas(planfall=planfall)
+        grouped_sums = pd.Series(areas, dtype=float)
+        sum_area = grouped_sums.sum()
         shares = (grouped_sums * 100 / sum_area).round() if sum_area > 0 \
             else grouped_sums
         return shares
@@ -532,6 +621,7 @@ class Ecology(Domain):
         # remove selection, so that qgis is free to remove them from canvas
         layer.removeSelection()
         features.delete()
+        self._areas[planfall] = {}
         self.canvas.refreshAllLayers()
 
     def add_output(self, redraw=False):
@@ -539,8 +629,7 @@ class Ecology(Domain):
         add drawings as layer
         '''
         planfall = self.ui.drawing_tab_widget.currentIndex() == 1
-        label = 'Bodenbedeckung '
-        label += 'Planfall' if planfall else 'Nullfall'
+        label = self.output_label(planfall=planfall)
         output = self.output_planfall if planfall else self.output_nullfall
         style = 'flaeche_oekologie_bodenbedeckung_planfall.qml' if planfall \
             else 'flaeche_oekologie_bodenbedeckung_nullfall.qml'
@@ -551,6 +640,13 @@ class Ecology(Domain):
             else self.output_planfall
         if disabled_out:
             disabled_out.set_visibility(False)
+        self.watch_output(planfall=planfall)
+
+    def output_label(self, planfall=True):
+        '''
+        label of the layer of the drawing
+        '''
+        return 'Bodenbedeckung ' + ('Planfall' if planfall else 'Nullfall')
 
     def add_wms_layer(self, name, url, parent_group=None):
         '''
@@ -570,7 +666,10 @@ class Ecology(Domain):
         the scenario. Plot the results in diagrams
         '''
         df_factors = self.faktoren.to_pandas()
-        df_shares = self.anteile.to_pandas()
+        df_shares = pd.DataFrame(
+            [(bb_id, anteil, planfall) for planfall in [False, True]
+             for bb_id, anteil in self.type_shares(planfall=planfall).items()],
+            columns=['IDBodenbedeckung', 'anteil', 'planfall'])
         df_merged = df_shares.merge(df_factors, on='IDBodenbedeckung')
 
         def rating(df, columns):
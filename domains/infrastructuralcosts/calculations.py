@@ -28,11 +28,12 @@ from projektcheck.utils.utils import round_df_to
 from projektcheck.domains.definitions.tables import Projektrahmendaten
 from .tables import (KostenkennwerteLinienelemente, ErschliessungsnetzLinien,
                      ErschliessungsnetzPunkte, Kostenaufteilung,
-                     Gesamtkosten, GesamtkostenTraeger)
+                     Gesamtkosten, GesamtkostenEingangsdaten,
+                     GesamtkostenTraeger)
 
 import time
+import hashlib
 import pandas as pd
-import numpy as np
 
 def init_kostenkennwerte(project: Project) -> pd.DataFrame:
     '''
@@ -78,29 +79,41 @@ def init_kostenkennwerte(project: Project) -> pd.DataFrame:
 
 class GesamtkostenErmitteln(Worker):
     '''
-    worker for estimating the total (gross) costs of the infrastucture network
+    worker for estimating the total (gross) costs of the infrastucture network,
+    the results are only recalculated if the network, the costs of the
+    elements or the base data of the costs changed since the last calculation
     '''
     # period of estimation
     years = 25
 
+    inputs = [KostenkennwerteLinienelemente, ErschliessungsnetzLinien,
+              ErschliessungsnetzPunkte, 'Kosten']
+    outputs = [KostenkennwerteLinienelemente, Gesamtkosten,
+               GesamtkostenEingangsdaten]
+
     def __init__(self, project, parent=None):
         super().__init__(parent=parent)
         self.project = project
+        self.df_costs = None
 
-    def work(self):
-        self.log('Bereite Ausgangsdaten auf...')
+    def load_inputs(self):
+        '''
+        load the network, the costs of its elements and the phases and
+        networks of the base data
+        '''
         kk_features = KostenkennwerteLinienelemente.features(create=True)
         if len(kk_features) == 0:
             init_kostenkennwerte(self.project)
-        self.df_costs = kk_features.to_pandas()
-        del self.df_costs['IDNetz']
+        self.df_costs = kk_features.to_pandas(
+            columns=['IDNetzelement', 'Euro_EH', 'Euro_EN', 'Cent_BU',
+                     'Lebensdauer'])
         self.df_lines = ErschliessungsnetzLinien.features(
-            project=self.project).to_pandas()
+            project=self.project).to_pandas(
+                columns=['IDNetz', 'IDNetzelement', 'length'])
         self.df_points = ErschliessungsnetzPunkte.features(
-            project=self.project).to_pandas()
-        self.joined_lines_costs = self.df_lines.merge(
-            self.df_costs, on='IDNetzelement', how='left')
-
+            project=self.project).to_pandas(
+                columns=['IDNetz', 'IDNetzelement', 'Euro_EH', 'Euro_EN',
+                         'Cent_BU', 'Lebensdauer'])
         # the net elements are just needed for their names
         self.df_elements = self.project.basedata.get_table(
             'Netze_und_Netzelemente', 'Kosten',
@@ -108,79 +121,111 @@ class GesamtkostenErmitteln(Worker):
         # duplicate entries for 'IDNetz'/'Netz' combinationsjean
         del self.df_elements['fid']
         self.df_elements.drop_duplicates(inplace=True)
-
         self.df_phases = self.project.basedata.get_table(
             'Kostenphasen', 'Kosten').to_pandas()
+        self.costs_results = Gesamtkosten.features(
+            project=self.project, create=True)
+        self.results_state = GesamtkostenEingangsdaten.features(
+            project=self.project, create=True)
+
+    def up_to_date(self):
+        '''
+        the results are up to date if neither the network nor the costs of the
+        elements nor the base data changed since they were calculated
+        '''
+        if self.df_costs is None:
+            self.load_inputs()
+        if len(self.costs_results) == 0 or len(self.results_state) == 0:
+            return False
+        return self.results_state[0].Signatur == self.input_state()
+
+    def work(self):
+        self.log('Bereite Ausgangsdaten auf...')
+        if self.up_to_date():
+            self.log('Netz und Kostenkennwerte sind unverändert, die '
+                     'bereits berechneten Gesamtkosten werden verwendet.')
+            return
+        state = self.input_state()
+
+        self.joined_lines_costs = self.df_lines.merge(
+            self.df_costs, on='IDNetzelement', how='left')
 
         self.log('Berechne Gesamtkosten der Phasen {}<br>{}...'.format(
             f' für die ersten {self.years} Jahre'.format(),
             ', <br>'.join(self.df_phases['Kostenphase'].tolist())
         ))
 
-        self.costs_results = Gesamtkosten.features(
-            project=self.project, create=True)
-        self.costs_results.delete()
         df_results = self.calculate_phases()
-        del df_results['fid']
-        self.costs_results.update_pandas(df_results)
+        # the signature is stored with the results (same workspace)
+        with self.costs_results.table.transaction():
+            self.costs_results.delete()
+            self.costs_results.update_pandas(df_results)
+            self.results_state.delete()
+            self.results_state.add(Signatur=state)
+
+    def input_state(self):
+        '''
+        signature of the network, the costs and the base data the results are
+        based on
+        '''
+        sha = hashlib.sha1()
+        for df in [self.df_costs, self.df_lines, self.df_points,
+                   self.df_elements, self.df_phases]:
+            sha.update(
+                pd.util.hash_pandas_object(df, index=False).values.tobytes())
+        return sha.hexdigest()
 
     def calculate_phases(self):
         '''
-        calculate costs of each phase
+        calculate costs of each phase per net
         '''
-        df_results = self.costs_results.to_pandas()
-
-        # points and lines have same columns and calc. basis is same as well
-        grouped_lines = self.joined_lines_costs.groupby('IDNetz')
-        grouped_points = self.df_points.groupby('IDNetz')
-        for grouped in [grouped_lines, grouped_points]:
-            for net_id, group in grouped:
-                for index, phase in self.df_phases.iterrows():
-                    phase_id = phase['IDKostenphase']
-                    if phase_id == 1:
-                        costs = group['Euro_EH']
-                    elif phase_id == 2:
-                        costs = self.years * group['Cent_BU'] / 100.
-                    elif phase_id == 3:
-                        costs = (self.years *
-                                 group['Euro_EN'] / group['Lebensdauer'])
-                    else:
-                        raise Exception(f'phase {phase_id} not defined')
-
-                    # only difference between points and lines: costs of lines
-                    # are based on costs per meter, points naturally don't have
-                    # a length at all ^^
-                    if 'length' in group:
-                        costs *= group['length']
-                    costs = costs.sum()
-
-                    row = pd.DataFrame({'IDNetz': net_id,
-                                        'IDKostenphase': phase_id,
-                                        'Euro': round(costs, 2),
-                                        }, index=[0])
-                    df_results = df_results.append(row, ignore_index=True)
-
-        df_results = df_results.groupby(['IDNetz', 'IDKostenphase']).agg(np.sum)
-        df_results.reset_index(inplace=True)
-        df_results = df_results.merge(self.df_phases, on='IDKostenphase')
+        phase_ids = self.df_phases['IDKostenphase'].values
+        for phase_id in phase_ids:
+            if phase_id not in [1, 2, 3]:
+                raise Exception(f'phase {phase_id} not defined')
+
+        # points and lines have same columns and calc. basis is same as well,
+        # only difference: costs of lines are based on costs per meter, points
+        # naturally don't have a length at all ^^
+        frames = []
+        for df, length in [(self.joined_lines_costs,
+                            self.joined_lines_costs['length']),
+                           (self.df_points, 1)]:
+            phase_costs = {
+                1: df['Euro_EH'],
+                2: self.years * df['Cent_BU'] / 100.,
+                3: self.years * df['Euro_EN'] / df['Lebensdauer'],
+            }
+            for phase_id in phase_ids:
+                frames.append(pd.DataFrame({
+                    'IDNetz': df['IDNetz'].values,
+                    'IDKostenphase': phase_id,
+                    'Euro': (phase_costs[phase_id] * length).values
+                }))
+
+        df_results = pd.concat(frames).groupby(
+            ['IDNetz', 'IDKostenphase'], as_index=False)['Euro'].sum()
+        df_results['Euro'] = df_results['Euro'].round(2)
+        df_results = df_results.merge(
+            self.df_phases[['IDKostenphase', 'Kostenphase']],
+            on='IDKostenphase')
         df_results = df_results.merge(self.df_elements, on='IDNetz')
         return df_results
 
 
 class KostentraegerAuswerten(Worker):
     '''
-    worker for calculating the infrastuctural costs per payer
+    worker for calculating the infrastuctural costs per payer, expects the
+    total costs to be calculated already (GesamtkostenErmitteln)
     '''
+    inputs = [Gesamtkosten, Kostenaufteilung, 'Kosten']
+    outputs = [Kostenaufteilung, GesamtkostenTraeger]
+
     def __init__(self, project, parent=None):
         super().__init__(parent=parent)
         self.project = project
 
     def work(self):
-        self.log('Ermittle Gesamtkosten...')
-        gesamtkosten_worker = GesamtkostenErmitteln(
-            self.project, parent=self.parent())
-        gesamtkosten_worker.work()
-
         self.shares_results = GesamtkostenTraeger.features(
             project=self.project, create=True)
         self.df_shares = Kostenaufteilung.features(
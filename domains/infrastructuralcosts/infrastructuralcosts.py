@@ -28,7 +28,7 @@ from qgis.PyQt.QtWidgets import QMessageBox, QRadioButton, QPushButton
 import numpy as np
 import os
 
-from projektcheck.base.domain import Domain
+from projektcheck.base.domain import Domain, Pipeline
 from projektcheck.base.tools import LineMapTool
 from projektcheck.base.project import ProjectLayer
 from projektcheck.base.tools import FeaturePicker, MapClickedTool
@@ -627,7 +627,8 @@ class Kostentraeger:
         '''
         calculations of cost shares
         '''
-        job = KostentraegerAuswerten(self.project)
+        job = Pipeline([GesamtkostenErmitteln(self.project),
+                        KostentraegerAuswerten(self.project)])
 
         def on_close():
             if not self.dialog.success:
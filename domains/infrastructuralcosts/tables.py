@@ -81,6 +81,14 @@ class Gesamtkosten(ProjectTable):
         workspace = 'infrastukturfolgekosten'
 
 
+class GesamtkostenEingangsdaten(ProjectTable):
+    # signature of the inputs the total costs were calculated with
+    Signatur = Field(str, '')
+
+    class Meta:
+        workspace = 'infrastukturfolgekosten'
+
+
 class Kostenaufteilung(ProjectTable):
     IDNetz = Field(int, 0)
     IDKostenphase = Field(int, 0)
@@ -84,6 +84,9 @@ class LandUse(Domain):
         self.wohnbauland_anteile = WohnbaulandAnteile.features(create=True)
         self.wohnflaeche = WohnflaecheGebaeudetyp.features(create=True)
         self.borders = GrenzeSiedlungskoerper.features(create=True)
+        # length of the drawn border, summed up on first use and kept up to
+        # date while drawing
+        self._border_length = None
         self.wohneinheiten = Wohneinheiten.features(create=True)
         self.rahmendaten = Projektrahmendaten.features()[0]
         self.wohndichte_kreis = self.basedata.get_table(
@@ -298,6 +301,7 @@ class LandUse(Domain):
         '''
         add a geometry to the drawn border
         '''
+        self.border_length = self.border_length + geom.length()
         self.borders.add(geom=geom)
         # workaround: layer style is not applied correctly
         # with empty features -> redraw on first geometry
@@ -310,8 +314,23 @@ class LandUse(Domain):
         remove drawn border
         '''
         self.borders.delete()
+        self._border_length = 0
         self.canvas.refreshAllLayers()
 
+    @property
+    def border_length(self):
+        '''
+        total length of the drawn border
+        '''
+        if self._border_length is None:
+            self._border_length = sum(
+                [line.geom.length() for line in self.borders])
+        return self._border_length
+
+    @border_length.setter
+    def border_length(self, value):
+        self._border_length = value
+
     def add_border_output(self):
         '''
         add layer to visualize drawn border
@@ -323,6 +342,11 @@ class LandUse(Domain):
             label='Grenze Siedlunskörper',
             style_file='flaeche_oekologie_grenze_siedlungskoerper.qml'
         )
+        # edits made directly in QGIS are not tracked, sum up the length again
+        # after committing or rolling back the edits
+        def reset():
+            self._border_length = None
+        self.output_border.layer.editingStopped.connect(reset)
 
     def calculate_integration(self):
         '''
@@ -330,7 +354,7 @@ class LandUse(Domain):
         pie chart
         '''
         area_outer_border = self.area_union.length()
-        drawn_borders = sum([line.geom.length() for line in self.borders])
+        drawn_borders = self.border_length
         shared_border = round(100 * drawn_borders / area_outer_border)
         shared_border = min(shared_border, 100)
         values = [shared_border, 100 - shared_border]
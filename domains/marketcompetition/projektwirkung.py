@@ -25,17 +25,15 @@ __copyright__ = 'Copyright 2020, HafenCity University Hamburg'
 import os
 import pandas as pd
 import numpy as np
-import pandas as pd
 from collections import Counter
-import processing
-from qgis.core import (QgsCoordinateTransform, QgsProject, QgsRasterLayer,
-                       QgsCoordinateReferenceSystem)
+from qgis.core import QgsGeometry, QgsPointXY
 
 from projektcheck.domains.definitions.tables import Teilflaechen
-from projektcheck.utils.spatial import (Point, create_layer, intersect,
-                                        clip_raster, get_bbox)
+from projektcheck.utils.spatial import (Point, intersect, clip_raster,
+                                        get_bbox, read_raster, rasterize,
+                                        transform_coords)
 from projektcheck.base.domain import Worker
-from .sales import Sales
+from .sales import Sales, calculate_sales
 from .routing_distances import DistanceRouting
 from .tables import (Centers, Markets, MarketCellRelations, Settings,
                      SettlementCells)
@@ -47,6 +45,14 @@ class Projektwirkung(Worker):
     '''
     calculation of the impact of additional/changed markets in the study area
     '''
+    cancellable = True
+
+    inputs = [Teilflaechen, Markets, Centers, Settings, SettlementCells,
+              MarketCellRelations, 'Standortkonkurrenz_Supermaerkte',
+              'Basisdaten_deutschland']
+    outputs = [Markets, Centers, Settings, SettlementCells,
+               MarketCellRelations]
+
     def __init__(self, project, recalculate=False, parent=None):
         '''
         Parameters
@@ -150,6 +156,7 @@ class Projektwirkung(Worker):
         self.log(u'Berechne Erreichbarkeiten der Märkte...')
         self.calculate_distances(progress_start=15, progress_end=65)
 
+        self.check_cancelled()
         self.set_progress(65)
         self.log(u'Lade Eingangsdaten für die nachfolgenden '
                  u'Berechnungen...')
@@ -159,11 +166,12 @@ class Projektwirkung(Worker):
 
         sales = Sales(self.project.basedata, df_relations, df_markets, df_cells)
         self.set_progress(70)
-        self.log('Berechne Nullfall...')
-        kk_nullfall = sales.calculate_nullfall()
-        self.set_progress(75)
-        self.log('Berechne Planfall...')
-        kk_planfall = sales.calculate_planfall()
+        self.log('Berechne Nullfall und Planfall...')
+        # only the data needed for the setting is passed to the processes
+        kk_nullfall, kk_planfall = self.run_in_processes(
+            [(calculate_sales, sales.sales_input(Sales.NULLFALL)),
+             (calculate_sales, sales.sales_input(Sales.PLANFALL))],
+            progress_start=70, progress_end=80)
         self.set_progress(80)
         self.log('Berechne Kenngrößen...')
         self.sales_to_db(kk_nullfall, kk_planfall)
@@ -186,85 +194,48 @@ class Projektwirkung(Worker):
                                    self.project.settings.ZENSUS_500_FILE)
 
         clipped_raster, raster_epsg = clip_raster(zensus_file, bbox)
-
-        raster_layer = QgsRasterLayer(clipped_raster)
-        # workaround QGIS 3.10.2+: does not set crs correctly when reading
-        # raster file
-        crs = QgsCoordinateReferenceSystem()
-        crs.createFromSrid(raster_epsg)
-        raster_layer.setCrs(crs)
-
-        parameters = {
-            'INPUT_RASTER': raster_layer,
-            'RASTER_BAND': 1,
-            'FIELD_NAME': 'value',
-            'OUTPUT': 'memory:'
-        }
-        point_layer = processing.run(
-            'native:pixelstopoints', parameters)['OUTPUT']
-        point_layer.setSubsetString('value>0')
-
-        overlay = create_layer(gemeinden, 'Polygon', fields=['ags'],
-                               name='overlay', epsg=epsg,
-                               target_epsg=raster_layer.crs().postgisSrid())
-
-        #clip_tmp = tempfile.NamedTemporaryFile(suffix='.gpkg').name
-        parameters = {
-            'INPUT': point_layer,
-            'OVERLAY': overlay,
-            'OUTPUT': 'memory:'
-        }
-        clipped_layer = processing.run(
-            'native:clip', parameters)['OUTPUT']
-
-        parameters = {
-            'INPUT': clipped_layer,
-            'OVERLAY': overlay,
-            'OUTPUT': 'memory:'
-        }
-        clipped_w_ags = processing.run(
-            'native:intersection', parameters)['OUTPUT']
+        values, geotransform, raster_epsg = read_raster(clipped_raster)
+
+        # community of each cell by rasterizing the communities onto the grid
+        # of the zensus raster
+        gemeinden = list(gemeinden)
+        gem_idx = rasterize([g.geom for g in gemeinden], geotransform,
+                            values.shape, epsg, raster_epsg=raster_epsg)
+
+        # populated cells inside of the communities
+        rows, cols = np.nonzero((values > 0) & (gem_idx >= 0))
+        ew = values[rows, cols].astype(float)
+        gem_idx = gem_idx[rows, cols]
+        ulx, xres, xskew, uly, yskew, yres = geotransform
+        x, y = transform_coords(ulx + (cols + 0.5) * xres,
+                                uly + (rows + 0.5) * yres,
+                                raster_epsg, epsg)
 
         self.log('Schreibe Siedlungszellen in Datenbank...')
-        tr = QgsCoordinateTransform(
-            clipped_w_ags.crs(), QgsCoordinateReferenceSystem(f'epsg:{epsg}'),
-            QgsProject.instance()
-        )
-
-        ags_list = [g.ags for g in gemeinden]
-        gem_acc = dict([(a, [0, 0]) for a in ags_list])
-
-        for feature in clipped_w_ags.getFeatures():
-            ew = feature.attribute('VALUE')
-            if ew <= 0:
-                continue
-            # for some reason all geometries are MultiPoint with length 1
-            geom = feature.geometry()
-            geom.transform(tr)
-            point = geom.asMultiPoint()[0]
-            ags = feature.attribute('ags')
-            # take default kk_index only atm (there is a table (KK2015) with
-            # indices in the basedata though)
-            kk_index = default_kk_index
-            kk = ew * base_kk * kk_index / 100
-            self.cells.add(
-                ew=ew,
-                kk_index=kk_index,
-                kk=kk,
-                id_teilflaeche=-1,
-                in_auswahl=True,
-                geom=point,
-                ags=ags
-            )
-            # accumulate einwohner and kaufkraft
-            acc = gem_acc[ags]
-            acc[0] += ew
-            acc[1] += kk
-
-        for ags, (ew, kk) in gem_acc.items():
-            gem = self.centers.get(ags=ags)
-            gem.ew = ew
-            gem.kk = kk
+        ags = np.array([g.ags for g in gemeinden], dtype=object)
+        # take default kk_index only atm (there is a table (KK2015) with
+        # indices in the basedata though)
+        kk_index = default_kk_index
+        kk = ew * base_kk * kk_index / 100
+        df_cells = pd.DataFrame({
+            'ew': ew.astype(int),
+            'kk_index': kk_index,
+            'kk': kk,
+            'id_teilflaeche': -1,
+            'in_auswahl': True,
+            'geom': [QgsGeometry.fromPointXY(QgsPointXY(px, py))
+                     for px, py in zip(x, y)],
+            'ags': ags[gem_idx],
+        })
+        self.cells.update_pandas(df_cells)
+
+        # accumulate einwohner and kaufkraft
+        ew_acc = np.bincount(gem_idx, weights=ew, minlength=len(gemeinden))
+        kk_acc = np.bincount(gem_idx, weights=kk, minlength=len(gemeinden))
+        for gem_ags, gem_ew, gem_kk in zip(ags, ew_acc, kk_acc):
+            gem = self.centers.get(ags=gem_ags)
+            gem.ew = gem_ew
+            gem.kk = gem_kk
             gem.save()
 
     def update_areas(self, default_kk_index, base_kk):
@@ -301,11 +272,13 @@ class Projektwirkung(Worker):
             destinations.append(Point(pnt.x(), pnt.y(), id=cell.id, epsg=epsg))
         already_calculated = np.unique(self.relations.values('id_markt'))
         self.markets.reset()
-        n_markets = len(self.markets)
+        # read all markets before writing to the same GeoPackage, ogr crashes
+        # when adding features while iterating
+        markets = list(self.markets)
+        n_markets = len(markets)
         progress_step = (progress_end - progress_start) / n_markets
-        i = 1
-        results = {}
-        for market in self.markets:
+        for i, market in enumerate(markets, start=1):
+            self.check_cancelled()
             self.log(f' - {market.name} ({i}/{n_markets})')
             if market.id not in already_calculated:
                 self.log('&nbsp;&nbsp;wird berechnet')
@@ -322,19 +295,14 @@ class Projektwirkung(Worker):
                 except Exception as e:
                     self.error.emit(str(e))
                     return
-                results[market.id] = destinations, distances, beelines
-                #self.distances_to_db(market.id, destinations, distances,
-                                     #beelines)
+                # the distances are stored right away, a new calculation
+                # after a cancellation or an error resumes with the next
+                # market
+                self.distances_to_db(market.id, destinations, distances,
+                                     beelines)
             else:
                 self.log('&nbsp;&nbsp;bereits berechnet, wird übersprungen')
             self.set_progress(progress_start + (i * progress_step))
-            i += 1
-        # workaround: ogr crashes when setting relations in loop
-        if len(results) > 0:
-            self.message.emit('Speichere Distanzen...')
-        for market_id, (destinations, distances, beelines) in results.items():
-            self.distances_to_db(market_id, destinations, distances,
-                                 beelines)
 
     def sales_to_db(self, kk_nullfall, kk_planfall):
         '''
@@ -500,15 +468,16 @@ class Projektwirkung(Worker):
 
     def distances_to_db(self, market_id, destinations, distances, beelines):
         '''
-        store calculated distances in database
+        store calculated distances in database (all or none of them)
         '''
-        for i, dest in enumerate(destinations):
-            self.relations.add(
-                id_siedlungszelle=dest.id,
-                in_auswahl=True, #dest.in_auswahl,
-                id_markt=market_id,
-                luftlinie=beelines[i],
-                distanz=distances[i],
-                geom=dest.geom
-            )
+        with self.relations.table.transaction():
+            for i, dest in enumerate(destinations):
+                self.relations.add(
+                    id_siedlungszelle=dest.id,
+                    in_auswahl=True, #dest.in_auswahl,
+                    id_markt=market_id,
+                    luftlinie=beelines[i],
+                    distanz=distances[i],
+                    geom=dest.geom
+                )
 
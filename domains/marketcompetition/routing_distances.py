@@ -23,7 +23,6 @@ __date__ = '14/05/2020'
 __copyright__ = 'Copyright 2020, HafenCity University Hamburg'
 
 import os
-import time
 import numpy as np
 import math
 from scipy.ndimage import filters
@@ -31,10 +30,7 @@ import tempfile
 from osgeo import gdal, osr
 
 from projektcheck.utils.spatial import Point, clip_raster
-from projektcheck.utils.connection import Request
-from projektcheck.settings import settings
-
-requests = Request(synchronous=True)
+from projektcheck.utils.routing import get_routing_backend
 
 def dilate_raster(array, kernel_size=3, threshold=120):
     '''
@@ -113,10 +109,9 @@ class DistanceRouting:
     '''
     fast routing between an origin and several destinations
     '''
-    ROUTER = 'deutschland'
     RASTER_FILE_PATTERN = 'raster_{id}.tif'
 
-    def __init__(self, target_epsg=4326, resolution=300):
+    def __init__(self, target_epsg=4326, resolution=300, backend=None):
         '''
         Parameters
         ----------
@@ -124,7 +119,11 @@ class DistanceRouting:
             side length of raster cells in pixels, defaults to 300 pixels
         target_epsg : int, optional
             epsg code of targeted projection, defaults to 4326
+        backend : RoutingBackend, optional
+            the backend to request the travel times from, defaults to the
+            backend configured in the settings
         '''
+        self.backend = backend or get_routing_backend()
         self.epsg = 4326
         self.resolution = resolution
         self.target_epsg = target_epsg
@@ -185,11 +184,8 @@ class DistanceRouting:
             clipped_raster, raster_epsg = clip_raster(dist_raster, (p1, p2))
             #os.remove(dist_raster)
             dist_raster = clipped_raster
-        start = time.time()
         raster = RasterManagement()
         raster.load(dist_raster)
-        print('filtering raster {}s'.format(time.time() - start))
-        start = time.time()
         raster.register_points(destinations)
         if destinations:
             o = origin.transform(destinations[0].epsg)
@@ -212,50 +208,12 @@ class DistanceRouting:
     def _request_dist_raster(self, origin, kmh=30):
         if origin.epsg != self.epsg:
             origin.transform(self.epsg)
-        params = {
-            'batch': True,
-            'routerId': self.ROUTER,
-            'fromPlace': f"{origin.y},{origin.x}",
-            'mode': 'WALK',
-            'maxWalkDistance': 50000,
-            'maxPreTransitTime': 1200,
-            # the max traveltime will be (cutoffMinutes + 30 min)
-            'cutoffMinutes': 70,
-            'searchRadiusM': 1000,
-            'walkSpeed': kmh / 3.6,
-            'intersectCosts': False,
-        }
-        start = time.time()
-        otp_url = settings.OTP_ROUTER_URL + '/surfaces'
-        try:
-            r = requests.post(otp_url, params=params)
-        except ConnectionError:
-            raise ConnectionError(
-                'Der Server antwortet nicht. Möglicherweise ist er nicht aktiv '
-                'oder überlastet.')
-        #except requests.exceptions.HTTPError:
-            #raise Exception(err_msg)
-
-        try:
-            id = r.json()['id']
-        except:
-            return None
-        url = f'{otp_url}/{id}/raster'
-
-        params = {
-            'resolution': self.resolution,
-            'crs': f'EPSG:{self.target_epsg}',
-        }
-        start = time.time()
-        r = requests.get(url, params=params)
-        print('request get {}s'.format(time.time() - start))
         out_raster = os.path.join(
             self.tmp_folder,
             self.RASTER_FILE_PATTERN.format(id=origin.id))
-        if r.status_code == 200:
-            with open(out_raster, 'wb') as f:
-                f.write(r.raw_data)
-        else:
-            raise Exception('Das angefragte Distanzraster ist fehlerhaft.')
-        return out_raster
-
+        # the max traveltime will be (cutoff_minutes + 30 min)
+        raster = self.backend.travel_time_raster(
+            origin, out_raster, speed=kmh, cutoff_minutes=70,
+            resolution=self.resolution, target_epsg=self.target_epsg,
+            search_radius=1000)
+        return raster
@@ -25,10 +25,14 @@ __copyright__ = 'Copyright 2020, HafenCity University Hamburg'
 import numpy as np
 import pandas as pd
 
+from projektcheck.utils.processes import report
+
 
 class Sales:
     '''
-    calculations of sales and competition between markets
+    calculations of sales and competition between markets, the base data is
+    read on initialisation, the calculations themselves only work on
+    dataframes (and may run in another process)
     '''
     NULLFALL = 0
     PLANFALL = 1
@@ -48,10 +52,28 @@ class Sales:
         df_cells : Dataframe
             settlement cells and their properties
         '''
-        self.basedata = basedata
-        self.df_relations = df_relations
-        self.df_markets = df_markets
-        self.df_cells = df_cells
+        # the geometries are not needed for the calculations
+        self.df_relations = df_relations.drop(columns='geom', errors='ignore')
+        self.df_markets = df_markets.drop(columns='geom', errors='ignore')
+        self.df_cells = df_cells.drop(columns='geom', errors='ignore')
+
+        ags = np.unique(self.df_markets['AGS'])
+        communities = basedata.get_table(
+            'bkg_gemeinden', 'Basisdaten_deutschland',
+            fields=['AGS', 'vwg_groessenklasse'])
+        communities.filter(AGS__in=list(ags))
+        self.df_communities = communities.to_pandas(
+            columns=['AGS', 'vwg_groessenklasse'])
+
+        # dataframe for exponential parameters
+        self.df_exponential_parameters = basedata.get_table(
+            'Exponentialfaktoren', 'Standortkonkurrenz_Supermaerkte',
+            fields=['gem_groessenklasse', 'id_kette', 'id_betriebstyp',
+                    'exponent', 'exp_faktor']).to_pandas()
+
+        self.df_attractivity_factors = basedata.get_table(
+            'Attraktivitaetsfaktoren', 'Standortkonkurrenz_Supermaerkte'
+            ).to_pandas()
 
     def calculate_nullfall(self):
         '''
@@ -62,7 +84,7 @@ class Sales:
         Dataframe
             dataframe containing purchase power flows between markets and cells
         '''
-        return self._calculate_sales(self.NULLFALL)
+        return calculate_sales(*self.sales_input(self.NULLFALL))
 
     def calculate_planfall(self):
         '''
@@ -73,9 +95,19 @@ class Sales:
         Dataframe
             dataframe containing purchase power flows between markets and cells
         '''
-        return self._calculate_sales(self.PLANFALL)
+        return calculate_sales(*self.sales_input(self.PLANFALL))
 
-    def _calculate_sales(self, setting):
+    def sales_input(self, setting):
+        '''
+        the data needed to calculate the sales in the given setting, only the
+        markets of the setting and their relations and the purchase power of
+        the cells
+
+        Returns
+        -------
+        tuple
+            the arguments of calculate_sales()
+        '''
         df_markets = self._prepare_markets(self.df_markets, setting)
         df_markets.set_index('id', inplace=True)
 
@@ -85,183 +117,24 @@ class Sales:
         ids_not_in_df = np.setdiff1d(
             np.unique(self.df_relations['id_markt']), df_markets.index)
         df_relations = self.df_relations.drop(
-            self.df_relations.index[np.in1d(self.df_relations['id_markt'],
-                                            ids_not_in_df)])
-
-        # easiest way to distinguish same distances by adding
-        # normed bee-lines
-        beelines = df_relations['luftlinie']
-        beelines[df_relations['distanz'] == -1] = -1
-        beelines_norm = beelines / beelines.max()
-        df_relations['distanz'] += beelines_norm
-
-        # calc with distances in kilometers
-        df_relations['distanz'] /= 1000
-        n_idx = df_relations['distanz'] < 0
-        df_relations['distanz'][n_idx] = -1
+            index=self.df_relations.index[
+                np.in1d(self.df_relations['id_markt'], ids_not_in_df)],
+            columns=self.df_relations.columns.difference(
+                ['id_markt', 'id_siedlungszelle', 'distanz', 'luftlinie']))
+        # a range index is pickled without its values
+        df_relations.reset_index(drop=True, inplace=True)
 
         # in case of Nullfall take zensus points without planned areas
         df_cells = self.df_cells[self.df_cells['id_teilflaeche'] < 0] \
             if setting == self.NULLFALL else self.df_cells
-
-        df_kk = pd.DataFrame()
-        df_kk['id_siedlungszelle'] = df_cells['id']
-        df_kk['kk'] = df_cells['kk']
-        kk_merged = df_relations.merge(df_kk, on='id_siedlungszelle')
-
-        kk_matrix = kk_merged.pivot(index='id_markt',
-                                    columns='id_siedlungszelle',
-                                    values='kk')
-
-        dist_matrix = kk_merged.pivot(index='id_markt',
-                                      columns='id_siedlungszelle',
-                                      values='distanz')
-        dist_matrix = dist_matrix.fillna(0)
-
-        attraction_matrix = pd.DataFrame(data=np.zeros(dist_matrix.shape),
-                                         index=dist_matrix.index,
-                                         columns=dist_matrix.columns)
-
-        for index, market in df_markets.iterrows():
-            dist = dist_matrix.loc[index]
-            factor = market['exp_faktor']
-            exponent = market['exponent']
-            attraction_matrix.loc[index] = factor * np.exp(dist * exponent)
-
-        unreachable = dist_matrix < 0
-        attraction_matrix[unreachable] = 0
-        betriebstyp_col = 'id_betriebstyp_nullfall' \
-            if setting == self.NULLFALL else 'id_betriebstyp_planfall'
-
-        masked_dist_matrix = dist_matrix.T
-        masked_dist_matrix = masked_dist_matrix.mask(masked_dist_matrix < 0)
-
-        # local providers
-        # no real competition, but only closest three per cell (copy/paste from
-        # calc_competitors, had no time seperate implementation)
-        is_lp = df_markets[betriebstyp_col] == 1
-        local_markets = df_markets[is_lp]
-        local_masked_dist = masked_dist_matrix[local_markets.index]
-        df_ranking = local_masked_dist.rank(axis=1, method='first')
-        local_comp_matrix = pd.DataFrame(data=0, index=df_ranking.index,
-                                         columns=df_ranking.columns)
-        local_comp_matrix[df_ranking <= 3] = 1
-        local_comp_matrix[np.isnan(df_ranking)] = 0
-        local_comp_matrix = local_comp_matrix.T
-
-        # small markets
-        is_sm = df_markets[betriebstyp_col] == 2
-        small_markets = df_markets[is_sm]
-        small_comp_matrix = self.calc_competitors(
-            masked_dist_matrix, small_markets)
-
-        # big markets
-        big_markets = df_markets[df_markets[betriebstyp_col] > 2]
-        big_comp_matrix = self.calc_competitors(
-            masked_dist_matrix, big_markets)
-
-        # merge
-        big_comp_matrix.loc[is_lp] = local_comp_matrix
-        big_comp_matrix.loc[is_sm] = small_comp_matrix.loc[is_sm]
-
-        competitor_matrix = big_comp_matrix
-        competitor_matrix[dist_matrix < 0] = 0
-
-        # include competition between same market types in attraction_matrix
-        attraction_matrix *= competitor_matrix.values
-
-        probabilities = attraction_matrix / attraction_matrix.sum(axis=0)
-        kk_flow = probabilities * kk_matrix
-        kk_flow = kk_flow.fillna(0)
-
-        return kk_flow
+        return df_relations, df_markets, df_cells[['id', 'kk']], setting
 
     def calc_competitors(self, masked_dist_matrix, df_markets):
         '''
         calculate competition between markets of the same brand
         '''
-        cutoff_dist = self.relation_dist
-        results = pd.DataFrame(data=1., index=masked_dist_matrix.index,
-                               columns=masked_dist_matrix.columns)
-        competing_markets = df_markets[['id_kette']]
-        for id_kette in np.unique(competing_markets['id_kette']):
-            markets_of_same_type = \
-                competing_markets[competing_markets['id_kette'] == id_kette]
-            if len(markets_of_same_type['id_kette']) == 1 or id_kette == 0:
-                continue
-            indices = list(markets_of_same_type.index)
-            same_type_dist_matrix = masked_dist_matrix[indices]
-            df_ranking = same_type_dist_matrix.rank(axis=1, method='first')
-            nearest_three_mask = df_ranking <= 3
-            df_ranking = df_ranking.mask((nearest_three_mask==False))
-            cutoff_dist_matrix = same_type_dist_matrix.copy()
-            cutoff_dist_matrix['Minimum'] = \
-                cutoff_dist_matrix.loc[:, indices].min(axis=1)
-            # differences between way to nearest market and other markets
-            # set all distances relative to nearest market
-            cutoff_dist_matrix = cutoff_dist_matrix.sub(
-                cutoff_dist_matrix['Minimum'], axis=0)
-            del cutoff_dist_matrix['Minimum']
-            cutoff_dist_matrix = cutoff_dist_matrix.mask(
-                (nearest_three_mask==False))
-            cutoff_dist_matrix =  cutoff_dist_matrix.round(2)
-            #is_near = cutoff_dist_matrix <= cutoff_dist
-            is_near = np.logical_or(cutoff_dist_matrix < cutoff_dist,
-                                    np.isclose(cutoff_dist_matrix, cutoff_dist))
-            df_ranking['Umkreis'] = is_near.sum(axis=1)
-            #same_type_dist_ranking['Abstand'] = \
-                #number_of_competing_markets - is_near['Umkreis']
-            for market_id in indices:
-                # note: is_near[market_id] indicates if market
-                #       is in 'Umkreis' (meaning is one of the nearest markets)
-                # write data for near markets with:
-                # -> 1 near market
-                factor = df_markets.loc[market_id]['ein_Markt_in_Naehe']
-                results.loc[np.logical_and(is_near[market_id]==True,
-                                           df_ranking['Umkreis']==1),
-                            market_id] = factor
-                # -> 2 near markets
-                factor = df_markets.loc[market_id]['zwei_Maerkte_in_Naehe']
-                results.loc[np.logical_and(is_near[market_id]==True,
-                                            df_ranking['Umkreis']==2),
-                            market_id] = factor
-                # -> more than 2 near markets
-                factor = df_markets.loc[market_id]['drei_Maerkte_in_Naehe']
-                results.loc[np.logical_and(is_near[market_id]==True,
-                                           df_ranking['Umkreis']==3),
-                            market_id] = factor
-                # write data for far markets with:
-                # -> market is far; 1 near market exists;
-                # market is closer than posible other far markets
-                factor = df_markets.loc[market_id]\
-                    ['zweiter_Markt_mit_Abstand_zum_ersten']
-                results.loc[np.logical_and(
-                    is_near[market_id]==False,
-                    np.logical_and(df_ranking['Umkreis']==1,
-                                   df_ranking[market_id]==2)),
-                            market_id] = factor
-                # -> market is far; 1 near market exists;
-                # another far market exists that is closer to cell
-                factor = df_markets.loc[market_id]\
-                    ['dritter_Markt_mit_Abstand_zum_ersten']
-                results.loc[np.logical_and(
-                    is_near[market_id]==False,
-                    np.logical_and(df_ranking['Umkreis']==1,
-                                   df_ranking[market_id]==3)),
-                            market_id] = factor
-                # -> market is far, 2 near markets
-                factor = df_markets.loc[market_id]\
-                    ['dritter_Markt_mit_Abstand_zum_ersten_und_zweiten']
-                results.loc[np.logical_and(is_near[market_id]==False,
-                                           df_ranking['Umkreis']==2),
-                            market_id] = factor
-            # if more than 3 markets: markets 4 to end set to 0
-            # if market 3 and 4 have same distance: keep both
-            results.loc[:, (indices)] = results.loc[:, indices].mask(
-                nearest_three_mask==False, 0.)
-        # Return results in shape of dist_matrix
-        res = results.T
-        return res
+        return calc_competitors(masked_dist_matrix, df_markets,
+                                cutoff_dist=self.relation_dist)
 
     def get_dist_matrix(self):
         '''
@@ -278,27 +151,13 @@ class Sales:
             if setting == self.NULLFALL else 'id_betriebstyp_planfall'
 
         # ignore markets that don't exist yet resp. are closed
-        ags = np.unique(df_markets['AGS'])
         df_markets = df_markets[df_markets[betriebstyp_col] != 0]
 
-        communities = self.basedata.get_table(
-            'bkg_gemeinden', 'Basisdaten_deutschland',
-            fields=['AGS', 'vwg_groessenklasse'])
-        communities.filter(AGS__in=list(ags))
-        df_communities = communities.to_pandas()
-
         # add groessenklassen to markets
-        df_markets = df_markets.merge(df_communities, on='AGS')
-
-        # dataframe for exponential parameters
-        df_exponential_parameters = self.basedata.get_table(
-            'Exponentialfaktoren', 'Standortkonkurrenz_Supermaerkte',
-            fields=['gem_groessenklasse', 'id_kette', 'id_betriebstyp',
-                    'exponent', 'exp_faktor']).to_pandas()
+        df_markets = df_markets.merge(self.df_communities, on='AGS')
 
-        df_attractivity_factors = self.basedata.get_table(
-            'Attraktivitaetsfaktoren', 'Standortkonkurrenz_Supermaerkte'
-            ).to_pandas()
+        df_exponential_parameters = self.df_exponential_parameters
+        df_attractivity_factors = self.df_attractivity_factors
 
         attractivity_cols = ['ein_Markt_in_Naehe', 'zwei_Maerkte_in_Naehe',
                              'drei_Maerkte_in_Naehe',
@@ -351,7 +210,195 @@ class Sales:
         return df_markets
 
 
-
-
-
-
+def calculate_sales(df_relations, df_markets, df_cells, setting):
+    '''
+    calculate the sales of the markets, takes only the data needed for the
+    calculation (see Sales.sales_input()) to be passed to other processes
+    cheaply
+
+    Parameters
+    ----------
+    df_relations : Dataframe
+        distances and beelines between the markets and the settlement cells
+    df_markets : Dataframe
+        the markets of the setting with their parameters, indexed by id
+    df_cells : Dataframe
+        ids and purchase power of the settlement cells of the setting
+    setting : int
+        Sales.NULLFALL or Sales.PLANFALL
+
+    Returns
+    -------
+    Dataframe
+        dataframe containing purchase power flows between markets and cells
+    '''
+    # easiest way to distinguish same distances by adding
+    # normed bee-lines
+    beelines = df_relations['luftlinie']
+    beelines[df_relations['distanz'] == -1] = -1
+    beelines_norm = beelines / beelines.max()
+    df_relations['distanz'] += beelines_norm
+
+    # calc with distances in kilometers
+    df_relations['distanz'] /= 1000
+    n_idx = df_relations['distanz'] < 0
+    df_relations['distanz'][n_idx] = -1
+
+    df_kk = pd.DataFrame()
+    df_kk['id_siedlungszelle'] = df_cells['id']
+    df_kk['kk'] = df_cells['kk']
+    kk_merged = df_relations.merge(df_kk, on='id_siedlungszelle')
+
+    kk_matrix = kk_merged.pivot(index='id_markt',
+                                columns='id_siedlungszelle',
+                                values='kk')
+
+    dist_matrix = kk_merged.pivot(index='id_markt',
+                                  columns='id_siedlungszelle',
+                                  values='distanz')
+    dist_matrix = dist_matrix.fillna(0)
+
+    attraction_matrix = pd.DataFrame(data=np.zeros(dist_matrix.shape),
+                                     index=dist_matrix.index,
+                                     columns=dist_matrix.columns)
+
+    for index, market in df_markets.iterrows():
+        dist = dist_matrix.loc[index]
+        factor = market['exp_faktor']
+        exponent = market['exponent']
+        attraction_matrix.loc[index] = factor * np.exp(dist * exponent)
+
+    unreachable = dist_matrix < 0
+    attraction_matrix[unreachable] = 0
+    report(progress=50)
+    betriebstyp_col = 'id_betriebstyp_nullfall' \
+        if setting == Sales.NULLFALL else 'id_betriebstyp_planfall'
+
+    masked_dist_matrix = dist_matrix.T
+    masked_dist_matrix = masked_dist_matrix.mask(masked_dist_matrix < 0)
+
+    # local providers
+    # no real competition, but only closest three per cell (copy/paste from
+    # calc_competitors, had no time seperate implementation)
+    is_lp = df_markets[betriebstyp_col] == 1
+    local_markets = df_markets[is_lp]
+    local_masked_dist = masked_dist_matrix[local_markets.index]
+    df_ranking = local_masked_dist.rank(axis=1, method='first')
+    local_comp_matrix = pd.DataFrame(data=0, index=df_ranking.index,
+                                     columns=df_ranking.columns)
+    local_comp_matrix[df_ranking <= 3] = 1
+    local_comp_matrix[np.isnan(df_ranking)] = 0
+    local_comp_matrix = local_comp_matrix.T
+
+    # small markets
+    is_sm = df_markets[betriebstyp_col] == 2
+    small_markets = df_markets[is_sm]
+    small_comp_matrix = calc_competitors(masked_dist_matrix, small_markets)
+
+    # big markets
+    big_markets = df_markets[df_markets[betriebstyp_col] > 2]
+    big_comp_matrix = calc_competitors(masked_dist_matrix, big_markets)
+
+    # merge
+    big_comp_matrix.loc[is_lp] = local_comp_matrix
+    big_comp_matrix.loc[is_sm] = small_comp_matrix.loc[is_sm]
+
+    competitor_matrix = big_comp_matrix
+    competitor_matrix[dist_matrix < 0] = 0
+
+    # include competition between same market types in attraction_matrix
+    attraction_matrix *= competitor_matrix.values
+
+    probabilities = attraction_matrix / attraction_matrix.sum(axis=0)
+    kk_flow = probabilities * kk_matrix
+    kk_flow = kk_flow.fillna(0)
+
+    return kk_flow
+
+
+def calc_competitors(masked_dist_matrix, df_markets,
+                     cutoff_dist=Sales.relation_dist):
+    '''
+    calculate competition between markets of the same brand
+    '''
+    results = pd.DataFrame(data=1., index=masked_dist_matrix.index,
+                           columns=masked_dist_matrix.columns)
+    competing_markets = df_markets[['id_kette']]
+    for id_kette in np.unique(competing_markets['id_kette']):
+        markets_of_same_type = \
+            competing_markets[competing_markets['id_kette'] == id_kette]
+        if len(markets_of_same_type['id_kette']) == 1 or id_kette == 0:
+            continue
+        indices = list(markets_of_same_type.index)
+        same_type_dist_matrix = masked_dist_matrix[indices]
+        df_ranking = same_type_dist_matrix.rank(axis=1, method='first')
+        nearest_three_mask = df_ranking <= 3
+        df_ranking = df_ranking.mask((nearest_three_mask==False))
+        cutoff_dist_matrix = same_type_dist_matrix.copy()
+        cutoff_dist_matrix['Minimum'] = \
+            cutoff_dist_matrix.loc[:, indices].min(axis=1)
+        # differences between way to nearest market and other markets
+        # set all distances relative to nearest market
+        cutoff_dist_matrix = cutoff_dist_matrix.sub(
+            cutoff_dist_matrix['Minimum'], axis=0)
+        del cutoff_dist_matrix['Minimum']
+        cutoff_dist_matrix = cutoff_dist_matrix.mask(
+            (nearest_three_mask==False))
+        cutoff_dist_matrix =  cutoff_dist_matrix.round(2)
+        #is_near = cutoff_dist_matrix <= cutoff_dist
+        is_near = np.logical_or(cutoff_dist_matrix < cutoff_dist,
+                                np.isclose(cutoff_dist_matrix, cutoff_dist))
+        df_ranking['Umkreis'] = is_near.sum(axis=1)
+        #same_type_dist_ranking['Abstand'] = \
+            #number_of_competing_markets - is_near['Umkreis']
+        for market_id in indices:
+            # note: is_near[market_id] indicates if market
+            #       is in 'Umkreis' (meaning is one of the nearest markets)
+            # write data for near markets with:
+            # -> 1 near market
+            factor = df_markets.loc[market_id]['ein_Markt_in_Naehe']
+            results.loc[np.logical_and(is_near[market_id]==True,
+                                       df_ranking['Umkreis']==1),
+                        market_id] = factor
+            # -> 2 near markets
+            factor = df_markets.loc[market_id]['zwei_Maerkte_in_Naehe']
+            results.loc[np.logical_and(is_near[market_id]==True,
+                                        df_ranking['Umkreis']==2),
+                        market_id] = factor
+            # -> more than 2 near markets
+            factor = df_markets.loc[market_id]['drei_Maerkte_in_Naehe']
+            results.loc[np.logical_and(is_near[market_id]==True,
+                                       df_ranking['Umkreis']==3),
+                        market_id] = factor
+            # write data for far markets with:
+            # -> market is far; 1 near market exists;
+            # market is closer than posible other far markets
+            factor = df_markets.loc[market_id]\
+                ['zweiter_Markt_mit_Abstand_zum_ersten']
+            results.loc[np.logical_and(
+                is_near[market_id]==False,
+                np.logical_and(df_ranking['Umkreis']==1,
+                               df_ranking[market_id]==2)),
+                        market_id] = factor
+            # -> market is far; 1 near market exists;
+            # another far market exists that is closer to cell
+            factor = df_markets.loc[market_id]\
+                ['dritter_Markt_mit_Abstand_zum_ersten']
+            results.loc[np.logical_and(
+                is_near[market_id]==False,
+                np.logical_and(df_ranking['Umkreis']==1,
+                               df_ranking[market_id]==3)),
+                        market_id] = factor
+            # -> market is far, 2 near markets
+            factor = df_markets.loc[market_id]\
+                ['dritter_Markt_mit_Abstand_zum_ersten_und_zweiten']
+            results.loc[np.logical_and(is_near[market_id]==False,
+                                       df_ranking['Umkreis']==2),
+                        market_id] = factor
+        # if more than 3 markets: markets 4 to end set to 0
+        # if market 3 and 4 have same distance: keep both
+        results.loc[:, (indices)] = results.loc[:, indices].mask(
+            nearest_three_mask==False, 0.)
+    # Return results in shape of dist_matrix
+    res = results.T
+    return res
@@ -22,19 +22,16 @@ __author__ = 'Christoph Franke'
 __date__ = '18/05/2020'
 __copyright__ = 'Copyright 2020, HafenCity University Hamburg'
 
-import processing
 import os
-from qgis.core import (QgsRasterLayer, QgsVectorLayer, QgsFeature,
-                       QgsVectorFileWriter, QgsField)
-from qgis.PyQt.QtCore import QVariant
 
-from projektcheck.utils.spatial import create_layer
 from projektcheck.domains.definitions.tables import (Teilflaechen,
                                                           Projektrahmendaten)
 from projektcheck.domains.municipaltaxrevenue.tables import (
-    Gemeindebilanzen, EinwohnerWanderung, BeschaeftigtenWanderung)
+    Gemeindebilanzen, EinwohnerWanderung, BeschaeftigtenWanderung,
+    ZensusRinge)
 from projektcheck.base.domain import Worker
-from projektcheck.utils.spatial import clip_raster, get_bbox
+from projektcheck.utils.spatial import (clip_raster, get_bbox, read_raster,
+                                        rasterize, transform_coords)
 import pandas as pd
 import numpy as np
 
@@ -59,22 +56,19 @@ class MigrationCalculation(Worker):
         self.project = project
         self.areas = Teilflaechen.features(project=project)
         self.gemeinden = Gemeindebilanzen.features(project=project)
-        self.zensus_layer = QgsVectorLayer(f'{self.gemeinden.workspace.path}'
-                            '|layername=zensus_rings')
+        self.zensus_rings = ZensusRinge.features(project=project, create=True)
         self.project_frame = Projektrahmendaten.features()[0]
 
     def work(self):
-        if not self.zensus_layer.isValid() or len(self.zensus_layer) == 0:
-            self.zensus_layer = self.create_zensus_rings()
+        if len(self.zensus_rings) == 0:
+            self.create_zensus_rings()
         else:
             self.log('Siedlungszellen bereits vorhanden, '
                      'Berechnung wird übersprungen')
         self.set_progress(40)
         self.log('Berechne Wanderungsanteile...')
         self.wanderung.table.truncate()
-        columns = [f.name() for f in self.zensus_layer.fields()]
-        rows = [f.attributes() for f in self.zensus_layer.getFeatures()]
-        df_zensus = pd.DataFrame.from_records(rows, columns=columns)
+        df_zensus = self.zensus_rings.to_pandas(columns=['AGS', 'ring', 'ew'])
 
         # append empty gemeinden with no settlement cells but in radius
         missing = np.setdiff1d(self.gemeinden.values('ags'),
@@ -124,7 +118,8 @@ class MigrationCalculation(Worker):
 
     def create_zensus_rings(self):
         '''
-        intersect study area with zensus raster
+        sum up the inhabitants of the zensus cells in the study area per
+        community and distance ring around the project
         '''
         self.log('Extrahiere Siedlungszellen aus Zensusdaten...')
         epsg = self.project.settings.EPSG
@@ -133,98 +128,53 @@ class MigrationCalculation(Worker):
 
         bbox = get_bbox(self.gemeinden.table)
         clipped_raster, raster_epsg = clip_raster(zensus_file, bbox)
+        values, geotransform, raster_epsg = read_raster(clipped_raster)
 
-        raster_layer = QgsRasterLayer(clipped_raster)
-
-        parameters = {
-            'INPUT_RASTER':raster_layer,
-            'RASTER_BAND': 1,
-            'FIELD_NAME': 'ew',
-            'OUTPUT': 'memory:'
-        }
-
-        point_layer = processing.run(
-            'native:pixelstopoints', parameters)['OUTPUT']
-        point_layer.setSubsetString('ew>0')
-
-        parameters = {
-            'INPUT': point_layer,
-            'TARGET_CRS': f'EPSG:{epsg}',
-            'OUTPUT': 'memory:'
-        }
-
-        point_proj = processing.run(
-            'native:reprojectlayer', parameters)['OUTPUT']
-
-        # clip with max distance from project area
-        buffer_geom = self.project_frame.geom.buffer(self.rings[-1], 100)
-        buffer = QgsFeature()
-        buffer.setGeometry(buffer_geom)
-        overlay = QgsVectorLayer(f'Polygon?crs=EPSG:{epsg}',
-                                 'buffer', 'memory')
-        overlay.dataProvider().addFeature(buffer)
-        parameters = {
-            'INPUT': point_proj,
-            'OVERLAY': overlay,
-            'OUTPUT': 'memory:'
-        }
-        clipped_layer = processing.run('native:clip', parameters)['OUTPUT']
-
-        # intersect with rings to get distance bin
-        ring_layer = QgsVectorLayer(f'Polygon?crs=EPSG:{epsg}', 'rings',
-                                    'memory')
-        pr = ring_layer.dataProvider()
-        pr.addAttributes([QgsField('ring', QVariant.Int)])
-        ring_layer.updateFields()
-        prev_outer_circle = None
-        for distance in self.rings:
-            ring = QgsFeature()
-            outer_circle = self.project_frame.geom.buffer(distance, 100)
-            if prev_outer_circle is not None:
-                geom = outer_circle.difference(prev_outer_circle)
-            else:
-                geom = outer_circle
-            prev_outer_circle = outer_circle
-            ring.setGeometry(geom)
-            ring.setAttributes([distance])
-            pr.addFeature(ring)
+        # centers of the settlement cells
+        rows, cols = np.nonzero(values > 0)
+        ew = values[rows, cols].astype(float)
+        ulx, xres, xskew, uly, yskew, yres = geotransform
+        x = ulx + (cols + 0.5) * xres
+        y = uly + (rows + 0.5) * yres
+        x, y = transform_coords(x, y, raster_epsg, epsg)
 
         self.log('Verschneide Siedlungszellen mit Entfernungsringen '
                  'und Gemeinden...')
-        parameters = {
-            'INPUT': clipped_layer,
-            'OVERLAY': ring_layer,
-            'OUTPUT': 'memory:'
-        }
-        clipped_w_distance = processing.run(
-            'native:intersection', parameters)['OUTPUT']
-
-        # intersect with "gemeinden" to add AGS to cells
-        gem_overlay = create_layer(self.gemeinden, 'Polygon',
-                                   fields=['AGS'],
-                                   name='overlay', epsg=epsg)
-        parameters = {
-            'INPUT': clipped_w_distance,
-            'OVERLAY': gem_overlay,
-            'OUTPUT': 'memory:'
-        }
-        clipped_w_ags = processing.run(
-            'native:intersection', parameters)['OUTPUT']
-
-        options = QgsVectorFileWriter.SaveVectorOptions()
-        options.actionOnExistingFile = \
-            QgsVectorFileWriter.CreateOrOverwriteLayer
-        options.layerName = 'zensus_rings'
-        QgsVectorFileWriter.writeAsVectorFormat(
-            clipped_w_ags, self.gemeinden.workspace.path, options)
-
-        return clipped_w_ags
+        # distance bin (the outer radius of the ring) of each cell, cells
+        # outside the outer ring are dropped
+        center = self.project_frame.geom.asPoint()
+        distances = np.hypot(x - center.x(), y - center.y())
+        ring_idx = np.searchsorted(self.rings, distances)
+        in_rings = ring_idx < len(self.rings)
+
+        # community of each cell by rasterizing the communities onto the grid
+        # of the zensus raster
+        gemeinden = list(self.gemeinden)
+        gem_idx = rasterize([g.geom for g in gemeinden], geotransform,
+                            values.shape, epsg, raster_epsg=raster_epsg)
+        gem_idx = gem_idx[rows, cols]
+        valid = in_rings & (gem_idx >= 0)
+
+        ags = np.array([g.AGS for g in gemeinden], dtype=object)
+        df_cells = pd.DataFrame({
+            'AGS': ags[gem_idx[valid]],
+            'ring': np.array(self.rings)[ring_idx[valid]],
+            'ew': ew[valid],
+        })
+        df_rings = df_cells.groupby(['AGS', 'ring'], as_index=False)['ew'].sum()
+        self.zensus_rings.delete()
+        self.zensus_rings.update_pandas(df_rings)
+        return df_rings
 
 
 class EwMigrationCalculation(MigrationCalculation):
     '''
     calculation of migration of inhabitants
     '''
+    inputs = [Teilflaechen, Gemeindebilanzen, Projektrahmendaten, ZensusRinge,
+              'Einnahmen']
+    outputs = [ZensusRinge, EinwohnerWanderung]
+
     def __init__(self, project, parent=None):
         '''
         Parameters
@@ -273,6 +223,10 @@ class SvBMigrationCalculation(MigrationCalculation):
     calculation of migration of jobs
     '''
 
+    inputs = [Teilflaechen, Gemeindebilanzen, Projektrahmendaten, ZensusRinge,
+              'Einnahmen']
+    outputs = [ZensusRinge, BeschaeftigtenWanderung]
+
     def __init__(self, project, parent=None):
         '''
         Parameters
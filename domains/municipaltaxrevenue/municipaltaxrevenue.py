@@ -39,7 +39,7 @@ from projektcheck.domains.municipaltaxrevenue.migration import (
     EwMigrationCalculation, SvBMigrationCalculation, MigrationCalculation)
 from projektcheck.domains.municipaltaxrevenue.tax import (
     GrundsteuerCalculation, EinkommensteuerCalculation,
-    FamAusgleichCalculation, GewerbesteuerCalculation)
+    FamAusgleichCalculation, GewerbesteuerCalculation, round_tax)
 from projektcheck.domains.definitions.tables import (
     Projektrahmendaten, Teilflaechen)
 from projektcheck.domains.constants import Nutzungsart
@@ -919,14 +919,15 @@ class MunicipalTaxRevenue(Domain):
             'USt_Kennwerte', 'Einnahmen').features()[0]
         factor_gst = ust_base.GemAnt_USt_EUR_pro_EUR_GewSt
         factor_svb = ust_base.GemANt_USt_EUR_pro_SvB
-        for gem in self.gemeinden:
-            wanderung = self.migration_svb.wanderung.get(AGS=gem.AGS)
-            saldo = wanderung.saldo if wanderung else 0
-            ust = factor_gst * gem.gewerbesteuer + factor_svb * saldo
-            rnd = 1000 if ust >= 500 else 100
-            ust = round(ust/rnd) * rnd
-            gem.umsatzsteuer = ust
-            gem.save()
+        df_wanderung = self.migration_svb.wanderung.to_pandas(
+            columns=['AGS', 'saldo']).set_index('AGS')
+        df_bilanzen = self.gemeinden.to_pandas(
+            columns=['fid', 'AGS', 'gewerbesteuer'])
+        saldo = df_bilanzen['AGS'].map(df_wanderung['saldo']).fillna(0)
+        ust = (factor_gst * df_bilanzen['gewerbesteuer'].fillna(0) +
+               factor_svb * saldo)
+        df_bilanzen['umsatzsteuer'] = round_tax(ust, absolute=False)
+        self.gemeinden.update_pandas(df_bilanzen[['fid', 'umsatzsteuer']])
         self.reset_results(fields=['summe_einnahmen'])
         self.add_ust_layer()
 
@@ -951,11 +952,12 @@ class MunicipalTaxRevenue(Domain):
                 'Bitte führen Sie zunächst die Schätzung der Umsatzsteuer '
                 'durch.')
             return
-        for gem in self.gemeinden:
-            gem.summe_einnahmen = (gem.grundsteuer + gem.einkommensteuer +
-                                   gem.gewerbesteuer + gem.umsatzsteuer +
-                                   gem.fam_leistungs_ausgleich)
-            gem.save()
+        tax_fields = ['grundsteuer', 'einkommensteuer', 'gewerbesteuer',
+                      'umsatzsteuer', 'fam_leistungs_ausgleich']
+        df_bilanzen = self.gemeinden.to_pandas(columns=['fid'] + tax_fields)
+        df_bilanzen['summe_einnahmen'] = df_bilanzen[tax_fields].sum(
+            axis=1).astype(int)
+        self.gemeinden.update_pandas(df_bilanzen[['fid', 'summe_einnahmen']])
         self.add_gesamt_layer()
 
     def add_est_layer(self):
@@ -1023,7 +1025,8 @@ class MunicipalTaxRevenue(Domain):
         remove the results and layers
         '''
         bilanzen = Gemeindebilanzen.features(create=True)
-        df_bilanzen = bilanzen.to_pandas()
+        # only the ids are needed to reset the fields
+        df_bilanzen = bilanzen.to_pandas(columns=['fid'])
         for field in fields:
             df_bilanzen[field] = None
         bilanzen.update_pandas(df_bilanzen)
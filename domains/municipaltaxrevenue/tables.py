@@ -74,6 +74,15 @@ class BeschaeftigtenWanderung(ProjectTable):
         workspace = 'einnahmen'
 
 
+class ZensusRinge(ProjectTable):
+    AGS = Field(str, '')
+    ring = Field(int, 0)
+    ew = Field(float, 0)
+
+    class Meta:
+        workspace = 'einnahmen'
+
+
 class GrundsteuerSettings(ProjectTable):
     Hebesatz_GrStB = Field(int, 0)
     EFH_Rohmiete = Field(int, 0)
@@ -22,6 +22,8 @@ __author__ = 'Christoph Franke'
 __date__ = '22/05/2020'
 __copyright__ = 'Copyright 2020, HafenCity University Hamburg'
 
+import numpy as np
+
 from projektcheck.domains.definitions.tables import (
     Teilflaechen, Projektrahmendaten, Gewerbeanteile, Verkaufsflaechen)
 from projektcheck.domains.municipaltaxrevenue.tables import (
@@ -32,6 +34,29 @@ from projektcheck.domains.definitions.tables import Wohneinheiten
 from projektcheck.base.domain import Worker
 
 
+def round_tax(values, absolute=True):
+    '''
+    round tax values to thousands (values of 500 and more) or to hundreds
+
+    Parameters
+    ----------
+    values : array-like
+        the tax values
+    absolute : bool, optional
+        compare the absolute values to 500 if True, the signed ones otherwise,
+        defaults to absolute values
+
+    Returns
+    -------
+    np.ndarray
+        rounded values as integers
+    '''
+    values = np.asarray(values, dtype=float)
+    ref = np.abs(values) if absolute else values
+    rnd = np.where(ref >= 500, 1000, 100)
+    return (np.round(values / rnd) * rnd).astype(int)
+
+
 class GrundsteuerCalculation(Worker):
     '''
     calculation of property tax
@@ -45,6 +70,10 @@ class GrundsteuerCalculation(Worker):
         4: 'MFH'
     }
 
+    inputs = [Gemeindebilanzen, GrundsteuerSettings, Projektrahmendaten,
+              Wohneinheiten, 'Einnahmen', 'Basisdaten_deutschland']
+    outputs = [Gemeindebilanzen]
+
     def __init__(self, project, parent=None):
         '''
         Parameters
@@ -65,16 +94,14 @@ class GrundsteuerCalculation(Worker):
         messbetrag_wohnen = self.calc_messbetrag_wohnen(
             self.grst_settings.is_new_bundesland)
         messbetrag_gewerbe = self.calc_messbetrag_gewerbe()
-        for gem in self.bilanzen:
-            if gem.AGS == self.project_frame.ags:
-                gst = ((messbetrag_wohnen + messbetrag_gewerbe) *
-                       self.grst_settings.Hebesatz_GrStB / 100)
-                rnd = 1000 if gst >= 500 else 100
-                gst = round(gst/rnd) * rnd
-            else:
-                gst = 0
-            gem.grundsteuer = gst
-            gem.save()
+        gst = ((messbetrag_wohnen + messbetrag_gewerbe) *
+               self.grst_settings.Hebesatz_GrStB / 100)
+        df_bilanzen = self.bilanzen.to_pandas(columns=['fid', 'AGS'])
+        # only the municipality of the project gets the property tax
+        df_bilanzen['grundsteuer'] = np.where(
+            df_bilanzen['AGS'] == self.project_frame.ags,
+            round_tax(gst, absolute=False), 0)
+        self.bilanzen.update_pandas(df_bilanzen[['fid', 'grundsteuer']])
         return True
 
     def calc_messbetrag_wohnen(self, is_new_bl):
@@ -135,6 +162,10 @@ class EinkommensteuerCalculation(Worker):
     '''
     calculation of income tax
     '''
+    inputs = [Gemeindebilanzen, EinwohnerWanderung, Projektrahmendaten,
+              Wohneinheiten, 'Einnahmen']
+    outputs = [Gemeindebilanzen]
+
     def __init__(self, project, parent=None):
         '''
         Parameters
@@ -165,19 +196,16 @@ class EinkommensteuerCalculation(Worker):
                 self.we.filter(id_gebaeudetyp=geb_typ_id).values('we'))
             est = anzahl_we * est_pro_we_geb_typ.ESt_pro_WE
             est_gesamt += est
-        project_gem = self.wanderung.get(AGS=self.project_frame.ags)
-        est_pro_ew = est_gesamt / project_gem.zuzug
+        df_wanderung = self.wanderung.to_pandas(
+            columns=['AGS', 'zuzug', 'saldo']).set_index('AGS')
+        est_pro_ew = est_gesamt / df_wanderung.loc[
+            self.project_frame.ags, 'zuzug']
 
-        for gem in self.bilanzen:
-            wanderung = self.wanderung.get(AGS=gem.AGS)
-            if not wanderung:
-                est = 0
-            else:
-                est = est_pro_ew * wanderung.saldo
-                rnd = 1000 if abs(est) >= 500 else 100
-                est = round(est/rnd) * rnd
-            gem.einkommensteuer = est
-            gem.save()
+        df_bilanzen = self.bilanzen.to_pandas(columns=['fid', 'AGS'])
+        # municipalities without migration get no income tax
+        saldo = df_bilanzen['AGS'].map(df_wanderung['saldo']).fillna(0)
+        df_bilanzen['einkommensteuer'] = round_tax(est_pro_ew * saldo)
+        self.bilanzen.update_pandas(df_bilanzen[['fid', 'einkommensteuer']])
 
         return True
 
@@ -186,6 +214,9 @@ class FamAusgleichCalculation(Worker):
     '''
     calculation of family compensation
     '''
+    inputs = [Gemeindebilanzen, Projektrahmendaten, 'Einnahmen']
+    outputs = [Gemeindebilanzen]
+
     def __init__(self, project, parent=None):
         '''
         Parameters
@@ -207,12 +238,12 @@ class FamAusgleichCalculation(Worker):
                 AGS_Land=self.project_frame.ags[:2]
             ).FLA_Faktor
 
-        for gem in self.bilanzen:
-            fla = gem.einkommensteuer * fla_factor
-            rnd = 1000 if abs(fla) >= 500 else 100
-            fla = round(fla/rnd) * rnd
-            gem.fam_leistungs_ausgleich = fla
-            gem.save()
+        df_bilanzen = self.bilanzen.to_pandas(
+            columns=['fid', 'einkommensteuer'])
+        df_bilanzen['fam_leistungs_ausgleich'] = round_tax(
+            df_bilanzen['einkommensteuer'].fillna(0) * fla_factor)
+        self.bilanzen.update_pandas(
+            df_bilanzen[['fid', 'fam_leistungs_ausgleich']])
 
         return True
 
@@ -221,6 +252,10 @@ class GewerbesteuerCalculation(Worker):
     '''
     calculation of business tax
     '''
+    inputs = [Gemeindebilanzen, BeschaeftigtenWanderung, Projektrahmendaten,
+              Teilflaechen, Gewerbeanteile, Verkaufsflaechen, 'Einnahmen']
+    outputs = [Gemeindebilanzen]
+
     def __init__(self, project, parent=None):
         '''
         Parameters
@@ -245,25 +280,29 @@ class GewerbesteuerCalculation(Worker):
         messbetrag_eh, svb_eh = self.calc_messbetrag_einzelhandel()
         messbetrag_pro_svb = (messbetrag_g + messbetrag_eh) / (svb_g + svb_eh)
 
-        for gem in self.bilanzen:
-            wanderung = self.wanderung.get(AGS=gem.AGS)
-            bvv_plus_lvv_plus_ehz = self.project.basedata.get_table(
-                'GewSt_Umlage_Vervielfaeltiger', 'Einnahmen').features().get(
-                    AGS_Land=gem.AGS[:2]
-                ).Summe_BVV_LVV_EHZ
-
-            if not wanderung:
-                gst = 0
-            else:
-                saldo = wanderung.saldo
-                if gem.AGS == self.project_frame.ags:
-                    saldo += svb_eh
-                gst = (messbetrag_pro_svb * gem.Hebesatz_GewSt / 100 * saldo *
-                       (1 - bvv_plus_lvv_plus_ehz / gem.Hebesatz_GewSt))
-                rnd = 1000 if gst >= 500 else 100
-                gst = round(gst/rnd) * rnd
-            gem.gewerbesteuer = gst
-            gem.save()
+        df_umlage = self.project.basedata.get_table(
+            'GewSt_Umlage_Vervielfaeltiger', 'Einnahmen').to_pandas(
+                columns=['AGS_Land', 'Summe_BVV_LVV_EHZ'])
+        bvv_plus_lvv_plus_ehz = df_umlage.set_index(
+            'AGS_Land')['Summe_BVV_LVV_EHZ']
+        df_wanderung = self.wanderung.to_pandas(
+            columns=['AGS', 'saldo']).set_index('AGS')
+
+        df_bilanzen = self.bilanzen.to_pandas(
+            columns=['fid', 'AGS', 'Hebesatz_GewSt'])
+        saldo = df_bilanzen['AGS'].map(df_wanderung['saldo'])
+        # municipalities without migration get no business tax
+        has_wanderung = saldo.notna().values
+        saldo = saldo.fillna(0) + np.where(
+            df_bilanzen['AGS'] == self.project_frame.ags, svb_eh, 0)
+        hebesatz = df_bilanzen['Hebesatz_GewSt'].values
+        umlage = df_bilanzen['AGS'].str[:2].map(bvv_plus_lvv_plus_ehz).values
+        gst = np.zeros(len(df_bilanzen))
+        gst[has_wanderung] = (
+            messbetrag_pro_svb * hebesatz / 100 * saldo.values *
+            (1 - umlage / hebesatz))[has_wanderung]
+        df_bilanzen['gewerbesteuer'] = round_tax(gst, absolute=False)
+        self.bilanzen.update_pandas(df_bilanzen[['fid', 'gewerbesteuer']])
 
         return True
 
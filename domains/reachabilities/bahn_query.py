@@ -23,7 +23,6 @@ __date__ = '29/10/2019'
 __copyright__ = 'Copyright 2019, HafenCity University Hamburg'
 
 import datetime
-from time import sleep
 import re
 from lxml import html
 import numpy as np
@@ -32,14 +31,15 @@ from datetime import datetime, date, timedelta
 
 from projektcheck.utils.spatial import Point
 from projektcheck.base.domain import Worker
-from projektcheck.utils.connection import Request
+from projektcheck.utils.connection import (Request, RequestScheduler,
+                                          RetryRequest, get_cache)
 from projektcheck.domains.definitions.tables import Projektrahmendaten
 from projektcheck.utils.spatial import points_within, Point
 from projektcheck.base.project import ProjectManager
 from projektcheck.settings import settings
 from .tables import Haltestellen, ZentraleOrte, ErreichbarkeitenOEPNV
 
-requests = Request(synchronous=True)
+requests = Request(synchronous=True, cache=get_cache())
 
 
 class Stop(Point):
@@ -103,19 +103,25 @@ class BahnQuery(object):
 
     date_pattern = '%d.%m.%Y'
 
-    def __init__(self, date=None, timeout=0):
+    # requests to the DB website of all queries are sharing this scheduler to
+    # avoid being blocked due to too many requests
+    scheduler = RequestScheduler(rate=2, burst=2, max_workers=4,
+                                 max_retries=2, backoff=2)
+
+    def __init__(self, date=None, scheduler=None):
         '''
         Parameters
         ----------
         date : datetime.date, optional
             date to scrape data for, defaults to today
-        timeout : int, optional
-            pause between requests in seconds to avoid block due to too many
-            requests, defaults to no pause
+        scheduler : RequestScheduler, optional
+            scheduler limiting the rate and concurrency of the requests,
+            defaults to the scheduler shared by all queries
         '''
         date = date or datetime.date.today()
         self.date = date.strftime(self.date_pattern)
-        self.timeout = timeout
+        if scheduler:
+            self.scheduler = scheduler
 
     def _to_db_coord(self, c):
         return ("%.6f" % c).replace('.','')
@@ -151,7 +157,7 @@ class BahnQuery(object):
         params['look_x'] = self._to_db_coord(x)
         params['look_y'] = self._to_db_coord(y)
 
-        r = requests.get(self.mobile_url, params=params, verify=False)
+        r = self._get(self.mobile_url, params)
 
         root = html.fromstring(r.content)
         rows = root.xpath('//a[@class="uLine"]')
@@ -184,7 +190,14 @@ class BahnQuery(object):
 
         return stops
 
-    def routing(self, origin_name, destination_name, times, max_retries=1):
+    def _get(self, url, params):
+        '''
+        GET-request respecting the limits of the scheduler
+        '''
+        return self.scheduler.call(requests.get, url, params=params,
+                                   verify=False)
+
+    def routing(self, origin_name, destination_name, times):
         '''
         scrape fastest connection by public transport between origin and
         destination
@@ -197,9 +210,6 @@ class BahnQuery(object):
             address or station name to arrive at
         times : list of int or list of str
             departure times (e.g. [14, 15, 16] or [14:00, 15:00, 16:00])
-        max_retries : int
-            maximum number of retries per time slot if DB api is returning
-            valid results
 
         Returns
         -------
@@ -207,79 +217,110 @@ class BahnQuery(object):
             duration in minutes, departure time as text, number of changes,
             modes as text
         '''
-        params = self.reiseauskunft_params.copy()
-        params['date'] = self.date
-        params['S'] = origin_name
-        params['Z'] = destination_name
+        return self.routings([(origin_name, destination_name)], times)[0]
 
-        duration = float("inf")
-        departure = mode = ''
-        changes = 0
+    def routings(self, connections, times, callback=None):
+        '''
+        scrape fastest connections by public transport between multiple
+        origins and destinations, the departure tables of all connections and
+        time slots are requested concurrently
 
-        def request_departure_table(time):
+        Parameters
+        ----------
+        connections : list of tuple
+            pairs of addresses or station names to depart from and to arrive at
+        times : list of int or list of str
+            departure times (e.g. [14, 15, 16] or [14:00, 15:00, 16:00])
+        callback : function, optional
+            called each time a departure table is done with the number of
+            done tables and the total number of tables
+
+        Returns
+        -------
+        list
+            per connection a tuple with the duration in minutes, departure time
+            as text, number of changes and modes as text
+        '''
+        def request_departure_table(origin_name, destination_name, time):
+            params = self.reiseauskunft_params.copy()
+            params['date'] = self.date
+            params['S'] = origin_name
+            params['Z'] = destination_name
             params['time'] = time
             r = requests.get(self.reiseauskunft_url, params=params,
                              verify=False)
             root = html.fromstring(r.content)
             try:
-                table = root.get_element_by_id('resultsOverview')
-                return table
+                return root.get_element_by_id('resultsOverview')
+            # no valid response -> try again
+            # (may be caused by too many requests)
             except KeyError:
-                pass
-            return None
-
-        for time in times:
-            retries = 0
-            while retries <= max_retries:
-                table = request_departure_table(time)
-                # response contains departures
-                if table:
-                    break
-                # no valid response -> wait and try again
-                # (may be caused by too many requests)
-                else:
-                    sleep(2)
-                print('retry')
-                retries += 1
-
-            # still no table -> skip
-            if not table:
-                print('skip')
-                continue
-
-            rows = table.xpath('//tr[@class="firstrow"]')
+                raise RetryRequest()
 
-            for row in rows:
-                # duration
-                content = row.find_class('duration')
-                h, m = content[0].text.replace('\n', '').split(':')
-                d = int(h) * 60 + int(m)
-                # if already found shorter duration -> skip
-                if d >= duration:
-                    continue
-                duration = d
+        def fastest(job):
+            try:
+                table = self.scheduler.call(request_departure_table, *job)
+            # still no table -> skip the time slot
+            except RetryRequest:
+                return
+            return self._parse_departure_table(table)
+
+        jobs = [(origin, destination, time)
+                for origin, destination in connections for time in times]
+        results = self.scheduler.map(fastest, jobs, callback=callback)
+
+        fastest_connections = []
+        n_times = len(times)
+        for i in range(len(connections)):
+            duration = float("inf")
+            departure = mode = ''
+            changes = 0
+            # keep the earliest time slot of equally fast connections
+            for result in results[i * n_times: (i + 1) * n_times]:
+                if result and result[0] < duration:
+                    duration, departure, changes, mode = result
+            fastest_connections.append((duration, departure, changes, mode))
+        return fastest_connections
+
+    def _parse_departure_table(self, table):
+        '''
+        fastest connection in a departure table, None if there is none
+        '''
+        rows = table.xpath('//tr[@class="firstrow"]')
+        duration = float("inf")
+        fastest = None
 
-                # departure
-                content = [t.text for t in row.find_class('time')]
+        for row in rows:
+            # duration
+            content = row.find_class('duration')
+            h, m = content[0].text.replace('\n', '').split(':')
+            d = int(h) * 60 + int(m)
+            # if already found shorter duration -> skip
+            if d >= duration:
+                continue
+            duration = d
 
-                matches = re.findall( r'\d{1,2}:\d{1,2}', ' - '.join(content))
-                departure = matches[0] if len(matches) > 0 else ''
+            # departure
+            content = [t.text for t in row.find_class('time')]
 
-                # modes
-                content = row.find_class('products')
-                mode = content[0].text.replace('\n', '')
+            matches = re.findall( r'\d{1,2}:\d{1,2}', ' - '.join(content))
+            departure = matches[0] if len(matches) > 0 else ''
 
-                # changes
-                content = row.find_class('changes')
-                changes = int(content[0].text.replace('\n', ''))
+            # modes
+            content = row.find_class('products')
+            mode = content[0].text.replace('\n', '')
 
-            sleep(self.timeout)
+            # changes
+            content = row.find_class('changes')
+            changes = int(content[0].text.replace('\n', ''))
+            fastest = (duration, departure, changes, mode)
 
-        return duration, departure, changes, mode
+        return fastest
 
     def n_departures(self, stop_ids, max_journeys=10000):
         '''
-        scrape number of departures for stops with given ids (HAFAS)
+        scrape number of departures for stops with given ids (HAFAS), the time
+        tables are requested concurrently
 
         Parameters
         ----------
@@ -288,23 +329,20 @@ class BahnQuery(object):
         max_journeys : int, optional
             maximum number of routes per requested time table
         '''
-        # set url-parameters
-        params = self.timetable_params.copy()
-        params['date'] = self.date
-        params['maxJourneys'] = max_journeys
-        n_departures = []
-
-        for id in stop_ids:
+        def count_departures(id):
+            # set url-parameters
+            params = self.timetable_params.copy()
+            params['date'] = self.date
+            params['maxJourneys'] = max_journeys
             params['evaId'] = id
-            r = requests.get(self.timetable_url, params=params, verify=False)
+            r = self._get(self.timetable_url, params)
             root = html.fromstring(r.content)
             rows = root.xpath('//tr')
             journeys = [row for row in rows
                         if row.get('id') and 'journeyRow_' in row.get('id')]
-            n_departures.append(len(journeys))
-            sleep(self.timeout)
+            return len(journeys)
 
-        return n_departures
+        return self.scheduler.map(count_departures, stop_ids)
 
     def get_timetable_url(self, stop_id):
         '''
@@ -318,6 +356,22 @@ class BahnQuery(object):
         return url
 
 
+def _end_of_query_date(params):
+    '''
+    timestamp of the end of the day the DB website was queried for
+    '''
+    day = datetime.strptime(params['date'], BahnQuery.date_pattern)
+    return (day + timedelta(days=1)).timestamp()
+
+# connections and time tables are valid for the queried date only, the stops
+# hardly change
+get_cache().register(
+    BahnQuery.reiseauskunft_url, expires=_end_of_query_date,
+    validate=lambda reply: b'resultsOverview' in reply.content)
+get_cache().register(BahnQuery.timetable_url, expires=_end_of_query_date)
+get_cache().register(BahnQuery.mobile_url, ttl=30 * 24 * 3600)
+
+
 class StopScraper(Worker):
     '''
     worker to scrape and write public stops and number of departures per stop
@@ -374,17 +428,17 @@ class StopScraper(Worker):
         df_oz_within = df_oz[oz_within]
         df_mz_within = df_mz[mz_within]
 
+        def closest_stop(point):
+            t_p = Point(point[0], point[1],
+                        epsg=settings.EPSG)
+            t_p.transform(4326)
+            stops_near = self.query.stops_near((t_p.x, t_p.y), n=1)
+            return stops_near[0] if len(stops_near) > 0 else None
+
         def get_closest_stops(points):
-            stops = []
-            for point in points:
-                t_p = Point(point[0], point[1],
-                            epsg=settings.EPSG)
-                t_p.transform(4326)
-                stops_near = self.query.stops_near((t_p.x, t_p.y), n=1)
-                if len(stops_near) > 0:
-                    closest = stops_near[0]
-                    stops.append(closest)
-            return stops
+            # the stops near the places are requested concurrently
+            stops = self.query.scheduler.map(closest_stop, points)
+            return [stop for stop in stops if stop is not None]
 
         oz_stops = get_closest_stops(oz_points)
         mz_stops = get_closest_stops(mz_points)
@@ -443,6 +497,9 @@ class BahnRouter(Worker):
     '''
 
     times = range(9, 18) # time slots to query connections for
+    # the responses are cached persistently, a new run after a cancellation
+    # only requests the missing departure tables
+    cancellable = True
 
     def __init__(self, haltestelle, project, date=None, parent=None):
         '''
@@ -465,7 +522,7 @@ class BahnRouter(Worker):
         self.erreichbarkeiten = ErreichbarkeitenOEPNV.features(project=project)
         if not date:
             date = next_working_day()
-        self.query = BahnQuery(date=date, timeout=0.5)
+        self.query = BahnQuery(date=date)
 
     def work(self):
         self.log('Berechne Erreichbarkeit der Zentralen Orte <br> '
@@ -480,29 +537,35 @@ class BahnRouter(Worker):
         df_centers['update'] = False
         n_centers = len(df_centers)
 
-        prog_share = 90 / n_centers
-        progress = 0
-
+        destinations = []
         for i, (index, center) in enumerate(df_centers.iterrows()):
-            id_destination = center['id_haltestelle']
-            destination = self.haltestellen.get(id_bahn=id_destination,
-                                                flaechenzugehoerig=0)
+            destination = self.haltestellen.get(
+                id_bahn=center['id_haltestelle'], flaechenzugehoerig=0)
             self.log(f'  - {destination.name} ({i+1}/{n_centers})')
+            destinations.append(destination)
 
-            progress += prog_share
+        def on_progress(n_done, n_total):
+            self.set_progress(90 * n_done / n_total)
+            # cancels the pending requests
+            self.check_cancelled()
 
-            try:
-                (duration, departure,
-                 changes, modes) = self.query.routing(self.origin.name,
-                                                      destination.name,
-                                                      self.times)
-            except ConnectionError:
-                self.log('Die Website der Bahn wurde nicht erreicht. '
-                         'Bitte überprüfen Sie Ihre Internetverbindung!')
-                return
+        # the connections to all centers are requested at once
+        try:
+            connections = self.query.routings(
+                [(self.origin.name, destination.name)
+                 for destination in destinations],
+                self.times, callback=on_progress)
+        except ConnectionError:
+            self.log('Die Website der Bahn wurde nicht erreicht. '
+                     'Bitte überprüfen Sie Ihre Internetverbindung!')
+            return
+
+        for (index, center), destination, connection in zip(
+            df_centers.iterrows(), destinations, connections):
+            duration, departure, changes, modes = connection
             # just appending results to existing table to write them later
             df_centers.loc[index, 'id_origin'] = self.origin.id
-            df_centers.loc[index, 'id_destination'] = id_destination
+            df_centers.loc[index, 'id_destination'] = center['id_haltestelle']
             df_centers.loc[index, 'ziel'] = destination.name
             df_centers.loc[index, 'abfahrt'] = departure
             if duration != float('inf'):
@@ -512,7 +575,6 @@ class BahnRouter(Worker):
             df_centers.loc[index, 'umstiege'] = changes
             df_centers.loc[index, 'verkehrsmittel'] = modes
             df_centers.loc[index, 'update'] = True
-            self.set_progress(progress)
 
         self.log('Schreibe Ergebnisse in die Datenbank...')
 
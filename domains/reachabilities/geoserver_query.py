@@ -25,11 +25,12 @@ __copyright__ = 'Copyright 2019, HafenCity University Hamburg'
 from projektcheck.domains.definitions.tables import Projektrahmendaten
 from projektcheck.base.domain import Worker
 from projektcheck.utils.spatial import Point
-from projektcheck.utils.connection import Request
+from projektcheck.utils.connection import Request, get_cache
+from projektcheck.base.project import ProjectManager
 from projektcheck.settings import settings
 from .tables import Einrichtungen
 
-requests = Request(synchronous=True)
+requests = Request(synchronous=True, cache=get_cache())
 
 
 class Feature(Point):
@@ -115,6 +116,12 @@ class GeoserverQuery(object):
         return features
 
 
+# the features are derived from the base data, they are valid as long as the
+# version of the base data doesn't change
+get_cache().register(GeoserverQuery.feature_url,
+                     version=lambda: ProjectManager().basedata_version)
+
+
 class EinrichtungenQuery(Worker):
     '''
     worker to query locations of interest
@@ -23,40 +23,23 @@ __date__ = '29/10/2019'
 __copyright__ = 'Copyright 2019, HafenCity University Hamburg'
 
 import json
-from qgis.core import (QgsProject, QgsCoordinateReferenceSystem,
-                       QgsCoordinateTransform, QgsGeometry, QgsWkbTypes)
-import json
-from osgeo import ogr
+import pandas as pd
+from qgis.core import QgsGeometry, QgsWkbTypes
+from osgeo import ogr, osr
 
 from projektcheck.utils.spatial import Point
+from projektcheck.utils.connection import RequestScheduler
 from projektcheck.base.domain import Worker
 from projektcheck.domains.definitions.tables import Projektrahmendaten
 from projektcheck.settings import settings
-from projektcheck.utils.connection import Request
+from projektcheck.utils.routing import get_routing_backend
 from .tables import Isochronen
 
-requests = Request(synchronous=True)
-
 
 class Isochrones(Worker):
     '''
     worker to query and save isochrones with different modes and cutoff times
     '''
-    isochrone_url = (f'{settings.OTP_ROUTER_URL}/routers/'
-                     f'{settings.OTP_ROUTER_ID}/isochrone')
-    # default query parameters
-    isochrone_params = {
-        'routerId': settings.OTP_ROUTER_ID,
-        'algorithm': 'accSampling', # 'algorithm': 'recursiveGrid',
-        'maxWalkDistance': 4000,
-        'fromPlace': '0, 0',
-        'mode': 'WALK',
-        'cutoffSec': 600,
-        'walkSpeed': 1.33,
-        'offRoadDistanceMeters': 500,
-        'bikeSpeed': 5.0,
-    }
-
     # pretty names of modes, their OTP tags and speed
     modes = {
         'Auto': ('CAR', 5),
@@ -65,7 +48,7 @@ class Isochrones(Worker):
     }
 
     def __init__(self, project, modus='zu Fuß', connector=None, steps=1,
-                 cutoff=10, parent=None):
+                 cutoff=10, backend=None, parent=None):
         '''
         Parameters
         ----------
@@ -83,6 +66,9 @@ class Isochrones(Worker):
         cutoff : int, optional
             the maximum cutoff time of the outer isochrone, defaults to ten
             minutes
+        backend : RoutingBackend, optional
+            the backend to request the isochrones from, defaults to the
+            backend configured in the settings
         parent : QObject, optional
             parent object of thread, defaults to no parent (global)
         '''
@@ -93,59 +79,70 @@ class Isochrones(Worker):
         self.n_steps = steps
         self.modus = modus
         self.connector = connector
+        self.backend = backend or get_routing_backend()
 
     def work(self):
         mode, walk_speed = self.modes[self.modus]
         self.log(f'Ermittle die Isochronen für den Modus "{self.modus}"')
-        conn_id = self.connector.id if self.connector else -1
-        self.isochronen.filter(modus=self.modus, id_connector=conn_id)
-        self.isochronen.delete()
-        self.isochronen.reset()
+        epsg = settings.EPSG
         point = self.connector.geom.asPoint() if self.connector \
             else self.project_frame.geom.asPoint()
-
-        epsg = settings.EPSG
         point = Point(point.x(), point.y(), epsg=epsg)
         cutoff_step = self.cutoff_sec / self.n_steps
-        for i in reversed(range(self.n_steps)):
-            sec = int(cutoff_step * (i + 1))
-            self.log(f'...maximale Reisezeit von {sec} Sekunden')
-            json_res = self._get_isochrone(point, mode, sec, walk_speed)
+        # outer isochrones first
+        seconds = [int(cutoff_step * (i + 1))
+                   for i in reversed(range(self.n_steps))]
+        self.log(f'...maximale Reisezeiten von '
+                 f'{", ".join(str(sec) for sec in seconds)} Sekunden')
+
+        # the isochrones of all steps are requested at once (retried on
+        # connection errors)
+        scheduler = RequestScheduler(rate=None, max_workers=1)
+        json_results = scheduler.call(self.backend.isochrones, point, mode,
+                                      seconds, walk_speed)
+        self.set_progress(80)
+
+        # all isochrones are transformed at once as a collection
+        collection = ogr.Geometry(ogr.wkbGeometryCollection)
+        iso_seconds = []
+        for sec, json_res in zip(seconds, json_results):
             if not json_res:
                 continue
-            iso_poly = ogr.CreateGeometryFromJson(json.dumps(json_res))
-            geom = QgsGeometry.fromWkt(iso_poly.ExportToWkt())
-            tr = QgsCoordinateTransform(
-                QgsCoordinateReferenceSystem('epsg:4326'),
-                QgsCoordinateReferenceSystem(f'epsg:{epsg}'),
-                QgsProject.instance()
-            )
-            geom.transform(tr)
+            collection.AddGeometry(
+                ogr.CreateGeometryFromJson(json.dumps(json_res)))
+            iso_seconds.append(sec)
+        srs = []
+        for e in [4326, epsg]:
+            ref = osr.SpatialReference()
+            ref.ImportFromEPSG(e)
+            # GDAL >= 3 takes the axis order of the authority (lat/lon)
+            if hasattr(ref, 'SetAxisMappingStrategy'):
+                ref.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
+            srs.append(ref)
+        collection.Transform(osr.CoordinateTransformation(*srs))
+
+        rows = []
+        conn_id = self.connector.id if self.connector else -1
+        for i, sec in enumerate(iso_seconds):
+            geom = QgsGeometry.fromWkt(
+                collection.GetGeometryRef(i).ExportToWkt())
             # the router sometimes returns broken geometries
             if not geom.isGeosValid():
                 geom = geom.makeValid()
                 # the junk is appended to a collection, discard it
                 if geom.wkbType() == QgsWkbTypes.GeometryCollection:
                     geom = geom.asGeometryCollection()[0]
-            self.isochronen.add(modus=self.modus,
-                                sekunden=sec,
-                                minuten=round(sec/60, 1),
-                                geom=geom,
-                                id_connector=conn_id)
-            self.set_progress(100 * (self.n_steps - i + 1) / self.n_steps)
+            rows.append({'modus': self.modus,
+                         'sekunden': sec,
+                         'minuten': round(sec/60, 1),
+                         'geom': geom,
+                         'id_connector': conn_id})
+
+        self.log('Schreibe die Isochronen in die Datenbank...')
+        with self.isochronen.table.transaction():
+            self.isochronen.delete(modus=self.modus, id_connector=conn_id)
+            self.isochronen.reset()
+            if rows:
+                self.isochronen.update_pandas(pd.DataFrame(rows))
+        self.set_progress(100)
 
-    def _get_isochrone(self, point, mode, time_sec, walk_speed):
-        params = self.isochrone_params.copy()
-        params['cutoffSec'] = int(time_sec)
-        params['mode'] = mode
-        params['walkSpeed'] = walk_speed
-        if point.epsg != 4326:
-            point.transform(4326)
-        params['fromPlace'] = '{y},{x}'.format(y = point.y, x = point.x)
-        r = requests.get(self.isochrone_url, params=params)
-        r.raise_for_status()
-        # always returns a collection with a single feature
-        geo_json = r.json()['features'][0]['geometry']
-        if not geo_json:
-            return
-        return geo_json
\ No newline at end of file
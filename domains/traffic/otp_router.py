@@ -24,19 +24,14 @@ __copyright__ = 'Copyright 2019, HafenCity University Hamburg'
 
 from osgeo import ogr
 from collections import OrderedDict
-from scipy.sparse import csc_matrix
-from qgis.core import (QgsProject, QgsCoordinateReferenceSystem, QgsPoint,
-                       QgsCoordinateTransform)
+from scipy.sparse import csr_matrix
 from scipy.sparse.csgraph import dijkstra
 import numpy as np
 import pandas as pd
+import pickle
 
-from projektcheck.utils.polyline import PolylineCodec
-from projektcheck.utils.spatial import Point
-from projektcheck.utils.connection import Request
-from projektcheck.settings import settings
-
-requests = Request(synchronous=True)
+from projektcheck.utils.spatial import Point, transform_coords
+from projektcheck.utils.routing import OTPBackend, get_routing_backend
 
 
 class Route(object):
@@ -260,18 +255,15 @@ class Nodes(object):
         return ret
 
     def transform(self):
-        """Transform"""
-        tr = QgsCoordinateTransform(
-            QgsCoordinateReferenceSystem(self.p1),
-            QgsCoordinateReferenceSystem(self.p2),
-            QgsProject.instance()
-        )
-
-        for i, node in enumerate(self):
-            pnt = QgsPoint(node.x, node.y)
-            pnt.transform(tr)
-            node.x = pnt.x()
-            node.y = pnt.y()
+        """Transform all nodes at once"""
+        nodes = list(self)
+        x, y = transform_coords([node.x for node in nodes],
+                                [node.y for node in nodes],
+                                int(self.p1.replace('epsg:', '')),
+                                int(self.p2.replace('epsg:', '')))
+        for node, nx, ny in zip(nodes, x, y):
+            node.x = nx
+            node.y = ny
 
     def __iter__(self):
         """Iterator"""
@@ -398,9 +390,19 @@ class Link(object):
 class OTPRouter(object):
     router_epsg = 4326
 
-    def __init__(self, distance=None, epsg=31467):
-        self.router = settings.OTP_ROUTER_ID
-        self.url = f'{settings.OTP_ROUTER_URL}/routers/{self.router}/plan'
+    def __init__(self, distance=None, epsg=31467, backend=None):
+        """
+        Parameters
+        ----------
+        distance : float, optional
+            max. distance of the transfer nodes to the sources
+        epsg : int, optional
+            epsg code of the projection the nodes are transformed into
+        backend : RoutingBackend, optional
+            the backend to query the routes with, defaults to the backend
+            configured in the settings
+        """
+        self.backend = backend or get_routing_backend()
         self.epsg = epsg
         self.dist = distance
         self.nodes = Nodes(epsg)
@@ -411,6 +413,9 @@ class OTPRouter(object):
         self.nodes_have_been_weighted = False
         self.extent = (0.0, 0.0, 0.0, 0.0)
         self.route_counter = 0
+        self.graph = None
+        self.source_node_ids = None
+        self.dist_matrix = None
 
     def __repr__(self):
         """A string representation"""
@@ -418,6 +423,16 @@ class OTPRouter(object):
         return text.format(n=len(self.nodes), r=len(self.routes), t=len(
             self.transfer_nodes))
 
+    def __getstate__(self):
+        # the backend is not persisted (may hold a whole road network)
+        state = self.__dict__.copy()
+        state.pop('backend', None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.backend = get_routing_backend()
+
     def route(self, source, destination, source_id=None, route_id=None,
               mode='CAR'):
         """
@@ -434,21 +449,16 @@ class OTPRouter(object):
         Route
             route
         """
-        params = dict(routerId=self.router,
-                      fromPlace=f'{source.y},{source.x}',
-                      toPlace=f'{destination.y},{destination.x}',
-                      mode=mode,
-                      maxPreTransitTime=1200)
-        r = requests.get(self.url, params=params, timeout=60000)
-        r.raise_for_status()
+        coord_list = self.backend.route(source, destination, mode=mode)
         if source_id is None:
             source_id = source.id
-        route = self.add_route(r.json(), source_id=source_id, route_id=route_id)
+        route = self.add_coordinates(coord_list, source_id=source_id,
+                                     route_id=route_id)
         return route
 
     def add_route(self, json, source_id=0, route_id=None):
         """
-        Parse the geometry from a json
+        Parse the geometry from an OTP plan json
 
         Parameters
         ----------
@@ -456,14 +466,23 @@ class OTPRouter(object):
 
         source_id : int, optional(default=0)
         """
-        try:
-            itinerary = json['plan']['itineraries'][0]
-        except KeyError:
-            return
-        leg = itinerary['legs'][0]
-        points = leg['legGeometry']['points']
-        coord_list = PolylineCodec().decode(points)
-        if len(coord_list) == 0:
+        coord_list = OTPBackend.parse_plan(json)
+        return self.add_coordinates(coord_list, source_id=source_id,
+                                    route_id=route_id)
+
+    def add_coordinates(self, coord_list, source_id=0, route_id=None):
+        """
+        add a route along the given coordinates
+
+        Parameters
+        ----------
+        coord_list : list of tuple of floats
+            (lat, lon) coordinates of the route, the last one (the
+            destination) is not part of the network
+
+        source_id : int, optional(default=0)
+        """
+        if len(coord_list) < 2:
             return
         coord_list = coord_list[:-1]
 
@@ -544,58 +563,98 @@ class OTPRouter(object):
             transfer_node = self.get_max_node_for_route(dist_vector,
                                                         route.route_id)
 
-    def build_graph(self, distance=None):
-        """Convert nodes and links to graph"""
+    def build_graph(self):
+        """
+        Convert nodes and links to graph and calculate the distances of all
+        nodes to each of the source nodes
+        """
         self.nodes.transform()
         data = self.links.link_length
         node_ids = self.links.node_ids
         row = node_ids.from_node
         col = node_ids.to_node
         N = len(self.nodes)
-        mat = csc_matrix((data, (row, col)), shape=(N, N))
-        dist_matrix = dijkstra(mat,
-                               directed=True,
-                               return_predecessors=False,
-                               indices=self.routes.source_nodes,
-                               )
-        dist_vector = dist_matrix.min(axis=0)
+        self.graph = csr_matrix((data, (row, col)), shape=(N, N))
+        self.source_node_ids = self.routes.source_nodes
+        # distances per source node (rows) to all nodes (columns)
+        self.dist_matrix = dijkstra(self.graph,
+                                    directed=True,
+                                    return_predecessors=False,
+                                    indices=self.source_node_ids,
+                                    )
+
+    def calculate_transfer_nodes(self, distance=None):
+        """
+        (re)calculate the transfer nodes on the routes based on the already
+        built graph (see build_graph)
+
+        Parameters
+        ----------
+        distance : float, optional
+            max. distance of the transfer nodes to the sources,
+            defaults to no limitation
+        """
+        self.transfer_nodes = TransferNodes()
+        # for several Teilflächen: use the minimum distance to the sources
+        dist_vector = self.dist_matrix.min(axis=0)
         self.set_link_distance(dist_vector)
         if distance:
-            dist_vector[dist_vector > distance] = np.NINF
+            dist_vector[dist_vector > distance] = -np.inf
         self.get_max_nodes(dist_vector)
 
+    def save(self, file_path):
+        """
+        persist the router including the built graph
+
+        Parameters
+        ----------
+        file_path : str
+            path to file to pickle the router to
+        """
+        with open(file_path, 'wb') as f:
+            pickle.dump(self, f)
+
+    @classmethod
+    def load(cls, file_path):
+        """
+        load a persisted router
+
+        Parameters
+        ----------
+        file_path : str
+            path to the pickled router
+
+        Returns
+        -------
+        OTPRouter
+        """
+        with open(file_path, 'rb') as f:
+            return pickle.load(f)
+
     def remove_redundancies(self):
         '''
         remove transfer nodes and their routes that are part of another route
         '''
-
-        redundant_nodes = []
-        transfer_nodes = self.transfer_nodes.values()
-        for transfer_node in transfer_nodes:
-            is_redundant = False
-            for tn in transfer_nodes:
-                if (tn.node_id == transfer_node.node_id
-                    or tn.node_id in redundant_nodes):
-                    continue
-                for route in tn.routes.values():
-                    # transfer node is part of the route of
-                    # another transfer node
-                    in_route = np.in1d(transfer_node.node_id,
-                                       route.nodes[:-1]).sum() != 0
-                    if in_route:
-                        redundant_nodes.append(transfer_node)
-                        is_redundant = True
-                        break
-                if is_redundant:
-                    break
-        part_routes = []
-        for node in redundant_nodes:
-            self.transfer_nodes.pop(node.node_id, None)
-            part_routes.extend(list(node.routes))
-
-        part_routes = np.unique(part_routes)
-        for route_id in redundant_nodes:
-            self.routes.pop(route_id, None)
+        # inverted index: node id -> ids of the transfer nodes whose routes
+        # pass this node (destination of route excluded)
+        passing = {}
+        for tn in self.transfer_nodes.values():
+            for route in tn.routes.values():
+                for node in route.nodes[:-1]:
+                    passing.setdefault(node.node_id, set()).add(tn.node_id)
+
+        redundant_nodes = set()
+        for tn in self.transfer_nodes.values():
+            others = passing.get(tn.node_id, set())
+            # transfer node is part of the route of another transfer node
+            # (ignoring transfer nodes that are already marked as redundant)
+            if others - redundant_nodes - {tn.node_id}:
+                redundant_nodes.add(tn.node_id)
+
+        for node_id in redundant_nodes:
+            node = self.transfer_nodes.pop(node_id)
+            for route_id in node.routes:
+                self.routes.pop(route_id, None)
 
     def set_link_distance(self, dist_vector):
         """set distance to plangebiet for each link"""
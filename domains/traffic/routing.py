@@ -23,12 +23,11 @@ __date__ = '12/12/2019'
 __copyright__ = 'Copyright 2019, HafenCity University Hamburg'
 
 import os
-from qgis.core import QgsPoint
-from qgis.core import (QgsGeometry, QgsPoint, QgsProject,
-                       QgsCoordinateReferenceSystem, QgsCoordinateTransform)
+from qgis.core import QgsGeometry, QgsPoint, QgsPointXY
 import numpy as np
+import pandas as pd
 
-from projektcheck.utils.spatial import Point
+from projektcheck.utils.spatial import Point, transform_coords
 from projektcheck.domains.traffic.otp_router import OTPRouter
 from projektcheck.base.domain import Worker
 from projektcheck.domains.definitions.tables import Teilflaechen
@@ -48,7 +47,10 @@ class TransferNodeCalculation(Worker):
     # number of destination points on outer and middle ring to route to
     n_segments = 24
 
-    def __init__(self, project, distance=1000, parent=None):
+    inputs = [Teilflaechen, Connectors]
+    outputs = [Itineraries, TransferNodes]
+
+    def __init__(self, project, distance=1000, n_segments=None, parent=None):
         '''
         Parameters
         ----------
@@ -57,6 +59,9 @@ class TransferNodeCalculation(Worker):
         distance : int, optional
             the radius in meters of the inner ring the transfer nodes are
             located in, defaults to 1000 m
+        n_segments : int, optional
+            number of destination points on outer and middle ring to route to,
+            defaults to 24
         parent : QObject, optional
             parent object of thread, defaults to no parent (global)
         '''
@@ -64,6 +69,8 @@ class TransferNodeCalculation(Worker):
         self.otp_pickle_file = os.path.join(project.path, 'otpgraph.pickle')
         self.project = project
         self.distance = distance
+        if n_segments:
+            self.n_segments = n_segments
         self.areas = Teilflaechen.features(project=project)
         self.connectors = Connectors.features(project=project)
         self.itineraries = Itineraries.features(project=project, create=True)
@@ -77,16 +84,98 @@ class TransferNodeCalculation(Worker):
         '''
         calculate the position and weights of the initial transfer nodes
         '''
-        # tbx settings
+        inner_circle = self.distance
+        self.itineraries.table.truncate()
+
+        otp_router = self.load_router()
+        if otp_router:
+            self.log('Verwende die bereits berechneten Routen...')
+        else:
+            otp_router = self.route()
+            self.log('Berechne das Straßennetz aus den Routen...')
+            otp_router.build_graph()
+            otp_router.save(self.otp_pickle_file)
+        otp_router.dist = inner_circle
+        otp_router.calculate_transfer_nodes(distance=inner_circle)
+        otp_router.remove_redundancies()
+
+        self.log('Berechne Herkunfts-/Zielpunkte aus den Routen...')
+        otp_router.transfer_nodes.calc_initial_weight()
+
+        transfer_nodes_df = otp_router.get_transfer_node_features()
+        self.transfer_nodes.table.truncate()
+        transfer_nodes_df['fid'] = range(1, len(transfer_nodes_df) + 1)
+        self.transfer_nodes.update_pandas(transfer_nodes_df)
+
+        tn_ids = dict(zip(transfer_nodes_df['node_id'],
+                          transfer_nodes_df['fid']))
+        rows = []
+        for transfer_node in otp_router.transfer_nodes.values():
+            tn_id = tn_ids[transfer_node.node_id]
+            for route in transfer_node.routes.values():
+                points = [QgsPoint(node.x, node.y) for node in route.nodes]
+                polyline = QgsGeometry.fromPolyline(points)
+                rows.append((route.route_id, tn_id, polyline))
+        df_itineraries = pd.DataFrame(
+            rows, columns=['route_id', 'transfer_node_id', 'geom'])
+        self.itineraries.update_pandas(df_itineraries)
+
+    @property
+    def _routing_key(self):
+        '''
+        the parameters the routes depend on (except the distance)
+        '''
+        connectors = []
+        for area in self.areas:
+            connector = self.connectors.get(id_teilflaeche=area.id)
+            qpoint = connector.geom.asPoint()
+            connectors.append((area.id, qpoint.x(), qpoint.y()))
+        return (tuple(connectors), self.n_segments, self.outer_circle)
+
+    def load_router(self):
+        '''
+        load the router with the graph persisted by a previous calculation.
+        It is only reused if the connectors and the segments did not change
+        and the routes were calculated for at least the set distance
+
+        Returns
+        -------
+        OTPRouter
+            the persisted router, None if there is none or it is outdated
+        '''
+        if not os.path.exists(self.otp_pickle_file):
+            return
+        try:
+            otp_router = OTPRouter.load(self.otp_pickle_file)
+        # e.g. persisted with an older version of the router
+        except Exception:
+            return
+        routing_key = getattr(otp_router, 'routing_key', None)
+        routed_distance = getattr(otp_router, 'routed_distance', 0)
+        if (otp_router.dist_matrix is None or
+            routing_key != self._routing_key or
+            routed_distance < self.distance):
+            return
+        return otp_router
+
+    def route(self):
+        '''
+        route from the connectors of the areas to points placed on two
+        circles around them
+
+        Returns
+        -------
+        OTPRouter
+            the router containing the calculated routes
+        '''
         inner_circle = self.distance
         mid_circle = inner_circle + 500
         outer_circle = inner_circle + self.outer_circle
 
-        # calculate routes
         project_epsg = settings.EPSG
         otp_router = OTPRouter(distance=inner_circle, epsg=project_epsg)
-
-        self.itineraries.table.truncate()
+        otp_router.routing_key = self._routing_key
+        otp_router.routed_distance = inner_circle
 
         for i, area in enumerate(self.areas):
             self.log(f'Suche Routen ausgehend von Teilfläche {area.name}...')
@@ -109,26 +198,7 @@ class TransferNodeCalculation(Worker):
                 destination.transform(otp_router.router_epsg)
                 otp_router.route(source, destination)
             self.set_progress(80 * (i + 1) / len(self.areas))
-
-        otp_router.build_graph(distance=inner_circle)
-        otp_router.remove_redundancies()
-
-        self.log('Berechne Herkunfts-/Zielpunkte aus den Routen...')
-        otp_router.transfer_nodes.calc_initial_weight()
-
-        transfer_nodes_df = otp_router.get_transfer_node_features()
-        self.transfer_nodes.table.truncate()
-        transfer_nodes_df['fid'] = range(1, len(transfer_nodes_df) + 1)
-        self.transfer_nodes.update_pandas(transfer_nodes_df)
-
-        for transfer_node in otp_router.transfer_nodes.values():
-            tn_idx = transfer_nodes_df['node_id'] == transfer_node.node_id
-            tn_id = transfer_nodes_df[tn_idx]['fid'].values[0]
-            for route in transfer_node.routes.values():
-                points = [QgsPoint(node.x, node.y) for node in route.nodes]
-                polyline = QgsGeometry.fromPolyline(points)
-                self.itineraries.add(geom=polyline, route_id=route.route_id,
-                                     transfer_node_id=tn_id)
+        return otp_router
 
 
 class Routing(Worker):
@@ -138,6 +208,9 @@ class Routing(Worker):
     around the traffic connectors.
     '''
 
+    inputs = [Teilflaechen, Connectors, Itineraries, TransferNodes, Ways]
+    outputs = [Ways, RouteLinks, TrafficLoadLinks]
+
     def __init__(self, project, recalculate=False, parent=None):
         '''
         Parameters
@@ -175,13 +248,12 @@ class Routing(Worker):
         '''
         self.links.table.truncate()
         project_epsg = settings.EPSG
-        #route_ids = {}
         otp_router = OTPRouter(epsg=project_epsg)
-        transform = QgsCoordinateTransform(
-            QgsCoordinateReferenceSystem(OTPRouter.router_epsg),
-            QgsCoordinateReferenceSystem(project_epsg),
-            QgsProject.instance()
-        )
+        # rows (from_node_id, to_node_id, transfer_node_id, area_id)
+        # and coordinates of start and end points of all links in router
+        # projection, transformed and written to database at once
+        rows = []
+        coords = []
         for i, area in enumerate(self.areas):
             self.log(f'Suche Routen zwischen Teilfläche {area.name} und den '
                      'Herkunfts-/Zielpunkten...')
@@ -201,19 +273,31 @@ class Routing(Worker):
                     if not route:
                         continue
                     for link in route.links:
-                        geom = QgsGeometry()
                         from_id = link.from_node.node_id
                         to_id = link.to_node.node_id
-                        lg = link.get_geom()
-                        if from_id == to_id or not lg:
+                        if from_id == to_id or not link.length:
                             continue
-                        geom.fromWkb(lg.ExportToWkb())
-                        geom.transform(transform)
-                        self.links.add(from_node_id=from_id, to_node_id=to_id,
-                                       transfer_node_id=transfer_node.id,
-                                       area_id=area.id, geom=geom)
+                        rows.append((from_id, to_id, transfer_node.id,
+                                     area.id))
+                        coords.append((link.from_node.x, link.from_node.y,
+                                       link.to_node.x, link.to_node.y))
             self.set_progress(80 * (i + 1) / len(self.areas))
 
+        self.log('Schreibe Routen...')
+        coords = np.array(coords, dtype=float).reshape(-1, 4)
+        from_x, from_y = transform_coords(
+            coords[:, 0], coords[:, 1], OTPRouter.router_epsg, project_epsg)
+        to_x, to_y = transform_coords(
+            coords[:, 2], coords[:, 3], OTPRouter.router_epsg, project_epsg)
+        df_links = pd.DataFrame(rows, columns=['from_node_id', 'to_node_id',
+                                               'transfer_node_id', 'area_id'])
+        df_links['geom'] = [
+            QgsGeometry.fromPolylineXY([QgsPointXY(fx, fy),
+                                        QgsPointXY(tx, ty)])
+            for fx, fy, tx, ty in zip(from_x, from_y, to_x, to_y)
+        ]
+        self.links.update_pandas(df_links)
+
     def calculate_traffic_load(self):
         '''
         distribute the traffic to the shortest paths
@@ -223,33 +307,42 @@ class Routing(Worker):
         self.log('Verteile das Verkehrsaufkommen...')
 
         df_links = self.links.to_pandas()
-        df_links['wege_miv'] = 0
-
-        for way in self.ways:
-            nutzungsart = way.nutzungsart
-            miv_gesamt_new = way.miv_anteil * way.wege_gesamt / 100
-            areas_tou = self.areas.filter(nutzungsart=nutzungsart)
-            miv_gesamt_old = sum(area.wege_miv for area in areas_tou)
-            if miv_gesamt_old == 0:
-                continue
-            for area in areas_tou:
-                idx = df_links['area_id'] == area.id
-                df_links.loc[idx, 'wege_miv'] = (miv_gesamt_new * area.wege_miv
-                                                 / miv_gesamt_old)
-        self.areas.filter()
+
+        df_ways = self.ways.to_pandas(
+            columns=['nutzungsart', 'miv_anteil', 'wege_gesamt'])
+        df_ways['miv_gesamt_new'] = (df_ways['miv_anteil'] *
+                                     df_ways['wege_gesamt'] / 100)
+        df_areas = self.areas.to_pandas(
+            columns=['fid', 'nutzungsart', 'wege_miv'])
+        df_areas['miv_gesamt_old'] = df_areas.groupby(
+            'nutzungsart')['wege_miv'].transform('sum')
+        df_areas = df_areas[df_areas['miv_gesamt_old'] != 0].merge(
+            df_ways[['nutzungsart', 'miv_gesamt_new']].drop_duplicates(
+                'nutzungsart', keep='last'),
+            on='nutzungsart')
+        # the ways of the areas scaled to the ways set per type of use
+        df_areas['area_miv'] = (df_areas['miv_gesamt_new'] *
+                                df_areas['wege_miv'] /
+                                df_areas['miv_gesamt_old'])
+        df_links = df_links.merge(
+            df_areas[['fid', 'area_miv']].rename(columns={'fid': 'area_id'}),
+            how='left', on='area_id')
+        df_links['wege_miv'] = df_links['area_miv'].fillna(0)
 
         df_transfer = self.transfer_nodes.to_pandas(columns=['fid', 'weight'])
         df_weighted = df_links.merge(
-            df_transfer, how='left', left_on='transfer_node_id', right_on='fid')
+            df_transfer.rename(columns={'fid': 'transfer_node_id'}),
+            how='left', on='transfer_node_id')
         # ways include back and forth
         df_weighted['wege_miv'] /= 2
         df_weighted['weight'] /= 100
         df_weighted['trips'] = df_weighted['wege_miv'] * df_weighted['weight']
         # linked nodes without direction
-        df_weighted['dirless'] = ['{}-{}'.format(*sorted(t))
-                                  for t in zip(df_weighted['from_node_id'],
-                                               df_weighted['to_node_id'])]
-        df_grouped = df_weighted.groupby('dirless')
-        for i, group in df_grouped:
-            self.traffic_load.add(trips=group['trips'].sum(),
-                                  geom=group['geom'].values[0])
+        from_ids = df_weighted['from_node_id'].values.astype(np.int64)
+        to_ids = df_weighted['to_node_id'].values.astype(np.int64)
+        n_ids = max(from_ids.max(initial=0), to_ids.max(initial=0)) + 1
+        df_weighted['dirless'] = (np.minimum(from_ids, to_ids) * n_ids +
+                                  np.maximum(from_ids, to_ids))
+        df_load = df_weighted.groupby('dirless', sort=False).agg(
+            trips=('trips', 'sum'), geom=('geom', 'first'))
+        self.traffic_load.update_pandas(df_load.reset_index(drop=True))
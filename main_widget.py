@@ -27,26 +27,53 @@ from qgis.PyQt.QtWidgets import QMenu, QInputDialog, QMessageBox
 from qgis.PyQt.QtGui import QIcon
 from qgis.core import QgsProject
 
-from projektcheck.base.domain import PCDockWidget
+from projektcheck.base.domain import PCDockWidget, LazyDomain
 from projektcheck.base.dialogs import (SettingsDialog, NewProjectDialog,
                                        ProgressDialog, Dialog)
 from projektcheck.base.project import (ProjectLayer, OSMBackgroundLayer,
                                        TerrestrisBackgroundLayer)
 from projektcheck.base.database import Workspace
-from projektcheck.domains.definitions.project import (ProjectInitialization,
-                                                      CloneProject)
 from projektcheck.utils.utils import open_file
-from projektcheck.domains.jobs_inhabitants.jobs_inhabitants import JobsInhabitants
-from projektcheck.domains.definitions.definitions import ProjectDefinitions
-from projektcheck.domains.traffic.traffic import Traffic
-from projektcheck.domains.reachabilities.reachabilities import Reachabilities
-from projektcheck.domains.ecology.ecology import Ecology
-from projektcheck.domains.landuse.landuse import LandUse
-from projektcheck.domains.infrastructuralcosts.infrastructuralcosts import InfrastructuralCosts
-from projektcheck.domains.municipaltaxrevenue.municipaltaxrevenue import MunicipalTaxRevenue
-from projektcheck.domains.marketcompetition.marketcompetition import SupermarketsCompetition
+from projektcheck.utils import processes
 from projektcheck.domains.definitions.tables import Projektrahmendaten
 
+# the domains in order of appearance in the menu, the modules of the domains
+# (and their heavy dependencies) are only imported when opening them
+DOMAINS = [
+    ('projektcheck.domains.jobs_inhabitants.jobs_inhabitants',
+     'JobsInhabitants', 'Bewohner und Arbeitsplätze',
+     'images/iconset_mob/20190619_iconset_mob_people_1.png',
+     'Wirkungsbereich 1 - Bewohner und Arbeitsplätze'),
+    ('projektcheck.domains.reachabilities.reachabilities',
+     'Reachabilities', 'Erreichbarkeit',
+     'images/iconset_mob/20190619_iconset_mob_get_time_stop2central_2.png',
+     'Wirkungsbereich 2 - Erreichbarkeit'),
+    ('projektcheck.domains.traffic.traffic',
+     'Traffic', 'Verkehr im Umfeld',
+     'images/iconset_mob/20190619_iconset_mob_domain_traffic_6.png',
+     'Wirkungsbereich 3 - Verkehr im Umfeld'),
+    ('projektcheck.domains.ecology.ecology',
+     'Ecology', 'Ökologie',
+     'images/iconset_mob/20190619_iconset_mob_nature_conservation_2.png',
+     'Wirkungsbereich 4 - Fläche und Ökologie/Ökologie'),
+    ('projektcheck.domains.landuse.landuse',
+     'LandUse', 'Flächeninanspruchnahme',
+     'images/iconset_mob/20190619_iconset_mob_domain_landuse_1.png',
+     'Wirkungsbereich 4 - Fläche und Ökologie/Flächeninanspruchnahme'),
+    ('projektcheck.domains.infrastructuralcosts.infrastructuralcosts',
+     'InfrastructuralCosts', 'Infrastrukturfolgekosten',
+     'images/iconset_mob/20190619_iconset_mob_domain_infrstucturalcosts_4.png',
+     'Wirkungsbereich 5 - Infrastrukturfolgekosten'),
+    ('projektcheck.domains.municipaltaxrevenue.municipaltaxrevenue',
+     'MunicipalTaxRevenue', 'Kommunale Steuereinnahmen',
+     'images/iconset_mob/20190619_iconset_mob_domain_tax_1.png',
+     'Wirkungsbereich 6 - Kommunale Steuereinnahmen'),
+    ('projektcheck.domains.marketcompetition.marketcompetition',
+     'SupermarketsCompetition', 'Standortkonkurrenz Supermärkte',
+     'images/iconset_mob/20190619_iconset_mob_domain_supermarkets_1.png',
+     'Wirkungsbereich 7 - Standortkonkurrenz Supermärkte'),
+]
+
 
 class ProjektCheckControl(PCDockWidget):
     '''
@@ -138,6 +165,8 @@ class ProjektCheckControl(PCDockWidget):
         ok, name, layer = dialog.show()
 
         if ok:
+            from projektcheck.domains.definitions.project import (
+                ProjectInitialization)
             job = ProjectInitialization(name, layer,
                                         self.project_manager.settings.EPSG,
                                         parent=self.ui)
@@ -181,6 +210,8 @@ class ProjektCheckControl(PCDockWidget):
                         'bereits vorhanden')
                     continue
 
+                from projektcheck.domains.definitions.project import (
+                    CloneProject)
                 job = CloneProject(name, project, parent=self.ui)
                 def on_success(project):
                     self.ui.project_combo.addItem(project.name, project)
@@ -259,6 +290,8 @@ class ProjektCheckControl(PCDockWidget):
         '''
         set up project definitions widget
         '''
+        from projektcheck.domains.definitions.definitions import (
+            ProjectDefinitions)
         self.project_definitions = ProjectDefinitions()
         #self.project_definitions.reset()
         self.ui.definition_button.clicked.connect(
@@ -266,34 +299,10 @@ class ProjektCheckControl(PCDockWidget):
 
     def setup_domains(self):
         '''
-        set up the domains widgets and the access to them
+        set up the access to the domains, the domains themselves are set up
+        when opening them for the first time
         '''
-
-        self.domains = []
-
-        bewohner_arbeit = JobsInhabitants()
-        self.domains.append(bewohner_arbeit)
-
-        erreichbarkeiten = Reachabilities()
-        self.domains.append(erreichbarkeiten)
-
-        verkehr = Traffic()
-        self.domains.append(verkehr)
-
-        ecology = Ecology()
-        self.domains.append(ecology)
-
-        landuse = LandUse()
-        self.domains.append(landuse)
-
-        infrastructuralcosts = InfrastructuralCosts()
-        self.domains.append(infrastructuralcosts)
-
-        municipaltaxrevenue = MunicipalTaxRevenue()
-        self.domains.append(municipaltaxrevenue)
-
-        supermarkets = SupermarketsCompetition()
-        self.domains.append(supermarkets)
+        self.domains = [LazyDomain(*args) for args in DOMAINS]
 
         # fill the analysis menu with available domains
         menu = QMenu()
@@ -302,7 +311,7 @@ class ProjektCheckControl(PCDockWidget):
             icon = QIcon(os.path.join(current_dir, domain.ui_icon))
             action = menu.addAction(icon, domain.ui_label)
             action.triggered.connect(
-                lambda e, d=domain: self.show_dockwidget(d))
+                lambda e, d=domain: self.show_dockwidget(d.get()))
 
         self.ui.domain_button.setMenu(menu)
 
@@ -347,7 +356,8 @@ class ProjektCheckControl(PCDockWidget):
         if self.active_dockwidget:
             self.active_dockwidget.close()
         else:
-            tree_layer = ProjectLayer.find(ProjectDefinitions.layer_group)
+            tree_layer = ProjectLayer.find(
+                self.project_definitions.layer_group)
             if tree_layer:
                 tree_layer[0].setItemVisibilityChecked(False)
         self.active_dockwidget = widget
@@ -396,7 +406,6 @@ class ProjektCheckControl(PCDockWidget):
                 del(self.project_definitions)
             for domain in self.domains:
                 domain.unload()
-                del(domain)
             # ToDo: put that in project.close() and get
             # workspaces of this project only
             for ws in Workspace.get_instances():
@@ -493,5 +502,6 @@ class ProjektCheckControl(PCDockWidget):
         if getattr(self, 'domains', None):
             for domain in self.domains:
                 domain.unload()
-                domain.deleteLater()
+        # the processes of the pool would keep running across reloads
+        processes.shutdown()
         super().unload()
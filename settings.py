@@ -3,7 +3,7 @@ Basic settings of the plugin. You may change but not remove any of these propert
 '''
 import os
 
-from projektcheck.base.project import settings
+from projektcheck.base.project import settings, APPDATA_PATH
 
 settings.EPSG = 25832 # epsg in database
 settings.MAX_AREA_DISTANCE = 1000 # max distance between project areas
@@ -23,8 +23,22 @@ settings.GEOSERVER_URL = 'https://geoserver.ggr-planung.de/geoserver/projektchec
 settings.OTP_ROUTER_URL = 'https://projektcheck.ggr-planung.de/otp'
 settings.OTP_ROUTER_ID = 'deutschland' # name of the otp router (equals server folder to graph)
 
+# routing backend: 'otp' - OpenTripPlanner web service (OTP_ROUTER_URL),
+# 'local' - routing in-process on the road network in ROUTING_GRAPH_PATH
+settings.ROUTING_BACKEND = 'otp'
+settings.ROUTING_GRAPH_PATH = '' # geopackage with the roads as lines
+settings.ROUTING_GRAPH_LAYER = '' # layer with the roads (first one if empty)
+
+# persistent cache of the responses of the web services
+settings.CACHE_PATH = os.path.join(APPDATA_PATH, 'response-cache.sqlite')
+settings.CACHE_SIZE = 200 * 1024 * 1024 # max. size of the cache in bytes
+
 # zensus raster files
 settings.ZENSUS_500_FILE = 'ZensusEinwohner500.tif'
 settings.ZENSUS_100_FILE = 'ZensusEinwohner100.tif'
 
+# dump a cProfile of each run of a worker into the project folder (pstats),
+# statistics of the runs are always written to worker-statistics.jsonl there
+settings.PROFILE_WORKERS = False
+
 settings.DEBUG = True
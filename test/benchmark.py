@@ -0,0 +1,444 @@
+# coding=utf-8
+'''
+benchmarks of the expensive calculations on synthetic projects at several
+scales (markets x settlement cells, size of the route graph, rows of the
+drawing layers), the base data is generated as well and the responses of the
+routing service are synthesised, no network access is needed
+
+usage (in the test folder):
+
+    python benchmark.py [--scale small medium large] [--threshold 0.25]
+                        [--baseline benchmark-baseline.json] [--save] [--ci]
+
+the measured times are compared to the times in the baseline file, the run
+fails (exit code 1) if a calculation got slower than its baseline by more than
+the threshold. --save writes the measured times as the new baseline, create it
+on the machine the benchmarks are run on (the times depend on the hardware, so
+no baseline is shipped). Without a baseline a warning is printed, with --ci the
+run fails then, so that a missing baseline does not pass unnoticed
+'''
+__author__ = 'Christoph Franke'
+__license__ = 'GPL'
+
+import unittest
+import argparse
+import tempfile
+import shutil
+import json
+import time
+import subprocess
+import sys
+import os
+import numpy as np
+import pandas as pd
+
+from utilities import get_qgis_app
+QGIS_APP, CANVAS, IFACE, PARENT = get_qgis_app()
+
+from qgis.core import QgsGeometry, QgsPointXY
+
+from projektcheck.settings import settings
+from projektcheck.base.project import ProjectManager, Project
+from projektcheck.base.geopackage import Geopackage
+from projektcheck.domains.marketcompetition.sales import Sales
+from projektcheck.domains.traffic.otp_router import OTPRouter
+from projektcheck.domains.definitions.definitions import WohnenDevelopment
+from projektcheck.domains.definitions.tables import (Teilflaechen,
+                                                     Wohneinheiten)
+from projektcheck.utils.spatial import remove_duplicates
+from test_traffic import grid_router
+
+settings._write_instantly = False
+
+# sizes of the synthetic projects
+SCALES = {
+    'small': {'markets': 20, 'cells': 500, 'grid': 21, 'features': 1000,
+              'points': 300, 'areas': 1},
+    'medium': {'markets': 60, 'cells': 3000, 'grid': 51, 'features': 10000,
+               'points': 1000, 'areas': 5},
+    'large': {'markets': 150, 'cells': 10000, 'grid': 101,
+              'features': 50000, 'points': 3000, 'areas': 20},
+}
+# differences below this (in seconds) are not counted as regressions, they
+# are within the noise of the measurement
+MIN_DIFFERENCE = 0.05
+
+
+class Benchmark(unittest.TestCase):
+    '''
+    base class of the benchmarks, generates the base data and measures the
+    calculations
+    '''
+    scale = 'small'
+    repeat = 3
+    # measured times by name of the calculation and scale
+    results = {}
+
+    @classmethod
+    def setUpClass(cls):
+        cls.size = SCALES[cls.scale]
+        cls.rng = np.random.default_rng(0)
+        cls.folder = tempfile.mkdtemp()
+        cls.basedata = Geopackage(base_path=cls.folder, read_only=False)
+        cls.create_basedata()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.basedata.close()
+        shutil.rmtree(cls.folder, ignore_errors=True)
+
+    @classmethod
+    def create_table(cls, workspace, name, df, geometry_type=None):
+        '''
+        create a table in the base data and fill it with the dataframe
+        '''
+        fields = {}
+        for column, dtype in df.dtypes.items():
+            if column == 'geom':
+                continue
+            fields[column] = int if np.issubdtype(dtype, np.integer) \
+                else float if np.issubdtype(dtype, np.floating) else str
+        workspace = cls.basedata.get_or_create_workspace(workspace)
+        table = workspace.create_table(name, fields, overwrite=True,
+                                       geometry_type=geometry_type)
+        table.update_pandas(df)
+        return table
+
+    @classmethod
+    def create_basedata(cls):
+        '''
+        override to add tables to the base data
+        '''
+
+    def measure(self, name, func, setup=None):
+        '''
+        run the function repeatedly and keep the fastest run
+
+        Parameters
+        ----------
+        name : str
+            name of the calculation
+        func : function
+            the calculation to measure
+        setup : function, optional
+            called before each run (not measured), the returned tuple is
+            passed as the arguments of the calculation
+        '''
+        times = []
+        for i in range(self.repeat):
+            args = setup() if setup else ()
+            start = time.perf_counter()
+            func(*args)
+            times.append(time.perf_counter() - start)
+        key = f'{name}[{self.scale}]'
+        # the fastest run is the least disturbed by other processes
+        self.results[key] = min(times)
+        print(f'{key}: {min(times):.3f}s')
+
+
+class SalesBenchmark(Benchmark):
+    """Benchmark the sales of markets competing for the purchasing power"""
+
+    @classmethod
+    def create_basedata(cls):
+        rng = cls.rng
+        n_communities = 10
+        cls.create_table('Basisdaten_deutschland', 'bkg_gemeinden',
+                         pd.DataFrame({
+                             'AGS': [f'{i:08d}' for i in range(n_communities)],
+                             'vwg_groessenklasse':
+                                 np.arange(n_communities) % 3 + 1
+                         }))
+        betriebstypen = np.arange(1, 8)
+        df_exp = pd.DataFrame(
+            [(gr, 0, bt, -0.2 - 0.05 * bt, 1.)
+             for gr in range(1, 4) for bt in betriebstypen],
+            columns=['gem_groessenklasse', 'id_kette', 'id_betriebstyp',
+                     'exponent', 'exp_faktor'])
+        cls.create_table('Standortkonkurrenz_Supermaerkte',
+                         'Exponentialfaktoren', df_exp)
+        df_attr = pd.DataFrame(
+            [(0, bt, 1., .8, .6, .7, .5, .4) for bt in betriebstypen],
+            columns=['id_kette', 'id_betriebstyp', 'ein_Markt_in_Naehe',
+                     'zwei_Maerkte_in_Naehe', 'drei_Maerkte_in_Naehe',
+                     'zweiter_Markt_mit_Abstand_zum_ersten',
+                     'dritter_Markt_mit_Abstand_zum_ersten',
+                     'dritter_Markt_mit_Abstand_zum_ersten_und_zweiten'])
+        cls.create_table('Standortkonkurrenz_Supermaerkte',
+                         'Attraktivitaetsfaktoren', df_attr)
+
+        n_markets = cls.size['markets']
+        n_cells = cls.size['cells']
+        # markets and cells spread over a square of 30 km
+        market_xy = rng.uniform(0, 30000, (n_markets, 2))
+        cell_xy = rng.uniform(0, 30000, (n_cells, 2))
+        nullfall = rng.integers(1, 8, n_markets)
+        # a tenth of the markets is planned (not existing yet)
+        nullfall[rng.random(n_markets) < 0.1] = 0
+        planfall = nullfall.copy()
+        planfall[planfall == 0] = rng.integers(1, 8, (planfall == 0).sum())
+        cls.df_markets = pd.DataFrame({
+            'id': np.arange(1, n_markets + 1),
+            'AGS': [f'{i:08d}'
+                    for i in rng.integers(0, n_communities, n_markets)],
+            # 0 is no chain
+            'id_kette': rng.integers(0, 6, n_markets),
+            'id_betriebstyp_nullfall': nullfall,
+            'id_betriebstyp_planfall': planfall,
+        })
+        cls.df_cells = pd.DataFrame({
+            'id': np.arange(1, n_cells + 1),
+            'kk': rng.uniform(1000, 100000, n_cells),
+            # a twentieth of the cells is in a planned area
+            'id_teilflaeche': np.where(rng.random(n_cells) < 0.05, 1, -1),
+        })
+        beelines = np.sqrt(((market_xy[:, None, :] -
+                             cell_xy[None, :, :]) ** 2).sum(axis=2))
+        distances = beelines * rng.uniform(1.1, 1.5, beelines.shape)
+        distances[distances > 20000] = -1
+        cls.df_relations = pd.DataFrame({
+            'id_markt': np.repeat(cls.df_markets['id'].values, n_cells),
+            'id_siedlungszelle': np.tile(cls.df_cells['id'].values,
+                                         n_markets),
+            'distanz': distances.ravel().astype(int),
+            'luftlinie': beelines.ravel().astype(int),
+        })
+
+    def setUp(self):
+        self.sales = Sales(self.basedata, self.df_relations, self.df_markets,
+                           self.df_cells)
+
+    def test_sales(self):
+        self.measure('Sales.calculate_nullfall',
+                     self.sales.calculate_nullfall)
+        self.measure('Sales.calculate_planfall',
+                     self.sales.calculate_planfall)
+
+    def test_competitors(self):
+        df_markets = self.sales._prepare_markets(
+            self.sales.df_markets, Sales.PLANFALL).set_index('id')
+        dist_matrix = self.sales.get_dist_matrix() / 1000
+        masked_dist_matrix = dist_matrix.T.mask(dist_matrix.T < 0)
+        big_markets = df_markets[df_markets['id_betriebstyp_planfall'] > 2]
+        self.measure('Sales.calc_competitors',
+                     lambda: self.sales.calc_competitors(
+                         masked_dist_matrix, big_markets))
+
+
+class GeopackageBenchmark(Benchmark):
+    """Benchmark reading and writing large drawing layers"""
+
+    def drawing(self, n):
+        '''
+        dataframe of a drawing layer with n points (every tenth point is a
+        duplicate of its predecessor)
+        '''
+        xy = self.rng.uniform(0, 30000, (n, 2))
+        xy[10::10] = xy[9:-1:10] + 1
+        return pd.DataFrame({
+            'id_teilflaeche': self.rng.integers(1, 10, n),
+            'name': [f'Punkt {i}' for i in range(n)],
+            'wert': self.rng.uniform(0, 100, n),
+            'geom': [QgsGeometry.fromPointXY(QgsPointXY(x, y))
+                     for x, y in xy],
+        })
+
+    def empty_table(self):
+        df = self.drawing(1)
+        return self.create_table('zeichnung', 'zeichnung', df.iloc[:0],
+                                 geometry_type='Point')
+
+    def test_to_pandas(self):
+        df = self.drawing(self.size['features'])
+        self.measure('GeopackageTable.update_pandas (insert)',
+                     lambda table: table.update_pandas(df),
+                     setup=lambda: (self.empty_table(), ))
+        table = self.empty_table()
+        table.update_pandas(df)
+        self.measure('GeopackageTable.to_pandas', table.to_pandas)
+        df_table = table.to_pandas()
+        df_table['wert'] += 1
+        self.measure('GeopackageTable.update_pandas (update)',
+                     lambda: table.update_pandas(df_table))
+
+    def test_remove_duplicates(self):
+        df = self.drawing(self.size['points'])
+
+        def setup():
+            table = self.empty_table()
+            table.update_pandas(df)
+            return (table.features(), )
+
+        self.measure('remove_duplicates',
+                     lambda features: remove_duplicates(features, distance=5),
+                     setup=setup)
+
+
+class RouterBenchmark(Benchmark):
+    """Benchmark the graph of the routes to the transfer nodes"""
+
+    def setUp(self):
+        # synthesised responses of the routing service on a grid
+        self.router = grid_router(self.size['grid'])
+
+    def test_graph(self):
+        self.measure('OTPRouter.build_graph', self.router.build_graph)
+        self.measure('OTPRouter.calculate_transfer_nodes',
+                     lambda: self.router.calculate_transfer_nodes(
+                         distance=1000))
+
+    def test_persisted_graph(self):
+        # transfer nodes of another distance from the saved graph
+        self.router.build_graph()
+        file_path = os.path.join(self.folder, 'otpgraph.pickle')
+        self.router.save(file_path)
+
+        def calculate():
+            router = OTPRouter.load(file_path)
+            router.calculate_transfer_nodes(distance=1000)
+
+        self.measure('OTPRouter.load+calculate_transfer_nodes', calculate)
+
+
+class WohnenBenchmark(Benchmark):
+    """Benchmark the development of the inhabitants of residential areas"""
+    n_types = 4
+
+    @classmethod
+    def create_basedata(cls):
+        cls.types = types = np.arange(1, cls.n_types + 1)
+        cls.create_table('Definition_Projekt', 'Wohnen_Gebaeudetypen',
+                         pd.DataFrame({
+                             'IDGebaeudetyp': types,
+                             'default_anteil_u18': 20. + types,
+                             'Wege_je_Einwohner': 3.3,
+                             'Anteil_Pkw_Fahrer': 40. + types,
+                         }))
+        altersklassen = ['unter 18', '18 bis 30', '30 bis 45', '45 bis 65',
+                         '65 bis 75', 'über 75']
+        rows = [(bt, alter, i + 1, ak, 0.1 + 0.01 * ((alter + i) % 10))
+                for bt in types for alter in range(1, 61)
+                for i, ak in enumerate(altersklassen)]
+        cls.create_table('Bewohner_Arbeitsplaetze', 'Einwohner_pro_WE',
+                         pd.DataFrame(rows, columns=[
+                             'IDGebaeudetyp', 'AlterWE', 'IDAltersklasse',
+                             'Altersklasse', 'Einwohner']))
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.project_manager = ProjectManager()
+        cls.prev_project = cls.project_manager.active_project
+        cls.prev_basedata = cls.project_manager.basedata
+        cls.project = Project('__benchmark__', path=cls.folder)
+        os.mkdir(cls.project.path)
+        cls.project_manager.active_project = cls.project
+        cls.project_manager.basedata = cls.basedata
+
+        areas = Teilflaechen.features(project=cls.project, create=True)
+        wohneinheiten = Wohneinheiten.features(project=cls.project,
+                                               create=True)
+        cls.areas = []
+        for i in range(cls.size['areas']):
+            area = areas.add(name=f'Flaeche_{i+1}', nutzungsart=1,
+                             aufsiedlungsdauer=i % 10 + 1,
+                             beginn_nutzung=2025)
+            for bt in cls.types.tolist():
+                wohneinheiten.add(id_teilflaeche=area.id, id_gebaeudetyp=bt,
+                                  we=10 * bt, ew_je_we=2.5, anteil_u18=25)
+            cls.areas.append(area)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.project_manager.active_project = cls.prev_project
+        cls.project_manager.basedata = cls.prev_basedata
+        cls.project_manager.remove_project(cls.project)
+        super().tearDownClass()
+
+    def test_development(self):
+        def develop():
+            for area in self.areas:
+                WohnenDevelopment(self.basedata, area).work()
+
+        self.measure('WohnenDevelopment', develop)
+
+
+class ImportBenchmark(Benchmark):
+    """Benchmark the startup of the plugin"""
+
+    def test_import(self):
+        # in a fresh interpreter, the measured time includes its startup
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+        self.measure('import main_widget', lambda: subprocess.check_call(
+            [sys.executable, '-c', 'import projektcheck.main_widget'],
+            env=env))
+
+
+def compare(results, baseline, threshold):
+    '''
+    compare the results with the baseline
+
+    Returns
+    -------
+    list
+        descriptions of the regressions
+    '''
+    regressions = []
+    for key, seconds in results.items():
+        base = baseline.get(key)
+        if base is None:
+            continue
+        if (seconds > base * (1 + threshold) and
+                seconds - base > MIN_DIFFERENCE):
+            regressions.append(f'{key}: {seconds:.3f}s '
+                               f'(Referenz {base:.3f}s, '
+                               f'+{100 * (seconds / base - 1):.0f}%)')
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--scale', nargs='+', choices=list(SCALES),
+                        default=['small', 'medium'])
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help='tolerated slowdown relative to the baseline')
+    parser.add_argument('--baseline', default=os.path.join(
+        os.path.dirname(os.path.abspath(__file__)),
+        'benchmark-baseline.json'))
+    parser.add_argument('--save', action='store_true',
+                        help='save the results as the new baseline')
+    parser.add_argument('--ci', action='store_true',
+                        help='fail if there is no baseline to compare with')
+    args = parser.parse_args()
+
+    benchmarks = [SalesBenchmark, GeopackageBenchmark, RouterBenchmark,
+                  WohnenBenchmark, ImportBenchmark]
+    runner = unittest.TextTestRunner(verbosity=2)
+    success = True
+    for scale in args.scale:
+        Benchmark.scale = scale
+        suite = unittest.TestSuite()
+        for benchmark in benchmarks:
+            suite.addTests(unittest.makeSuite(benchmark))
+        success &= runner.run(suite).wasSuccessful()
+
+    results = Benchmark.results
+    if args.save:
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as f:
+                baseline = json.load(f)
+        baseline.update(results)
+        with open(args.baseline, 'w') as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+    elif os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        for regression in regressions:
+            print(f'Regression {regression}')
+        success &= not regressions
+    else:
+        print(f'Warnung: keine Referenzzeiten in {args.baseline} gefunden, '
+              'die Ergebnisse werden nicht verglichen (mit --save anlegen)')
+        success &= not args.ci
+    sys.exit(0 if success else 1)
@@ -3,6 +3,10 @@ import unittest
 import test_init
 import test_main_widget
 import test_project
+import test_traffic
+import test_routing
+import test_connection
+import test_pipeline
 from projektcheck.base.tests import test_backend, test_project_management
 
 
@@ -14,6 +18,10 @@ if __name__ == "__main__":
     suite.addTests(loader.loadTestsFromModule(test_init))
     suite.addTests(loader.loadTestsFromModule(test_main_widget))
     suite.addTests(loader.loadTestsFromModule(test_project))
+    suite.addTests(loader.loadTestsFromModule(test_traffic))
+    suite.addTests(loader.loadTestsFromModule(test_routing))
+    suite.addTests(loader.loadTestsFromModule(test_connection))
+    suite.addTests(loader.loadTestsFromModule(test_pipeline))
     suite.addTests(loader.loadTestsFromModule(test_backend))
     suite.addTests(loader.loadTestsFromModule(test_project_management))
     runner = unittest.TextTestRunner(verbosity=3)
@@ -0,0 +1,287 @@
+# coding=utf-8
+__author__ = 'Christoph Franke'
+__license__ = 'GPL'
+
+import unittest
+import sys
+import threading
+import time
+import tempfile
+import os
+import re
+import hashlib
+import zipfile
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from utilities import get_qgis_app
+
+QGIS_APP, CANVAS, IFACE, PARENT = get_qgis_app()
+
+from projektcheck.utils.connection import (RequestScheduler, RetryRequest,
+                                          ResponseCache, CachedReply, Request)
+from projektcheck.base.dialogs import DownloadWorker, BasedataUpdateWorker
+
+
+class RequestSchedulerTest(unittest.TestCase):
+    """Test limiting and retrying requests"""
+
+    def test_rate_limit(self):
+        scheduler = RequestScheduler(rate=20, burst=1, max_workers=10)
+        timestamps = []
+        start = time.monotonic()
+        scheduler.map(lambda i: scheduler.call(
+            lambda: timestamps.append(time.monotonic())), range(11))
+        # 10 requests after the first one have to wait for a token each
+        self.assertGreaterEqual(time.monotonic() - start, 0.45)
+        self.assertEqual(len(timestamps), 11)
+
+    def test_concurrency(self):
+        scheduler = RequestScheduler(rate=None, max_workers=3)
+        lock = threading.Lock()
+        running = []
+        max_running = []
+
+        def request(i):
+            with lock:
+                running.append(i)
+                max_running.append(len(running))
+            time.sleep(0.05)
+            with lock:
+                running.remove(i)
+            return i * 2
+
+        start = time.monotonic()
+        results = scheduler.map(lambda i: scheduler.call(request, i),
+                                range(9))
+        self.assertEqual(results, [i * 2 for i in range(9)])
+        self.assertEqual(max(max_running), 3)
+        # concurrent requests take less time than the sum of latencies
+        self.assertLess(time.monotonic() - start, 9 * 0.05)
+
+    def test_backoff(self):
+        scheduler = RequestScheduler(rate=None, max_retries=2, backoff=0.05)
+        calls = []
+
+        def request():
+            calls.append(time.monotonic())
+            if len(calls) < 3:
+                raise RetryRequest()
+            return 'done'
+
+        self.assertEqual(scheduler.call(request), 'done')
+        self.assertGreaterEqual(calls[1] - calls[0], 0.05)
+        self.assertGreaterEqual(calls[2] - calls[1], 0.1)
+
+        # retries are exhausted
+        calls.clear()
+        def failing():
+            calls.append(1)
+            raise ConnectionError()
+        self.assertRaises(ConnectionError, scheduler.call, failing)
+        self.assertEqual(len(calls), 3)
+
+
+class ResponseCacheTest(unittest.TestCase):
+    """Test caching responses on disk"""
+    url = 'https://test.de/service'
+
+    def setUp(self):
+        self.path = os.path.join(tempfile.mkdtemp(), 'cache', 'cache.sqlite')
+        self.cache = ResponseCache(self.path, max_size=100)
+
+    def reply(self, content):
+        return CachedReply(self.url, 200, content)
+
+    def test_created_on_access(self):
+        self.cache.register(self.url)
+        self.assertFalse(os.path.exists(self.path))
+        self.assertIsNone(self.cache.get(self.url))
+        self.assertTrue(os.path.exists(self.path))
+
+    def test_lookup(self):
+        # unregistered endpoints are not cached
+        self.cache.put(self.url, {'a': 1}, self.reply(b'x'))
+        self.assertIsNone(self.cache.get(self.url, {'a': 1}))
+
+        self.cache.register(self.url)
+        self.cache.put(self.url, {'a': 1, 'b': 'c'}, self.reply(b'x'))
+        # order of parameters doesn't matter
+        cached = self.cache.get(self.url, {'b': 'c', 'a': '1'})
+        self.assertEqual(cached.content, b'x')
+        self.assertEqual(cached.status_code, 200)
+        self.assertIsNone(self.cache.get(self.url, {'a': 2}))
+
+        stats = self.cache.statistics()[self.url]
+        self.assertEqual(stats['hits'], 1)
+        self.assertEqual(stats['misses'], 1)
+        self.assertEqual(stats['hit_rate'], 0.5)
+
+    def test_expiration(self):
+        version = [1]
+        self.cache.register(self.url, ttl=0.05, version=lambda: version[0])
+        self.cache.put(self.url, {}, self.reply(b'x'))
+        self.assertIsNotNone(self.cache.get(self.url, {}))
+        version[0] = 2
+        self.assertIsNone(self.cache.get(self.url, {}))
+        self.cache.put(self.url, {}, self.reply(b'x'))
+        time.sleep(0.1)
+        self.assertIsNone(self.cache.get(self.url, {}))
+
+        self.cache.register(self.url, expires=lambda params: params['until'])
+        self.cache.put(self.url, {'until': time.time() - 1}, self.reply(b'x'))
+        self.assertIsNone(self.cache.get(self.url, {'until': 0}))
+
+    def test_lru(self):
+        self.cache.register(self.url)
+        for i in range(3):
+            self.cache.put(self.url, {'i': i}, self.reply(b'x' * 40))
+            # keep the first response in use
+            self.cache.get(self.url, {'i': 0})
+        self.assertIsNotNone(self.cache.get(self.url, {'i': 0}))
+        self.assertIsNone(self.cache.get(self.url, {'i': 1}))
+        self.assertIsNotNone(self.cache.get(self.url, {'i': 2}))
+
+
+class FileHandler(BaseHTTPRequestHandler):
+    '''
+    serves the files of the test server, supports range requests
+    '''
+    def do_GET(self):
+        content = self.server.files.get(self.path)
+        if content is None:
+            self.send_error(404)
+            return
+        self.server.ranges.append(self.headers.get('Range'))
+        match = re.match(r'bytes=(\d+)-', self.headers.get('Range') or '')
+        start = int(match.group(1)) if match else 0
+        if start >= len(content):
+            self.send_response(416)
+            self.send_header('Content-Range', f'bytes */{len(content)}')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        self.send_response(206 if match else 200)
+        if match:
+            self.send_header('Content-Range',
+                             f'bytes {start}-{len(content) - 1}/{len(content)}')
+        self.send_header('Content-Length', str(len(content) - start))
+        self.end_headers()
+        self.wfile.write(content[start:])
+
+    def log_message(self, format, *args):
+        pass
+
+
+class DownloadTest(unittest.TestCase):
+    """Test streaming and resuming downloads from a local server"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = HTTPServer(('localhost', 0), FileHandler)
+        cls.server.ranges = []
+        cls.data = os.urandom(3 * 1024 * 1024)
+        buffer = os.path.join(tempfile.mkdtemp(), 'data.zip')
+        with zipfile.ZipFile(buffer, 'w') as zf:
+            zf.writestr('a.gpkg', b'a' * 1000)
+            zf.writestr('sub/b.gpkg', b'b' * 1000)
+        with open(buffer, 'rb') as f:
+            cls.zipped = f.read()
+        cls.server.files = {'/data.bin': cls.data, '/data.zip': cls.zipped,
+                            '/v2/sub/b.gpkg': b'c' * 1000}
+        cls.url = f'http://localhost:{cls.server.server_port}'
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.server.ranges.clear()
+
+    def test_download(self):
+        fp = os.path.join(self.folder, 'data.bin')
+        request = Request(synchronous=True)
+        progress = []
+        request.progress.connect(progress.append)
+        reply = request.download(f'{self.url}/data.bin', fp)
+        self.assertEqual(reply.status_code, 200)
+        with open(fp, 'rb') as f:
+            self.assertEqual(f.read(), self.data)
+        self.assertEqual(progress[-1], 100)
+        self.assertRaises(ConnectionError, request.download,
+                          f'{self.url}/missing.bin', fp)
+
+    def test_resume(self):
+        fp = os.path.join(self.folder, 'data.bin')
+        with open(fp, 'wb') as f:
+            f.write(self.data[:1000000])
+        reply = Request(synchronous=True).download(f'{self.url}/data.bin', fp)
+        self.assertEqual(reply.status_code, 206)
+        self.assertEqual(self.server.ranges, ['bytes=1000000-'])
+        with open(fp, 'rb') as f:
+            self.assertEqual(f.read(), self.data)
+
+    def test_complete(self):
+        fp = os.path.join(self.folder, 'data.bin')
+        with open(fp, 'wb') as f:
+            f.write(self.data)
+        reply = Request(synchronous=True).download(f'{self.url}/data.bin', fp)
+        # the complete file is not downloaded again
+        self.assertEqual(reply.status_code, 416)
+        self.assertEqual(self.server.ranges, [f'bytes={len(self.data)}-'])
+        with open(fp, 'rb') as f:
+            self.assertEqual(f.read(), self.data)
+
+        # a larger file with the same name is replaced
+        with open(fp, 'wb') as f:
+            f.write(self.data + b'x')
+        self.server.ranges.clear()
+        reply = Request(synchronous=True).download(f'{self.url}/data.bin', fp)
+        self.assertEqual(reply.status_code, 200)
+        self.assertEqual(self.server.ranges,
+                         [f'bytes={len(self.data) + 1}-', None])
+        with open(fp, 'rb') as f:
+            self.assertEqual(f.read(), self.data)
+
+    def test_extraction(self):
+        path = os.path.join(self.folder, 'basedata')
+        checksum = hashlib.sha256(self.zipped).hexdigest()
+        worker = DownloadWorker(f'{self.url}/data.zip', path,
+                                checksum=checksum)
+        worker.work()
+        with open(os.path.join(path, 'sub', 'b.gpkg'), 'rb') as f:
+            self.assertEqual(f.read(), b'b' * 1000)
+        self.assertFalse(os.path.exists(worker.part_file))
+
+        worker = DownloadWorker(f'{self.url}/data.zip', path, checksum='0')
+        self.assertRaises(Exception, worker.work)
+        # invalid download is removed
+        self.assertFalse(os.path.exists(worker.part_file))
+
+    def test_delta_update(self):
+        previous = os.path.join(self.folder, '1')
+        os.makedirs(previous)
+        with open(os.path.join(previous, 'a.gpkg'), 'wb') as f:
+            f.write(b'a' * 1000)
+        path = os.path.join(self.folder, '2')
+        download = {'sub/b.gpkg': {
+            'sha256': hashlib.sha256(b'c' * 1000).hexdigest(), 'size': 1000}}
+        reuse = {'a.gpkg': os.path.join(previous, 'a.gpkg')}
+        worker = BasedataUpdateWorker(f'{self.url}/v2', path, download, reuse)
+        worker.work()
+        with open(os.path.join(path, 'a.gpkg'), 'rb') as f:
+            self.assertEqual(f.read(), b'a' * 1000)
+        with open(os.path.join(path, 'sub', 'b.gpkg'), 'rb') as f:
+            self.assertEqual(f.read(), b'c' * 1000)
+        # only the changed file was requested
+        self.assertEqual(len(self.server.ranges), 1)
+        # complete files are not downloaded again
+        worker.work()
+        self.assertEqual(len(self.server.ranges), 1)
+
+
+if __name__ == "__main__":
+    suite = unittest.TestLoader().loadTestsFromModule(
+        sys.modules[__name__])
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
@@ -3,13 +3,17 @@ __author__ = 'Christoph Franke'
 __license__ = 'GPL'
 
 import unittest
+import subprocess
+import sys
+import os
 
 from qgis.PyQt.QtGui import QIcon
 from utilities import get_qgis_app
 QGIS_APP, CANVAS, IFACE, PARENT = get_qgis_app()
 
 from projektcheck.settings import settings
-from projektcheck.main_widget import ProjektCheckControl
+from projektcheck.main_widget import ProjektCheckControl, DOMAINS
+from projektcheck.base.domain import LazyDomain
 
 
 class ProjektCheckDockWidgetTest(unittest.TestCase):
@@ -30,8 +34,37 @@ class ProjektCheckDockWidgetTest(unittest.TestCase):
         icon = QIcon(path)
         self.assertFalse(icon.isNull())
 
+class LazyDomainTest(unittest.TestCase):
+    """Test the deferred import of the domains"""
+
+    def test_descriptors(self):
+        # the information in the menu matches the domain classes
+        for args in DOMAINS:
+            domain = LazyDomain(*args)
+            domain_class = domain.domain_class
+            self.assertEqual(domain.ui_label, domain_class.ui_label)
+            self.assertEqual(domain.ui_icon, domain_class.ui_icon)
+            self.assertEqual(domain.layer_group, domain_class.layer_group)
+
+    def test_deferred_import(self):
+        # import the plugin in a fresh interpreter, the import time is
+        # measured in benchmark.py
+        code = (
+            'import sys\n'
+            'import projektcheck.main_widget\n'
+            'print(",".join(m for m in sys.modules '
+            'if m.startswith("projektcheck.domains.")))\n'
+        )
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+        output = subprocess.check_output([sys.executable, '-c', code],
+                                         env=env, universal_newlines=True)
+        modules = output.strip().split('\n')[-1]
+        for module, *args in DOMAINS:
+            self.assertNotIn(module, modules.split(','))
+
 if __name__ == "__main__":
-    suite = unittest.makeSuite(ProjektCheckDockWidgetTest)
+    suite = unittest.TestLoader().loadTestsFromModule(
+        sys.modules[__name__])
     runner = unittest.TextTestRunner(verbosity=2)
     runner.run(suite)
 
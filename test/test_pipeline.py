@@ -0,0 +1,262 @@
+# coding=utf-8
+__author__ = 'Christoph Franke'
+__license__ = 'GPL'
+
+import unittest
+import time
+import math
+import os
+import threading
+import json
+import tempfile
+
+from qgis.PyQt.QtCore import Qt
+from utilities import get_qgis_app
+QGIS_APP, CANVAS, IFACE, PARENT = get_qgis_app()
+
+from projektcheck.base.domain import Worker, Pipeline, WorkerCancelled
+from projektcheck.utils import processes
+from projektcheck.utils.processes import report
+from projektcheck.utils.instrumentation import (count_read, count_written,
+                                                record_request, Run,
+                                                STATISTICS_FILE)
+
+
+class TableA:
+    class Meta:
+        workspace = 'a'
+
+
+class TableB:
+    class Meta:
+        workspace = 'b'
+
+
+class TableC:
+    class Meta:
+        workspace = 'b'
+
+
+class WorkerError(Exception):
+    pass
+
+
+class SleepingWorker(Worker):
+    duration = 0.3
+
+    def __init__(self, name, inputs=[], outputs=[], log=None, fail=False,
+                 up_to_date=False):
+        super().__init__()
+        self.name = name
+        self.inputs = inputs
+        self.outputs = outputs
+        self.calls = log if log is not None else []
+        self.fail = fail
+        self._up_to_date = up_to_date
+
+    def work(self):
+        self.calls.append(('start', self.name))
+        self.set_progress(50)
+        time.sleep(self.duration)
+        if self.fail:
+            self.exception = WorkerError(f'{self.name} failed')
+            raise self.exception
+        self.calls.append(('end', self.name))
+        return self.name
+
+    def up_to_date(self):
+        return self._up_to_date
+
+
+class PipelineTest(unittest.TestCase):
+    """Test the scheduling of workers in a pipeline"""
+
+    def test_independent(self):
+        # different workspaces, no shared tables
+        calls = []
+        workers = [SleepingWorker('a', outputs=[TableA], log=calls),
+                   SleepingWorker('b', outputs=[TableB], log=calls)]
+        results = Pipeline(workers, max_workers=2).work()
+        self.assertEqual(results, ['a', 'b'])
+        # both ran at the same time
+        self.assertEqual(sorted(calls[:2]), [('start', 'a'), ('start', 'b')])
+
+    def test_dependencies(self):
+        calls = []
+        workers = [SleepingWorker('a', outputs=[TableA], log=calls),
+                   SleepingWorker('b', inputs=[TableA], outputs=[TableB],
+                                  log=calls),
+                   # same workspace as b, runs after b without depending on it
+                   SleepingWorker('c', outputs=[TableC], log=calls),
+                   # undeclared, runs exclusively
+                   SleepingWorker('d', log=calls)]
+        results = Pipeline(workers, max_workers=4).work()
+        self.assertEqual(results, ['a', 'b', 'c', 'd'])
+        self.assertLess(calls.index(('end', 'a')),
+                        calls.index(('start', 'b')))
+        for name in ['b', 'c']:
+            self.assertLess(calls.index(('end', name)),
+                            calls.index(('start', 'd')))
+        b_start, b_end = (calls.index(('start', 'b')),
+                          calls.index(('end', 'b')))
+        c_start = calls.index(('start', 'c'))
+        self.assertFalse(b_start < c_start < b_end)
+
+    def test_skip_and_error(self):
+        calls = []
+        workers = [SleepingWorker('a', outputs=[TableA], log=calls,
+                                  up_to_date=True),
+                   SleepingWorker('b', inputs=[TableA], outputs=[TableB],
+                                  log=calls, fail=True),
+                   SleepingWorker('c', inputs=[TableB], log=calls)]
+        pipeline = Pipeline(workers)
+        with self.assertRaises(WorkerError) as context:
+            pipeline.work()
+        # the exception raised by the worker is passed on
+        self.assertIs(context.exception, workers[1].exception)
+        self.assertEqual(calls, [('start', 'b')])
+
+
+class LoopingWorker(Worker):
+    cancellable = True
+
+    def __init__(self, n_steps=100):
+        super().__init__()
+        self.n_steps = n_steps
+        self.done = 0
+
+    def work(self):
+        for i in range(self.n_steps):
+            self.check_cancelled()
+            time.sleep(0.01)
+            self.done += 1
+
+
+class CancellationTest(unittest.TestCase):
+    """Test the cooperative cancellation of workers"""
+
+    def test_cancel(self):
+        worker = LoopingWorker()
+        threading.Timer(0.1, worker.cancel).start()
+        with self.assertRaises(WorkerCancelled):
+            worker.work()
+        self.assertGreater(worker.done, 0)
+        self.assertLess(worker.done, worker.n_steps)
+
+    def test_cancel_pipeline(self):
+        looping = LoopingWorker()
+        calls = []
+        workers = [looping,
+                   SleepingWorker('b', log=calls)]
+        pipeline = Pipeline(workers)
+        threading.Timer(0.1, pipeline.cancel).start()
+        with self.assertRaises(WorkerCancelled):
+            pipeline.work()
+        self.assertLess(looping.done, looping.n_steps)
+        # the following worker is not started anymore
+        self.assertEqual(calls, [])
+
+
+class ProcessTest(unittest.TestCase):
+    """Test running functions in other processes"""
+
+    def test_run_in_processes(self):
+        worker = SleepingWorker('a')
+        messages = []
+        progress = []
+        worker.message.connect(messages.append, Qt.DirectConnection)
+        worker.progress.connect(progress.append, Qt.DirectConnection)
+        results = worker.run_in_processes(
+            [(math.factorial, (10, )), (os.getpid, ()),
+             (report, ('Hallo', 100))], progress_start=50)
+        self.assertEqual(results[0], 3628800)
+        self.assertNotEqual(results[1], os.getpid())
+        self.assertEqual(messages, ['Hallo'])
+        self.assertIn(int(50 + 50 / 3), progress)
+
+    def test_shutdown(self):
+        worker = SleepingWorker('a')
+        for i in range(2):
+            # a new pool is started after shutting it down
+            results = worker.run_in_processes([(math.factorial, (5, ))])
+            self.assertEqual(results, [120])
+            listeners = [thread for thread in threading.enumerate()
+                         if thread.name == 'process-reports']
+            self.assertEqual(len(listeners), 1)
+            processes.shutdown()
+            # the thread listening to the reports is stopped as well
+            for listener in listeners:
+                listener.join(timeout=5)
+                self.assertFalse(listener.is_alive())
+
+
+class StagedWorker(Worker):
+
+    def __init__(self, project):
+        super().__init__()
+        self.project = project
+
+    def work(self):
+        self.log('<b>Lese</b> Daten...')
+        count_read('test.tabelle', 3)
+        time.sleep(0.1)
+        self.log('Schreibe Daten...')
+        count_written('test.tabelle')
+
+
+class InstrumentationTest(unittest.TestCase):
+    """Test the statistics of the runs of workers"""
+
+    def test_statistics(self):
+        project = type('Project', (), {'path': tempfile.mkdtemp()})
+        worker = StagedWorker(project)
+        worker.run()
+        worker.run()
+        with open(os.path.join(project.path, STATISTICS_FILE)) as f:
+            runs = [json.loads(line) for line in f]
+        self.assertEqual(len(runs), 2)
+        run = runs[-1]
+        self.assertEqual(run['worker'], 'StagedWorker')
+        self.assertEqual([s['name'] for s in run['stages']],
+                         ['Lese Daten...', 'Schreibe Daten...'])
+        self.assertGreaterEqual(run['stages'][0]['seconds'], 0.1)
+        self.assertEqual(run['rows_read'], {'test.tabelle': 3})
+        self.assertEqual(run['rows_written'], {'test.tabelle': 1})
+
+    def test_pipeline(self):
+        # each worker of a pipeline has its own statistics
+        project = type('Project', (), {'path': tempfile.mkdtemp()})
+        pipeline = Pipeline([StagedWorker(project), StagedWorker(project)])
+        pipeline.work()
+        with open(os.path.join(project.path, STATISTICS_FILE)) as f:
+            runs = [json.loads(line) for line in f]
+        self.assertEqual(len(runs), 2)
+        for run in runs:
+            self.assertEqual(run['worker'], 'StagedWorker')
+            self.assertEqual([s['name'] for s in run['stages']],
+                             ['Lese Daten...', 'Schreibe Daten...'])
+            self.assertEqual(run['rows_written'], {'test.tabelle': 1})
+
+    def test_requests(self):
+        record_request('http://localhost/api?q=1', 2)
+        run = Run('test')
+        run.start()
+        record_request('http://localhost/api?q=2', 0.5, cached=True)
+        record_request('http://localhost/api?q=3', 0.2)
+        run.stop()
+        entry = run.requests['http://localhost/api']
+        self.assertEqual(entry['requests'], 2)
+        self.assertEqual(entry['cached'], 1)
+        self.assertAlmostEqual(entry['seconds'], 0.7)
+        # the maximum of this run, not the one of the process
+        self.assertEqual(entry['max_seconds'], 0.5)
+
+
+if __name__ == "__main__":
+    suite = unittest.TestSuite()
+    suite.addTests(unittest.makeSuite(PipelineTest))
+    suite.addTests(unittest.makeSuite(CancellationTest))
+    suite.addTests(unittest.makeSuite(ProcessTest))
+    suite.addTests(unittest.makeSuite(InstrumentationTest))
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
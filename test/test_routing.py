@@ -0,0 +1,121 @@
+# coding=utf-8
+__author__ = 'Christoph Franke'
+__license__ = 'GPL'
+
+import unittest
+import tempfile
+import os
+import json
+import numpy as np
+from osgeo import gdal, ogr, osr
+
+from projektcheck.utils.routing import LocalBackend
+from projektcheck.utils.spatial import Point
+
+
+class LocalBackendTest(unittest.TestCase):
+    """Test routing offline on a local road network"""
+    epsg = 25832
+    # lower left corner of the road grid
+    origin = (565000, 5935000)
+    n = 21
+    spacing = 100
+
+    @classmethod
+    def setUpClass(cls):
+        cls.path = os.path.join(tempfile.mkdtemp(), 'roads.gpkg')
+        driver = ogr.GetDriverByName('GPKG')
+        ds = driver.CreateDataSource(cls.path)
+        srs = osr.SpatialReference()
+        srs.ImportFromEPSG(cls.epsg)
+        layer = ds.CreateLayer('roads', srs=srs, geom_type=ogr.wkbLineString)
+        layer.CreateField(ogr.FieldDefn('speed', ogr.OFTReal))
+        layer.CreateField(ogr.FieldDefn('oneway', ogr.OFTInteger))
+        x0, y0 = cls.origin
+        length = (cls.n - 1) * cls.spacing
+        # grid of horizontal and vertical roads
+        for i in range(cls.n):
+            offset = i * cls.spacing
+            for (x1, y1), (x2, y2) in [
+                ((x0, y0 + offset), (x0 + length, y0 + offset)),
+                ((x0 + offset, y0), (x0 + offset, y0 + length))]:
+                line = ogr.Geometry(ogr.wkbLineString)
+                for j in range(cls.n):
+                    line.AddPoint_2D(x1 + (x2 - x1) * j / (cls.n - 1),
+                                     y1 + (y2 - y1) * j / (cls.n - 1))
+                feature = ogr.Feature(layer.GetLayerDefn())
+                feature.SetGeometry(line)
+                feature.SetField('speed', 36)
+                feature.SetField('oneway', 0)
+                layer.CreateFeature(feature)
+        ds = None
+        cls.backend = LocalBackend(cls.path, layer_name='roads',
+                                   epsg=cls.epsg)
+
+    def point(self, i, j):
+        x0, y0 = self.origin
+        return Point(x0 + i * self.spacing, y0 + j * self.spacing,
+                     epsg=self.epsg)
+
+    def test_graph(self):
+        graph = self.backend.graph
+        self.assertEqual(len(graph), self.n * self.n)
+        self.assertEqual(len(graph.length), 2 * self.n * (self.n - 1))
+        np.testing.assert_allclose(graph.length, self.spacing)
+
+    def test_route(self):
+        coords = self.backend.route(self.point(0, 0), self.point(5, 5),
+                                    mode='CAR')
+        # 10 links to pass plus the destination itself
+        self.assertEqual(len(coords), 12)
+        lat, lon = coords[0]
+        source = self.point(0, 0).transform(4326, inplace=False)
+        self.assertAlmostEqual(lat, source.y, places=5)
+        self.assertAlmostEqual(lon, source.x, places=5)
+        # destination far off the road network
+        self.assertEqual(
+            self.backend.route(self.point(0, 0), self.point(-100, -100)), [])
+
+    def test_travel_time_raster(self):
+        out_raster = os.path.join(tempfile.mkdtemp(), 'raster.tif')
+        raster = self.backend.travel_time_raster(
+            self.point(10, 10), out_raster, speed=6, resolution=100,
+            target_epsg=self.epsg)
+        ds = gdal.Open(raster)
+        values = ds.GetRasterBand(1).ReadAsArray()
+        ulx, xres, _, uly, _, yres = ds.GetGeoTransform()
+        ds = None
+        x, y = self.point(20, 0).x, self.point(20, 0).y
+        col = int((x - ulx) / xres)
+        row = int((y - uly) / yres)
+        # 2000 m with 6 km/h take 20 minutes
+        self.assertAlmostEqual(values[row, col], 20, delta=1)
+        self.assertLess(values.min(), 1)
+
+    def test_isochrone(self):
+        center = self.point(10, 10)
+        geo_json = self.backend.isochrone(center, 'WALK', 300, 1)
+        self.assertIn(geo_json['type'], ['Polygon', 'MultiPolygon'])
+        geom = ogr.CreateGeometryFromJson(json.dumps(geo_json))
+        c = center.transform(4326, inplace=False)
+        pnt = ogr.Geometry(ogr.wkbPoint)
+        pnt.AddPoint_2D(c.x, c.y)
+        self.assertTrue(geom.Contains(pnt))
+        far = self.point(20, 20).transform(4326, inplace=False)
+        pnt = ogr.Geometry(ogr.wkbPoint)
+        pnt.AddPoint_2D(far.x, far.y)
+        self.assertFalse(geom.Contains(pnt))
+
+    def test_isochrones(self):
+        geo_jsons = self.backend.isochrones(self.point(10, 10), 'WALK',
+                                            [120, 300, 0], 1)
+        self.assertIsNone(geo_jsons[2])
+        inner, outer = [ogr.CreateGeometryFromJson(json.dumps(g))
+                        for g in geo_jsons[:2]]
+        self.assertLess(inner.GetArea(), outer.GetArea())
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(LocalBackendTest)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
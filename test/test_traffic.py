@@ -0,0 +1,121 @@
+# coding=utf-8
+__author__ = 'Christoph Franke'
+__license__ = 'GPL'
+
+import unittest
+import sys
+import tempfile
+import os
+
+from projektcheck.domains.traffic.otp_router import OTPRouter
+from projektcheck.utils.polyline import PolylineCodec
+
+
+class OTPRouterTest(unittest.TestCase):
+    """Test the calculation of transfer nodes"""
+
+    def setUp(self):
+        self.router = OTPRouter()
+
+    def add_route(self, route_id, coords, transfer_idx):
+        '''
+        add route along given coordinates and mark the node at given index
+        as its transfer node
+        '''
+        nodes = self.router.nodes.add_coordinates(coords)
+        route = self.router.routes.add_route(route_id, 0, nodes=nodes)
+        self.router.transfer_nodes.get_node(nodes[transfer_idx], route)
+        return nodes[transfer_idx]
+
+    def test_remove_redundancies(self):
+        # route 0 passes the transfer node of route 1 -> redundant
+        tn0 = self.add_route(0, [(0, 0), (1, 0), (2, 0), (3, 0)], 2)
+        tn1 = self.add_route(1, [(0, 0), (1, 0), (1, 1)], 1)
+        # route 2 only shares the source
+        tn2 = self.add_route(2, [(0, 0), (0, 1), (0, 2)], 1)
+        # the destination of route 3 is the transfer node of route 2,
+        # destinations don't count as being part of a route
+        tn3 = self.add_route(3, [(0, 0), (-1, 0), (0, 1)], 1)
+
+        self.router.remove_redundancies()
+
+        self.assertNotIn(tn1.node_id, self.router.transfer_nodes)
+        self.assertNotIn(1, self.router.routes)
+        for tn in [tn0, tn2, tn3]:
+            self.assertIn(tn.node_id, self.router.transfer_nodes)
+        self.assertEqual(list(self.router.routes.keys()), [0, 2, 3])
+
+    def test_mutual_redundancy(self):
+        # both transfer nodes lie on each others routes, only one of them
+        # may be removed
+        tn0 = self.add_route(0, [(0, 0), (1, 0), (2, 0), (3, 0)], 1)
+        tn1 = self.add_route(1, [(0, 0), (1, 0), (2, 0), (2, 1)], 2)
+
+        self.router.remove_redundancies()
+
+        self.assertEqual(len(self.router.transfer_nodes), 1)
+        self.assertEqual(len(self.router.routes), 1)
+        self.assertNotIn(tn0.node_id, self.router.transfer_nodes)
+        self.assertIn(tn1.node_id, self.router.transfer_nodes)
+
+
+def grid_router(n, spacing=0.001):
+    '''
+    router with routes on a grid of n x n nodes as if returned by OTP, one
+    route per row and direction, each leading from the center of the grid
+    along the middle column to its row and along this row to the edge of the
+    grid
+    '''
+    router = OTPRouter(epsg=25832)
+    codec = PolylineCodec()
+    lat0, lon0 = 53.5, 10.0
+    center = n // 2
+    for row in range(n):
+        for direction in [-1, 1]:
+            step = 1 if row >= center else -1
+            coords = [(lat0 + r * spacing, lon0 + center * spacing)
+                      for r in range(center, row + step, step)]
+            end = n if direction == 1 else -1
+            coords += [(lat0 + row * spacing, lon0 + c * spacing)
+                       for c in range(center + direction, end, direction)]
+            # the last coordinate is dropped when adding a route
+            coords.append(coords[-1])
+            json = {'plan': {'itineraries': [{'legs': [{'legGeometry': {
+                'points': codec.encode(coords)}}]}]}}
+            router.add_route(json, source_id=0)
+    return router
+
+
+class OTPRouterGraphTest(unittest.TestCase):
+    """Test building and reusing a persisted graph"""
+    n = 21
+
+    def setUp(self):
+        self.router = grid_router(self.n)
+
+    def test_graph(self):
+        self.assertGreaterEqual(len(self.router.nodes), self.n * self.n)
+        self.router.build_graph()
+
+        file_path = os.path.join(tempfile.mkdtemp(), 'otpgraph.pickle')
+        self.router.save(file_path)
+
+        for distance in [500, 1000, 2000]:
+            router = OTPRouter.load(file_path)
+            router.calculate_transfer_nodes(distance=distance)
+            router.remove_redundancies()
+            self.assertGreater(len(router.transfer_nodes), 0)
+            for tn in router.transfer_nodes.values():
+                self.assertLessEqual(tn.dist, distance)
+
+        # the persisted graph is not altered by the calculation
+        router = OTPRouter.load(file_path)
+        self.assertEqual(len(router.routes), len(self.router.routes))
+        self.assertEqual(len(router.transfer_nodes), 0)
+
+
+if __name__ == "__main__":
+    suite = unittest.TestLoader().loadTestsFromModule(
+        sys.modules[__name__])
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
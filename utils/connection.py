@@ -2,7 +2,18 @@ from qgis.core import QgsNetworkAccessManager
 from qgis.PyQt.QtNetwork import QNetworkRequest, QNetworkReply
 from qgis.PyQt.QtCore import (QUrl, QEventLoop, QTimer, QUrlQuery,
                               QObject, pyqtSignal)
+import os
+import re
 import json
+import time
+import hashlib
+import sqlite3
+import threading
+from typing import Callable, Iterable
+from contextlib import contextmanager, closing
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from projektcheck.utils.instrumentation import record_request
 
 
 class Reply:
@@ -89,6 +100,295 @@ class Reply:
         return headers
 
 
+class CachedReply(Reply):
+    '''
+    reply restored from the response cache, matches the interface of Reply
+    '''
+    def __init__(self, url: str, status_code: int, content: bytes):
+        '''
+        Parameters
+        ----------
+        url : str
+            the requested URL
+        status_code : int
+            the HTML status code returned by the server when caching the reply
+        content : bytes
+            the cached response of the server
+        '''
+        self.reply = None
+        self._url = url
+        self._status_code = status_code
+        self.raw_data = content
+
+    @property
+    def url(self) -> str:
+        return self._url
+
+    @property
+    def status_code(self) -> int:
+        return self._status_code
+
+    @property
+    def content(self) -> bytes:
+        return self.raw_data
+
+    @property
+    def headers(self) -> dict:
+        return {}
+
+
+class ResponseCache:
+    '''
+    persistent cache of responses to GET-requests in a SQLite file, only
+    responses of registered endpoints are cached, the least recently used
+    responses are removed when the size limit is exceeded
+
+    the cache may be used by multiple threads and by multiple instances
+    sharing the same file, the file is created on first access
+    '''
+    def __init__(self, path: str, max_size: int = 100 * 1024 * 1024):
+        '''
+        Parameters
+        ----------
+        path : str
+            path to the cache file, created on first access if not existing
+        max_size : int, optional
+            maximum total size of the cached responses in bytes,
+            defaults to 100 MB
+        '''
+        self.path = path
+        self.max_size = max_size
+        self._endpoints = {}
+        self._created = False
+
+    def _create(self, conn: sqlite3.Connection):
+        '''
+        create the tables of the cache if not existing
+        '''
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS responses ('
+            'key TEXT PRIMARY KEY, endpoint TEXT, url TEXT, '
+            'status INTEGER, content BLOB, size INTEGER, expires REAL, '
+            'accessed REAL)')
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS statistics ('
+            'endpoint TEXT PRIMARY KEY, hits INTEGER, misses INTEGER)')
+        self._created = True
+
+    @contextmanager
+    def _connect(self) -> sqlite3.Connection:
+        '''
+        new connection to the cache file (connections can't be shared between
+        threads), the changes are committed and the connection is closed when
+        leaving the context
+        '''
+        if not self._created:
+            folder = os.path.dirname(self.path)
+            if folder:
+                os.makedirs(folder, exist_ok=True)
+        with closing(sqlite3.connect(self.path, timeout=30)) as conn:
+            with conn:
+                if not self._created:
+                    self._create(conn)
+                yield conn
+
+    def register(self, url: str, ttl: float = None, expires: Callable = None,
+                 version: Callable = None, validate: Callable = None):
+        '''
+        cache the responses of requests to the url (and all urls starting with
+        it)
+
+        Parameters
+        ----------
+        url : str
+            the url of the endpoint
+        ttl : float, optional
+            time in seconds the responses are valid, never expire if neither
+            ttl nor expires are given
+        expires : function, optional
+            function expecting the query parameters of a request and returning
+            the timestamp (seconds since epoch) the response will expire at,
+            preceding the ttl
+        version : function, optional
+            function returning the version of the requested data, responses
+            cached for other versions are not used anymore
+        validate : function, optional
+            function expecting a reply and returning whether it is valid,
+            invalid replies are not cached, defaults to caching all
+            successful replies
+        '''
+        self._endpoints[url] = {'ttl': ttl, 'expires': expires,
+                                'version': version, 'validate': validate}
+
+    def _endpoint(self, url: str) -> str:
+        '''
+        registered endpoint (longest match) the url belongs to, None if not
+        registered
+        '''
+        matches = [e for e in self._endpoints if url.startswith(e)]
+        return max(matches, key=len) if matches else None
+
+    def _key(self, endpoint: str, url: str, params: dict) -> str:
+        '''
+        key of request, independent of the order of the parameters
+        '''
+        version = self._endpoints[endpoint]['version']
+        params = sorted((str(k), str(v)) for k, v in (params or {}).items())
+        key = json.dumps([url, params, version() if version else None])
+        return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+    def _count(self, conn: sqlite3.Connection, endpoint: str, hit: bool):
+        conn.execute(
+            'INSERT OR IGNORE INTO statistics VALUES (?, 0, 0)', (endpoint, ))
+        column = 'hits' if hit else 'misses'
+        conn.execute(f'UPDATE statistics SET {column} = {column} + 1 '
+                     'WHERE endpoint = ?', (endpoint, ))
+
+    def get(self, url: str, params: dict = None) -> CachedReply:
+        '''
+        look up the cached response to a request
+
+        Parameters
+        ----------
+        url : str
+            the requested url
+        params : dict, optional
+            query parameters of the request
+
+        Returns
+        ----------
+        CachedReply
+            the cached response, None if the request is not cached or the
+            cached response expired
+        '''
+        endpoint = self._endpoint(url)
+        if not endpoint:
+            return None
+        key = self._key(endpoint, url, params)
+        now = time.time()
+        with self._connect() as conn:
+            row = conn.execute(
+                'SELECT status, content, expires FROM responses '
+                'WHERE key = ?', (key, )).fetchone()
+            if row and row[2] is not None and row[2] <= now:
+                conn.execute('DELETE FROM responses WHERE key = ?', (key, ))
+                row = None
+            if row:
+                conn.execute('UPDATE responses SET accessed = ? '
+                             'WHERE key = ?', (now, key))
+            self._count(conn, endpoint, hit=row is not None)
+        if not row:
+            return None
+        return CachedReply(url, row[0], row[1])
+
+    def put(self, url: str, params: dict, reply: Reply):
+        '''
+        cache a successful response to a request to a registered endpoint
+
+        Parameters
+        ----------
+        url : str
+            the requested url
+        params : dict
+            query parameters of the request
+        reply : Reply
+            the response of the server
+        '''
+        endpoint = self._endpoint(url)
+        if not endpoint or reply.status_code != 200:
+            return
+        rule = self._endpoints[endpoint]
+        if rule['validate'] and not rule['validate'](reply):
+            return
+        now = time.time()
+        expires = None
+        if rule['expires']:
+            expires = rule['expires'](params or {})
+        elif rule['ttl'] is not None:
+            expires = now + rule['ttl']
+        content = bytes(reply.content)
+        if len(content) > self.max_size:
+            return
+        with self._connect() as conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, '
+                '?, ?)', (self._key(endpoint, url, params), endpoint, url,
+                          reply.status_code, content, len(content), expires,
+                          now))
+            self._evict(conn)
+
+    def _evict(self, conn: sqlite3.Connection):
+        '''
+        remove expired responses and the least recently used ones exceeding
+        the size limit
+        '''
+        conn.execute('DELETE FROM responses WHERE expires <= ?',
+                     (time.time(), ))
+        total = conn.execute(
+            'SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+        if total <= self.max_size:
+            return
+        rows = conn.execute(
+            'SELECT key, size FROM responses ORDER BY accessed').fetchall()
+        remove = []
+        for key, size in rows:
+            if total <= self.max_size:
+                break
+            remove.append((key, ))
+            total -= size
+        conn.executemany('DELETE FROM responses WHERE key = ?', remove)
+
+    def statistics(self) -> dict:
+        '''
+        number of hits and misses when looking up responses
+
+        Returns
+        ----------
+        dict
+            endpoints as keys and dictionaries with the number of hits, misses
+            and the hit rate as values
+        '''
+        with self._connect() as conn:
+            rows = conn.execute(
+                'SELECT endpoint, hits, misses FROM statistics').fetchall()
+        return {endpoint: {'hits': hits, 'misses': misses,
+                           'hit_rate': hits / (hits + misses)
+                           if hits + misses else 0}
+                for endpoint, hits, misses in rows}
+
+    def clear(self):
+        '''
+        remove all cached responses and reset the statistics
+        '''
+        with self._connect() as conn:
+            conn.execute('DELETE FROM responses')
+            conn.execute('DELETE FROM statistics')
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache() -> ResponseCache:
+    '''
+    the response cache shared by all requests of the plugin (at the path and
+    with the size set in the settings), created on first call
+
+    Returns
+    -------
+    ResponseCache
+        the shared cache
+    '''
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            # the settings import the projects which depend on this module
+            from projektcheck.settings import settings
+            _cache = ResponseCache(settings.CACHE_PATH,
+                                   max_size=settings.CACHE_SIZE)
+        return _cache
+
+
 class Request(QObject):
     '''
     Wrapper of QgsNetworkAccessManager to match interface of requests library,
@@ -109,23 +409,28 @@ class Request(QObject):
     error = pyqtSignal(str)
     progress = pyqtSignal(int)
 
-    def __init__(self, synchronous: bool = False):
+    def __init__(self, synchronous: bool = False,
+                 cache: ResponseCache = None):
         '''
         Parameters
         ----------
         synchronous : bool, optional
             requests are made either synchronous (True) or asynchronous (False),
             defaults to synchronous calls
+        cache : ResponseCache, optional
+            cache to look up and store the responses to synchronous
+            GET-requests in, defaults to no caching
         '''
         super().__init__()
         self.synchronous = synchronous
+        self.cache = cache
 
     @property
     def _manager(self) -> QgsNetworkAccessManager:
         return QgsNetworkAccessManager.instance()
 
     def get(self, url: str, params: dict = None,
-            timeout: int = 10000, **kwargs) -> Reply:
+            timeout: int = 10000, use_cache: bool = True, **kwargs) -> Reply:
         '''
         queries given url (GET)
 
@@ -135,10 +440,13 @@ class Request(QObject):
             the url to request
         params : dict, optional
             query parameters with the parameters as keys and the values as
-            values, defaults to no query parameters
+            values (lists as multiple values), defaults to no query parameters
         timeout : int, optional
             the timeout of synchronous requests in milliseconds, will be ignored
             when making asynchronous requests, defaults to 10000 ms
+        use_cache : bool, optional
+            look up the response in the cache (if the request has one) before
+            requesting the server, defaults to using the cache
         **kwargs :
             additional parameters matching the requests interface will
             be ignored (e.g. verify is not supported)
@@ -155,11 +463,28 @@ class Request(QObject):
         if params:
             query = QUrlQuery()
             for param, value in params.items():
-                query.addQueryItem(param, str(value))
+                # lists are passed as multiple values of the same parameter
+                values = value if isinstance(value, (list, tuple)) \
+                    else [value]
+                for v in values:
+                    query.addQueryItem(param, str(v))
             qurl.setQuery(query.query())
 
         if self.synchronous:
-            return self._get_sync(qurl, timeout=timeout)
+            start = time.perf_counter()
+            use_cache = use_cache and self.cache is not None
+            if use_cache:
+                res = self.cache.get(url, params)
+                if res:
+                    record_request(url, time.perf_counter() - start,
+                                   cached=True)
+                    self.finished.emit(res)
+                    return res
+            res = self._get_sync(qurl, timeout=timeout)
+            record_request(url, time.perf_counter() - start)
+            if use_cache:
+                self.cache.put(url, params, res)
+            return res
 
         return self._get_async(qurl)
 
@@ -198,15 +523,125 @@ class Request(QObject):
         if params:
             query = QUrlQuery()
             for param, value in params.items():
-                query.addQueryItem(param, str(value))
+                # lists are passed as multiple values of the same parameter
+                values = value if isinstance(value, (list, tuple)) \
+                    else [value]
+                for v in values:
+                    query.addQueryItem(param, str(v))
             qurl.setQuery(query.query())
 
         if self.synchronous:
-            return self._post_sync(qurl, timeout=timeout, data=data)
+            start = time.perf_counter()
+            res = self._post_sync(qurl, timeout=timeout, data=data)
+            record_request(url, time.perf_counter() - start)
+            return res
 
         return self._post_async(qurl)
 
 
+    def download(self, url: str, file_path: str, resume: bool = True,
+                 timeout: int = 30000, chunk_size: int = 1024 * 1024
+                 ) -> Reply:
+        '''
+        synchronously downloads the file at the given url (GET) and streams it
+        into a file while the data arrives instead of keeping it in memory
+
+        an existing (partially downloaded) file is continued by requesting
+        only the missing bytes (HTTP Range request), it is overwritten if the
+        server doesn't support ranges
+
+        Parameters
+        ----------
+        url : str
+            the url of the file to download
+        file_path : str
+            the path of the file to write the data to
+        resume : bool, optional
+            continue the download of an existing file if True, download the
+            whole file otherwise, defaults to continuing
+        timeout : int, optional
+            time in milliseconds without receiving any data before the download
+            is aborted, defaults to 30000 ms
+        chunk_size : int, optional
+            maximum number of bytes read from the network buffer at once,
+            defaults to 1 MB
+
+        Returns
+        ----------
+        Reply
+           the response, the content is not kept in memory, status code 416 if
+           the existing file was already complete
+
+        Raises
+        -------
+        ConnectionError
+            timeout or network error
+        '''
+        offset = os.path.getsize(file_path) \
+            if resume and os.path.exists(file_path) else 0
+        request = QNetworkRequest(QUrl(url))
+        if offset:
+            request.setRawHeader(b'Range', f'bytes={offset}-'.encode())
+        loop = QEventLoop()
+        timer = QTimer()
+        timer.setSingleShot(True)
+        timer.timeout.connect(loop.quit)
+        reply = self._manager.get(request)
+        reply.finished.connect(loop.quit)
+        f = None
+
+        def write():
+            nonlocal f
+            # decide on first data whether to append or to start over
+            if f is None:
+                status = reply.attribute(
+                    QNetworkRequest.HttpStatusCodeAttribute)
+                if status not in (200, 206):
+                    return
+                f = open(file_path, 'ab' if status == 206 else 'wb')
+            while reply.bytesAvailable() > 0:
+                f.write(bytes(reply.read(chunk_size)))
+            timer.start(timeout)
+
+        def progress(received, total):
+            if total > 0:
+                self.progress.emit(
+                    int(100 * (offset + received) / (offset + total)))
+
+        reply.readyRead.connect(write)
+        reply.downloadProgress.connect(progress)
+        timer.start(timeout)
+        try:
+            loop.exec()
+            if not reply.isFinished():
+                reply.abort()
+                raise ConnectionError('Timeout')
+            # remaining data of the last chunk
+            write()
+        finally:
+            timer.stop()
+            if f is not None:
+                f.close()
+        status = reply.attribute(QNetworkRequest.HttpStatusCodeAttribute)
+        # range not satisfiable, the existing file is complete if it has the
+        # size of the file on the server, else it is downloaded again
+        if status == 416 and offset:
+            match = re.match(rb'bytes \*/(\d+)',
+                             bytes(reply.rawHeader(b'Content-Range')))
+            if match and int(match.group(1)) == offset:
+                self.progress.emit(100)
+                res = Reply(reply)
+                self.finished.emit(res)
+                return res
+            return self.download(url, file_path, resume=False,
+                                 timeout=timeout, chunk_size=chunk_size)
+        if reply.error():
+            self.error.emit(reply.errorString())
+            raise ConnectionError(reply.errorString())
+        res = Reply(reply)
+        self.finished.emit(res)
+        return res
+
     def _get_sync(self, qurl: QUrl, timeout: int = 10000) -> Reply:
         '''
         synchronous GET-request
@@ -303,3 +738,163 @@ class Request(QObject):
         '''
         raise NotImplementedError
 
+
+
+def file_hash(file_path: str, algorithm: str = 'sha256',
+              chunk_size: int = 1024 * 1024) -> str:
+    '''
+    hash of the content of a file, the file is read in chunks
+
+    Parameters
+    ----------
+    file_path : str
+        path to the file
+    algorithm : str, optional
+        name of the hash algorithm (as in hashlib), defaults to SHA-256
+    chunk_size : int, optional
+        number of bytes read at once, defaults to 1 MB
+
+    Returns
+    ----------
+    str
+        the hex digest of the hash
+    '''
+    h = hashlib.new(algorithm)
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class RetryRequest(Exception):
+    '''
+    raised by functions run by the RequestScheduler to signal that the request
+    should be repeated (e.g. because the response was empty due to too many
+    requests)
+    '''
+
+
+class RequestScheduler:
+    '''
+    runs requests concurrently while limiting the request rate (token bucket)
+    and the number of simultaneous requests, failed requests are repeated with
+    exponentially growing pauses
+
+    may be shared by multiple threads and callers, so that all requests to the
+    same server respect the same limits
+    '''
+    def __init__(self, rate: float = 2, burst: int = 1, max_workers: int = 4,
+                 max_retries: int = 2, backoff: float = 1,
+                 retry_on: tuple = (ConnectionError, RetryRequest)):
+        '''
+        Parameters
+        ----------
+        rate : float, optional
+            maximum number of requests per second on average, no limit if None,
+            defaults to 2 requests per second
+        burst : int, optional
+            maximum number of requests made at once when the limit was not
+            exhausted before (size of the token bucket), defaults to 1
+        max_workers : int, optional
+            maximum number of concurrent requests, defaults to 4
+        max_retries : int, optional
+            number of retries of a failed request, defaults to 2
+        backoff : float, optional
+            pause in seconds before the first retry, doubled with each
+            further retry, defaults to 1 second
+        retry_on : tuple, optional
+            exceptions causing a retry, defaults to connection errors and
+            RetryRequest
+        '''
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.retry_on = retry_on
+        self._tokens = self.burst
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_workers)
+
+    def _acquire_token(self):
+        '''
+        block until the rate limit allows another request
+        '''
+        if not self.rate:
+            return
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(
+                self.burst, self._tokens + (now - self._last) * self.rate)
+            self._last = now
+            # reserve the token, callers queue up by taking the bucket
+            # into debt
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0
+        if wait > 0:
+            time.sleep(wait)
+
+    def call(self, func: Callable, *args, **kwargs) -> object:
+        '''
+        call the (requesting) function respecting the limits of the scheduler,
+        it is called again with growing pauses as long as it raises one of the
+        exceptions in retry_on and the number of retries is not exceeded
+
+        Returns
+        ----------
+        object
+            the return value of the function
+        '''
+        retries = 0
+        while True:
+            self._acquire_token()
+            try:
+                with self._slots:
+                    return func(*args, **kwargs)
+            except self.retry_on:
+                if retries >= self.max_retries:
+                    raise
+            time.sleep(self.backoff * 2 ** retries)
+            retries += 1
+
+    def map(self, func: Callable, items: Iterable,
+            callback: Callable = None) -> list:
+        '''
+        call the function concurrently for each item (with max_workers
+        threads), the function itself has to make its requests via call() to
+        respect the limits, the first error raised cancels the remaining calls
+        and is raised
+
+        Parameters
+        ----------
+        func : function
+            function expecting a single item as argument
+        items : iterable
+            the items to call the function with
+        callback : function, optional
+            called in the calling thread each time a call is done with the
+            number of finished calls and the total number of calls
+
+        Returns
+        ----------
+        list
+            the return values in the order of the items
+        '''
+        items = list(items)
+        if not items:
+            return []
+        results = [None] * len(items)
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {executor.submit(func, item): i
+                       for i, item in enumerate(items)}
+            try:
+                for n, future in enumerate(as_completed(futures)):
+                    results[futures[future]] = future.result()
+                    if callback:
+                        callback(n + 1, len(items))
+            except Exception:
+                for future in futures:
+                    future.cancel()
+                raise
+        return results
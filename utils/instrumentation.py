@@ -0,0 +1,256 @@
+# -*- coding: utf-8 -*-
+'''
+***************************************************************************
+    instrumentation.py
+    ---------------------
+    Date                 : October 2026
+    Copyright            : (C) 2026 by Christoph Franke
+    Email                : franke at ggr-planung dot de
+***************************************************************************
+*                                                                         *
+*   This program is free software: you can redistribute it and/or modify  *
+*   it under the terms of the GNU General Public License as published by  *
+*   the Free Software Foundation; either version 3 of the License, or     *
+*   (at your option) any later version.                                   *
+*                                                                         *
+***************************************************************************
+
+instrumentation of the workers, measures the duration of their stages, counts
+the rows read and written per database table and the requests and their
+latencies per endpoint
+
+the counters are kept for the whole process, the statistics of a run are the
+differences between its start and its end (runs at the same time are counted
+in each other's statistics), the maximum duration of the requests is tracked
+per running run
+'''
+
+__author__ = 'Christoph Franke'
+__date__ = '19/10/2026'
+__copyright__ = 'Copyright 2026, HafenCity University Hamburg'
+
+import os
+import re
+import json
+import time
+import cProfile
+import threading
+from datetime import datetime
+from collections import defaultdict
+from urllib.parse import urlsplit
+
+# rows per table name
+rows_read = defaultdict(int)
+rows_written = defaultdict(int)
+# per endpoint: number of requests, responses taken from the cache,
+# total and maximum duration of the requests in seconds
+requests = defaultdict(lambda: {'requests': 0, 'cached': 0,
+                                'seconds': 0., 'max_seconds': 0.})
+# the started and not yet stopped runs
+_runs = set()
+_lock = threading.Lock()
+
+STATISTICS_FILE = 'worker-statistics.jsonl'
+
+
+def count_read(table: str, n: int = 1):
+    '''
+    count rows read from a database table
+
+    Parameters
+    ----------
+    table : str
+        name of the table
+    n : int, optional
+        number of rows, defaults to one row
+    '''
+    with _lock:
+        rows_read[table] += n
+
+
+def count_written(table: str, n: int = 1):
+    '''
+    count rows written to (added, changed or deleted in) a database table
+
+    Parameters
+    ----------
+    table : str
+        name of the table
+    n : int, optional
+        number of rows, defaults to one row
+    '''
+    with _lock:
+        rows_written[table] += n
+
+
+def endpoint(url: str) -> str:
+    '''
+    the url without query and fragment
+    '''
+    parts = urlsplit(url)
+    return f'{parts.scheme}://{parts.netloc}{parts.path}'
+
+
+def record_request(url: str, seconds: float, cached: bool = False):
+    '''
+    record a request
+
+    Parameters
+    ----------
+    url : str
+        the requested url
+    seconds : float
+        the duration of the request
+    cached : bool, optional
+        the response was taken from the cache, defaults to a request to the
+        server
+    '''
+    url = endpoint(url)
+    with _lock:
+        entry = requests[url]
+        entry['requests'] += 1
+        entry['cached'] += int(cached)
+        entry['seconds'] += seconds
+        entry['max_seconds'] = max(entry['max_seconds'], seconds)
+        for run in _runs:
+            run._max_seconds[url] = max(run._max_seconds.get(url, 0),
+                                        seconds)
+
+
+class Run:
+    '''
+    statistics of a single run of a worker
+
+    Attributes
+    ----------
+    stages : list
+        the stages of the run as tuples of name and duration in seconds
+    rows_read : dict
+        number of rows read per table name
+    rows_written : dict
+        number of rows written per table name
+    requests : dict
+        per endpoint the number of requests, the responses taken from the
+        cache and the total and maximum duration in seconds
+    '''
+    def __init__(self, name: str, profile: bool = False):
+        '''
+        Parameters
+        ----------
+        name : str
+            name of the worker
+        profile : bool, optional
+            profile the calls with cProfile in the thread the run is started
+            in, defaults to no profiling
+        '''
+        self.name = name
+        self.stages = []
+        self.rows_read = {}
+        self.rows_written = {}
+        self.requests = {}
+        self.duration = None
+        self.profiler = cProfile.Profile() if profile else None
+        self._stage = None
+
+    def start(self):
+        '''
+        start the run (in the thread of the worker)
+        '''
+        self.started = datetime.now()
+        self._start = self._stage_start = time.perf_counter()
+        with _lock:
+            self._rows_read = dict(rows_read)
+            self._rows_written = dict(rows_written)
+            self._requests = {k: dict(v) for k, v in requests.items()}
+            self._max_seconds = {}
+            _runs.add(self)
+        if self.profiler:
+            try:
+                self.profiler.enable()
+            # only one profiler may be active at a time (Python >= 3.12)
+            except ValueError:
+                self.profiler = None
+
+    def stage(self, name: str):
+        '''
+        end the current stage and start the next one
+
+        Parameters
+        ----------
+        name : str
+            name of the next stage (e.g. the logged message, markup is
+            removed)
+        '''
+        # the run is already stopped
+        if self.duration is not None:
+            return
+        now = time.perf_counter()
+        if self._stage is not None:
+            self.stages.append((self._stage, now - self._stage_start))
+        name = re.sub('<[^>]*>|&nbsp;', ' ', name)
+        self._stage = re.sub(r'\s+', ' ', name).strip()
+        self._stage_start = now
+
+    def stop(self):
+        '''
+        end the run
+        '''
+        if self.profiler:
+            self.profiler.disable()
+        now = time.perf_counter()
+        if self._stage is not None:
+            self.stages.append((self._stage, now - self._stage_start))
+            self._stage = None
+        self.duration = now - self._start
+
+        def diff(counts, previous):
+            return {k: v - previous.get(k, 0) for k, v in counts.items()
+                    if v != previous.get(k, 0)}
+
+        with _lock:
+            _runs.discard(self)
+            self.rows_read = diff(rows_read, self._rows_read)
+            self.rows_written = diff(rows_written, self._rows_written)
+            for url, entry in requests.items():
+                previous = self._requests.get(url, {})
+                n = entry['requests'] - previous.get('requests', 0)
+                if n == 0:
+                    continue
+                self.requests[url] = {
+                    'requests': n,
+                    'cached': entry['cached'] - previous.get('cached', 0),
+                    'seconds': entry['seconds'] - previous.get('seconds', 0),
+                    'max_seconds': self._max_seconds.get(url, 0)
+                }
+
+    def to_dict(self) -> dict:
+        '''
+        the statistics as a dictionary
+        '''
+        return {
+            'worker': self.name,
+            'started': self.started.isoformat(timespec='seconds'),
+            'seconds': self.duration,
+            'stages': [{'name': name, 'seconds': seconds}
+                       for name, seconds in self.stages],
+            'rows_read': self.rows_read,
+            'rows_written': self.rows_written,
+            'requests': self.requests,
+        }
+
+    def save(self, folder: str):
+        '''
+        append the statistics to the statistics file in the given folder
+        (one JSON object per line) and dump the profile if profiled
+
+        Parameters
+        ----------
+        folder : str
+            the folder (e.g. of the project)
+        '''
+        with open(os.path.join(folder, STATISTICS_FILE), 'a') as f:
+            f.write(json.dumps(self.to_dict()) + '\n')
+        if self.profiler:
+            timestamp = self.started.strftime('%Y%m%d-%H%M%S')
+            self.profiler.dump_stats(os.path.join(
+                folder, f'profile-{self.name}-{timestamp}.pstats'))
@@ -0,0 +1,244 @@
+# -*- coding: utf-8 -*-
+'''
+***************************************************************************
+    processes.py
+    ---------------------
+    Date                 : October 2026
+    Copyright            : (C) 2026 by Christoph Franke
+    Email                : franke at ggr-planung dot de
+***************************************************************************
+*                                                                         *
+*   This program is free software: you can redistribute it and/or modify  *
+*   it under the terms of the GNU General Public License as published by  *
+*   the Free Software Foundation; either version 3 of the License, or     *
+*   (at your option) any later version.                                   *
+*                                                                         *
+***************************************************************************
+
+shared pool of processes to run CPU-bound calculations in parallel without
+being blocked by the GIL (and without blocking the user interface of QGIS)
+
+the functions and their arguments have to be picklable and must not depend on
+QGIS or on open database connections (e.g. functions of numpy and pandas on
+dataframes and arrays). They may report messages and their progress with
+report()
+'''
+
+__author__ = 'Christoph Franke'
+__date__ = '19/10/2026'
+__copyright__ = 'Copyright 2026, HafenCity University Hamburg'
+
+import os
+import sys
+import itertools
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, List, Tuple
+
+_pool = None
+_queue = None
+_lock = threading.Lock()
+# processes can't be started in this environment
+_broken = False
+# callbacks for the reports of the running functions by task id
+_callbacks = {}
+# set when all reports of a task are passed to its callback
+_done = {}
+_task_ids = itertools.count()
+# only set in the processes of the pool
+_process_queue = None
+_current_task = None
+# reports of functions running in the threads of this process
+_local = threading.local()
+
+
+def python_executable() -> str:
+    '''
+    path to the python interpreter, QGIS embeds Python, so the executable of
+    the running process may be the QGIS application itself
+
+    Returns
+    -------
+    str
+        path to the interpreter, None if not found
+    '''
+    executable = sys.executable
+    if os.path.basename(executable).lower().startswith('python'):
+        return executable
+    if sys.platform == 'win32':
+        names = ['pythonw.exe', 'python.exe']
+    else:
+        names = [f'python{sys.version_info.major}.{sys.version_info.minor}',
+                 'python3', 'python']
+    for folder in [sys.exec_prefix, os.path.join(sys.exec_prefix, 'bin')]:
+        for name in names:
+            path = os.path.join(folder, name)
+            if os.path.isfile(path):
+                return path
+    return None
+
+
+def report(message: str = None, progress: float = None):
+    '''
+    report a message and/or the progress of the currently running function to
+    the caller, to be called inside of the functions
+
+    Parameters
+    ----------
+    message : str, optional
+        the message
+    progress : float, optional
+        progress of the function in percent
+    '''
+    if _process_queue is not None:
+        _process_queue.put((_current_task, message, progress))
+        return
+    callback = getattr(_local, 'callback', None)
+    if callback:
+        callback(message, progress)
+
+
+def _init_process(queue):
+    global _process_queue
+    _process_queue = queue
+
+
+def _run(task_id: int, func: Callable, args: tuple):
+    global _current_task
+    _current_task = task_id
+    try:
+        return func(*args)
+    finally:
+        # marks the end of the reports of this task
+        _process_queue.put((task_id, ))
+
+
+def _listen(queue):
+    '''
+    pass the reports of the processes to the callbacks until the pool is
+    shut down
+    '''
+    while True:
+        item = queue.get()
+        if item is None:
+            return
+        if len(item) == 1:
+            done = _done.get(item[0])
+            if done:
+                done.set()
+            continue
+        task_id, message, progress = item
+        callback = _callbacks.get(task_id)
+        if callback:
+            callback(message, progress)
+
+
+def get_pool() -> ProcessPoolExecutor:
+    '''
+    the shared pool of processes (started on first call)
+
+    Returns
+    -------
+    ProcessPoolExecutor
+        the pool
+
+    Raises
+    ------
+    OSError
+        no Python interpreter found to run the processes with
+    '''
+    global _pool, _queue
+    with _lock:
+        if _pool is None:
+            executable = python_executable()
+            if not executable:
+                raise OSError('Python-Interpreter nicht gefunden')
+            # forking the QGIS process with its running threads is not safe
+            context = multiprocessing.get_context('spawn')
+            context.set_executable(executable)
+            _queue = context.Queue()
+            _pool = ProcessPoolExecutor(
+                max_workers=os.cpu_count(), mp_context=context,
+                initializer=_init_process, initargs=(_queue, ))
+            listener = threading.Thread(target=_listen, args=(_queue, ),
+                                        name='process-reports', daemon=True)
+            listener.start()
+        return _pool
+
+
+def shutdown():
+    '''
+    stop the processes of the pool and the thread listening to their reports
+    (e.g. when the plugin is unloaded), a new pool is started on next use
+    '''
+    global _pool, _queue
+    with _lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False)
+        if _queue is not None:
+            _queue.put(None)
+        _pool = None
+        _queue = None
+
+
+def run_parallel(calls: List[Tuple[Callable, tuple]],
+                 callback: Callable = None) -> list:
+    '''
+    run functions in parallel in the processes of the shared pool and wait
+    for their results. The functions are run one after another in the current
+    thread if no processes can be started
+
+    Parameters
+    ----------
+    calls : list
+        tuples of function and arguments, e.g. [(np.sum, (values, ))]
+    callback : function, optional
+        called with the index of the call, the message and the progress
+        whenever a function reports
+
+    Returns
+    -------
+    list
+        the results of the functions in the order of the calls
+    '''
+    global _broken
+    task_ids = [next(_task_ids) for call in calls]
+    for task_id in task_ids:
+        _done[task_id] = threading.Event()
+    if callback:
+        for i, task_id in enumerate(task_ids):
+            _callbacks[task_id] = (
+                lambda message, progress, i=i: callback(i, message, progress))
+    try:
+        if not _broken:
+            try:
+                pool = get_pool()
+            except OSError:
+                _broken = True
+        if not _broken:
+            try:
+                futures = [pool.submit(_run, task_id, func, args)
+                           for task_id, (func, args) in zip(task_ids, calls)]
+                results = [future.result() for future in futures]
+                # the last reports might still be in the queue
+                for task_id in task_ids:
+                    _done[task_id].wait(timeout=5)
+                return results
+            # the processes failed to start or were killed
+            except BrokenProcessPool:
+                _broken = True
+                shutdown()
+        results = []
+        for task_id, (func, args) in zip(task_ids, calls):
+            _local.callback = _callbacks.get(task_id)
+            try:
+                results.append(func(*args))
+            finally:
+                _local.callback = None
+        return results
+    finally:
+        for task_id in task_ids:
+            _callbacks.pop(task_id, None)
+            _done.pop(task_id, None)
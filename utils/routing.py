@@ -0,0 +1,721 @@
+# -*- coding: utf-8 -*-
+'''
+***************************************************************************
+    routing.py
+    ---------------------
+    Date                 : October 2026
+    Copyright            : (C) 2026 by Christoph Franke
+    Email                : franke at ggr-planung dot de
+***************************************************************************
+*                                                                         *
+*   This program is free software: you can redistribute it and/or modify  *
+*   it under the terms of the GNU General Public License as published by  *
+*   the Free Software Foundation; either version 3 of the License, or     *
+*   (at your option) any later version.                                   *
+*                                                                         *
+***************************************************************************
+
+routing backends answering the routing requests of the domains (routes,
+travel time rasters and isochrones) either via the OpenTripPlanner web service
+or locally on a road network
+'''
+
+__author__ = 'Christoph Franke'
+__date__ = '19/10/2026'
+__copyright__ = 'Copyright 2026, HafenCity University Hamburg'
+
+import os
+import json
+import tempfile
+import numpy as np
+from typing import List, Tuple
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import dijkstra
+from scipy.spatial import cKDTree
+from osgeo import gdal, ogr, osr
+
+from projektcheck.utils.spatial import Point, transform_coords
+from projektcheck.utils.polyline import PolylineCodec
+from projektcheck.utils.connection import Request, get_cache
+from projektcheck.settings import settings
+
+# isochrones of the OTP router (the underlying network is rarely updated)
+get_cache().register(
+    f'{settings.OTP_ROUTER_URL}/routers/{settings.OTP_ROUTER_ID}/isochrone',
+    ttl=30 * 24 * 3600)
+requests = Request(synchronous=True, cache=get_cache())
+
+
+class RoutingBackend:
+    '''
+    abstract routing backend
+    '''
+
+    def route(self, source: Point, destination: Point, mode: str = 'CAR'
+              ) -> List[Tuple[float, float]]:
+        '''
+        override, shortest route between two points
+
+        Parameters
+        ----------
+        source : Point
+            origin of the route
+        destination : Point
+            destination of the route
+        mode : str, optional
+            traffic mode ('CAR', 'BICYCLE' or 'WALK'), defaults to car
+
+        Returns
+        -------
+        list
+            coordinates (lat, lon) along the route, the last coordinate is the
+            destination, empty if no route was found
+        '''
+        raise NotImplementedError
+
+    def travel_time_raster(self, origin: Point, out_raster: str,
+                           speed: float = 30, cutoff_minutes: int = 70,
+                           resolution: int = 300, target_epsg: int = 4326,
+                           search_radius: int = 1000) -> str:
+        '''
+        override, write a raster with the travel times in minutes from the
+        origin to all cells by walking along the road network with the given
+        speed
+
+        Parameters
+        ----------
+        origin : Point
+            the origin of the routes
+        out_raster : str
+            path of the raster file (GeoTIFF) to write
+        speed : float, optional
+            speed in km/h, defaults to 30 km/h
+        cutoff_minutes : int, optional
+            travel time limit, cells with travel times exceeding the limit by
+            more than 30 minutes are unreachable, defaults to 70 minutes
+        resolution : int, optional
+            side length of the raster cells in meters, defaults to 300 m
+        target_epsg : int, optional
+            epsg code of the projection of the raster, defaults to 4326
+        search_radius : int, optional
+            max. distance in meters of the origin and the cells to the road
+            network, defaults to 1000 m
+
+        Returns
+        -------
+        str
+            path to the written raster file, None if there is no route from
+            the origin
+        '''
+        raise NotImplementedError
+
+    def isochrone(self, point: Point, mode: str, time_sec: int,
+                  speed: float) -> dict:
+        '''
+        override, area reachable from a point within the given time
+
+        Parameters
+        ----------
+        point : Point
+            the point to start from
+        mode : str
+            traffic mode ('CAR', 'BICYCLE' or 'WALK')
+        time_sec : int
+            travel time limit in seconds
+        speed : float
+            walking resp. cycling speed in m/s
+
+        Returns
+        -------
+        dict
+            geo-json geometry of the isochrone (WGS84), None if nothing is
+            reachable
+        '''
+        raise NotImplementedError
+
+    def isochrones(self, point: Point, mode: str, times_sec: List[int],
+                   speed: float) -> List[dict]:
+        '''
+        areas reachable from a point within multiple travel times, override
+        if the backend is able to calculate them at once
+
+        Parameters
+        ----------
+        point : Point
+            the point to start from
+        mode : str
+            traffic mode ('CAR', 'BICYCLE' or 'WALK')
+        times_sec : list
+            travel time limits in seconds
+        speed : float
+            walking resp. cycling speed in m/s
+
+        Returns
+        -------
+        list
+            geo-json geometries of the isochrones (WGS84) in the order of the
+            time limits, None for isochrones with nothing reachable
+        '''
+        return [self.isochrone(point, mode, time_sec, speed)
+                for time_sec in times_sec]
+
+
+class OTPBackend(RoutingBackend):
+    '''
+    routing backend querying the OpenTripPlanner web service
+    '''
+    # default query parameters of isochrones
+    isochrone_params = {
+        'algorithm': 'accSampling', # 'algorithm': 'recursiveGrid',
+        'maxWalkDistance': 4000,
+        'fromPlace': '0, 0',
+        'mode': 'WALK',
+        'cutoffSec': 600,
+        'walkSpeed': 1.33,
+        'offRoadDistanceMeters': 500,
+        'bikeSpeed': 5.0,
+    }
+
+    def __init__(self, url: str = None, router: str = None):
+        '''
+        Parameters
+        ----------
+        url : str, optional
+            base url of the OTP web service, defaults to the url in the settings
+        router : str, optional
+            name of the OTP router, defaults to the router in the settings
+        '''
+        self.url = url or settings.OTP_ROUTER_URL
+        self.router = router or settings.OTP_ROUTER_ID
+
+    @staticmethod
+    def parse_plan(json: dict) -> List[Tuple[float, float]]:
+        '''
+        coordinates of the first itinerary of an OTP plan
+
+        Parameters
+        ----------
+        json : dict
+            response of the OTP plan service
+
+        Returns
+        -------
+        list
+            coordinates (lat, lon), empty if there is no itinerary
+        '''
+        try:
+            itinerary = json['plan']['itineraries'][0]
+        except (KeyError, IndexError):
+            return []
+        leg = itinerary['legs'][0]
+        points = leg['legGeometry']['points']
+        return PolylineCodec().decode(points)
+
+    def route(self, source: Point, destination: Point, mode: str = 'CAR'
+              ) -> List[Tuple[float, float]]:
+        if source.epsg != 4326:
+            source = source.transform(4326, inplace=False)
+        if destination.epsg != 4326:
+            destination = destination.transform(4326, inplace=False)
+        params = dict(routerId=self.router,
+                      fromPlace=f'{source.y},{source.x}',
+                      toPlace=f'{destination.y},{destination.x}',
+                      mode=mode,
+                      maxPreTransitTime=1200)
+        r = requests.get(f'{self.url}/routers/{self.router}/plan',
+                         params=params, timeout=60000)
+        r.raise_for_status()
+        return self.parse_plan(r.json())
+
+    def travel_time_raster(self, origin: Point, out_raster: str,
+                           speed: float = 30, cutoff_minutes: int = 70,
+                           resolution: int = 300, target_epsg: int = 4326,
+                           search_radius: int = 1000) -> str:
+        if origin.epsg != 4326:
+            origin = origin.transform(4326, inplace=False)
+        params = {
+            'batch': True,
+            'routerId': self.router,
+            'fromPlace': f"{origin.y},{origin.x}",
+            'mode': 'WALK',
+            'maxWalkDistance': 50000,
+            'maxPreTransitTime': 1200,
+            # the max traveltime will be (cutoffMinutes + 30 min)
+            'cutoffMinutes': cutoff_minutes,
+            'searchRadiusM': search_radius,
+            'walkSpeed': speed / 3.6,
+            'intersectCosts': False,
+        }
+        otp_url = self.url + '/surfaces'
+        try:
+            r = requests.post(otp_url, params=params)
+        except ConnectionError:
+            raise ConnectionError(
+                'Der Server antwortet nicht. Möglicherweise ist er nicht aktiv '
+                'oder überlastet.')
+
+        try:
+            id = r.json()['id']
+        except:
+            return None
+        url = f'{otp_url}/{id}/raster'
+
+        params = {
+            'resolution': resolution,
+            'crs': f'EPSG:{target_epsg}',
+        }
+        r = requests.get(url, params=params)
+        if r.status_code == 200:
+            with open(out_raster, 'wb') as f:
+                f.write(r.raw_data)
+        else:
+            raise Exception('Das angefragte Distanzraster ist fehlerhaft.')
+        return out_raster
+
+    def isochrone(self, point: Point, mode: str, time_sec: int,
+                  speed: float) -> dict:
+        return self.isochrones(point, mode, [time_sec], speed)[0]
+
+    def isochrones(self, point: Point, mode: str, times_sec: List[int],
+                   speed: float) -> List[dict]:
+        params = self.isochrone_params.copy()
+        params['routerId'] = self.router
+        # OTP calculates the isochrones of all given cutoffs at once
+        params['cutoffSec'] = [int(t) for t in times_sec]
+        params['mode'] = mode
+        params['walkSpeed'] = speed
+        if point.epsg != 4326:
+            point = point.transform(4326, inplace=False)
+        params['fromPlace'] = '{y},{x}'.format(y = point.y, x = point.x)
+        r = requests.get(f'{self.url}/routers/{self.router}/isochrone',
+                         params=params)
+        r.raise_for_status()
+        # returns a collection with a feature per cutoff
+        features = r.json()['features']
+        geometries = {}
+        for i, feature in enumerate(features):
+            sec = (feature.get('properties') or {}).get('time')
+            # assume the order of the cutoffs if the time is not returned
+            if sec is None:
+                if i >= len(times_sec):
+                    continue
+                sec = times_sec[i]
+            geometries[int(sec)] = feature['geometry'] or None
+        return [geometries.get(int(t)) for t in times_sec]
+
+
+class RoadGraph:
+    '''
+    road network as nodes and directed links, loaded from a line layer
+
+    Attributes
+    ----------
+    x : ndarray
+        x coordinates of the nodes
+    y : ndarray
+        y coordinates of the nodes
+    from_node : ndarray
+        indices of the nodes the links start at
+    to_node : ndarray
+        indices of the nodes the links end at
+    length : ndarray
+        lengths of the links in meters
+    speed : ndarray
+        speeds on the links in km/h (nan if not set)
+    oneway : ndarray
+        True if the link may only be passed in its direction (by car)
+    '''
+    def __init__(self, path: str, layer_name: str = None, epsg: int = 25832,
+                 speed_field: str = 'speed', oneway_field: str = 'oneway'):
+        '''
+        Parameters
+        ----------
+        path : str
+            path to the geopackage (or any other file readable by OGR)
+            containing the roads as (multi-)lines
+        layer_name : str, optional
+            name of the layer with the roads, defaults to the first layer
+        epsg : int, optional
+            epsg code of a metric projection the network is transformed into,
+            defaults to 25832
+        speed_field : str, optional
+            name of the field with the max. speeds in km/h, defaults to 'speed'
+        oneway_field : str, optional
+            name of the field marking one-way roads, defaults to 'oneway'
+        '''
+        self.epsg = epsg
+        ds = ogr.Open(path)
+        if ds is None:
+            raise FileNotFoundError(f'{path} not found')
+        layer = ds.GetLayerByName(layer_name) if layer_name \
+            else ds.GetLayer(0)
+        if layer is None:
+            raise FileNotFoundError(f'layer {layer_name} not found')
+        ref = layer.GetSpatialRef()
+        ref.AutoIdentifyEPSG()
+        source_epsg = int(ref.GetAuthorityCode(None))
+        defn = layer.GetLayerDefn()
+        field_names = [defn.GetFieldDefn(i).GetName()
+                       for i in range(defn.GetFieldCount())]
+        has_speed = speed_field in field_names
+        has_oneway = oneway_field in field_names
+
+        coords = []
+        link_starts = []
+        speeds = []
+        oneways = []
+        n_points = 0
+        for feature in layer:
+            geom = feature.GetGeometryRef()
+            if geom is None:
+                continue
+            speed = feature[speed_field] if has_speed else None
+            oneway = bool(feature[oneway_field]) if has_oneway else False
+            if geom.GetGeometryCount() > 0:
+                lines = [geom.GetGeometryRef(i)
+                         for i in range(geom.GetGeometryCount())]
+            else:
+                lines = [geom]
+            for line in lines:
+                points = line.GetPoints()
+                if not points or len(points) < 2:
+                    continue
+                n = len(points)
+                coords.extend(p[:2] for p in points)
+                link_starts.extend(range(n_points, n_points + n - 1))
+                speeds.extend([speed or np.nan] * (n - 1))
+                oneways.extend([oneway] * (n - 1))
+                n_points += n
+        ds = None
+
+        coords = np.array(coords, dtype=float).reshape(-1, 2)
+        x, y = transform_coords(coords[:, 0], coords[:, 1],
+                                source_epsg, epsg)
+        # merge vertices with same position (cm precision) to one node
+        rounded = np.round(np.column_stack([x, y]), 2)
+        nodes, node_idx = np.unique(rounded, axis=0, return_inverse=True)
+        node_idx = node_idx.ravel()
+        link_starts = np.array(link_starts, dtype=np.int64)
+        from_node = node_idx[link_starts]
+        to_node = node_idx[link_starts + 1]
+        valid = from_node != to_node
+        self.x = nodes[:, 0]
+        self.y = nodes[:, 1]
+        self.from_node = from_node[valid]
+        self.to_node = to_node[valid]
+        self.length = np.hypot(self.x[self.to_node] - self.x[self.from_node],
+                               self.y[self.to_node] - self.y[self.from_node])
+        self.speed = np.array(speeds, dtype=float)[valid]
+        self.oneway = np.array(oneways, dtype=bool)[valid]
+        self.tree = cKDTree(nodes)
+
+    def __len__(self):
+        return len(self.x)
+
+    def matrix(self, speed: np.ndarray, directed: bool = True) -> csr_matrix:
+        '''
+        sparse adjacency matrix with the travel times in seconds as weights
+
+        Parameters
+        ----------
+        speed : ndarray or float
+            speeds in km/h per link or single speed for all links
+        directed : bool, optional
+            one-way roads may only be passed in their direction if True,
+            defaults to directed
+
+        Returns
+        -------
+        csr_matrix
+        '''
+        seconds = self.length / (np.broadcast_to(speed, self.length.shape)
+                                 / 3.6)
+        both_ways = ~self.oneway if directed \
+            else np.ones(len(self.length), dtype=bool)
+        rows = np.concatenate([self.from_node, self.to_node[both_ways]])
+        cols = np.concatenate([self.to_node, self.from_node[both_ways]])
+        data = np.concatenate([seconds, seconds[both_ways]])
+        # keep only the fastest of parallel links (csr sums up duplicates)
+        order = np.lexsort((data, cols, rows))
+        rows, cols, data = rows[order], cols[order], data[order]
+        first = np.ones(len(rows), dtype=bool)
+        first[1:] = (rows[1:] != rows[:-1]) | (cols[1:] != cols[:-1])
+        n = len(self)
+        return csr_matrix((data[first], (rows[first], cols[first])),
+                          shape=(n, n))
+
+    def snap(self, x: float, y: float) -> Tuple[int, float]:
+        '''
+        closest node to a position
+
+        Returns
+        -------
+        tuple
+            index of closest node and distance to it in meters
+        '''
+        dist, idx = self.tree.query([x, y])
+        return int(idx), float(dist)
+
+
+class LocalBackend(RoutingBackend):
+    '''
+    routing backend calculating the shortest paths on a road network in-process
+    (Dijkstra), the road network is loaded from a line layer of a geopackage
+    '''
+    # default speeds in km/h, speeds of cars are taken from the speed field of
+    # the roads if available
+    default_speeds = {
+        'CAR': 50,
+        'BICYCLE': 15,
+        'WALK': 4.8,
+    }
+    # max. distance to the road network in meters when routing
+    snap_distance = 1000
+    # max. distance off-road in meters when calculating isochrones
+    offroad_distance = 500
+    # speed in km/h off-road (to and from the road network) by car
+    offroad_speed = 4.8
+    # side length of the raster cells in meters the isochrones are derived from
+    isochrone_resolution = 50
+    # number of closest nodes considered to reach a raster cell from
+    n_neighbours = 4
+    # travel time in minutes written to the rasters for unreachable cells
+    unreachable = 255
+    # the loaded road networks (shared between instances)
+    _graphs = {}
+
+    def __init__(self, path: str, layer_name: str = None, epsg: int = None):
+        '''
+        Parameters
+        ----------
+        path : str
+            path to the geopackage containing the road network as lines
+        layer_name : str, optional
+            name of the layer with the roads, defaults to the first layer
+        epsg : int, optional
+            epsg code of a metric projection to route in, defaults to the
+            projection of the projects
+        '''
+        self.epsg = epsg or settings.EPSG
+        key = (path, layer_name, self.epsg)
+        if key not in self._graphs:
+            self._graphs[key] = RoadGraph(path, layer_name=layer_name,
+                                          epsg=self.epsg)
+        self.graph = self._graphs[key]
+        self._matrices = {}
+
+    def _matrix(self, mode: str, speed: float = None) -> csr_matrix:
+        '''
+        adjacency matrix for given mode, walking and cycling ignores the
+        speed limits and one-way roads
+        '''
+        key = (mode, speed)
+        if key not in self._matrices:
+            if mode == 'CAR':
+                speeds = self.graph.speed.copy()
+                unset = np.isnan(speeds) | (speeds <= 0)
+                speeds[unset] = speed or self.default_speeds['CAR']
+                matrix = self.graph.matrix(speeds, directed=True)
+            else:
+                speed = speed or self.default_speeds[mode]
+                matrix = self.graph.matrix(speed, directed=False)
+            self._matrices[key] = matrix
+        return self._matrices[key]
+
+    def _project(self, point: Point) -> Tuple[float, float]:
+        '''
+        coordinates of point in projection of the graph
+        '''
+        if point.epsg == self.epsg:
+            return point.x, point.y
+        p = point.transform(self.epsg, inplace=False)
+        return p.x, p.y
+
+    def _travel_times(self, point: Point, matrix: csr_matrix,
+                      offroad_speed: float, max_offroad: float,
+                      limit: float) -> np.ndarray:
+        '''
+        travel times in seconds from point to all nodes (inf if unreachable)
+        '''
+        x, y = self._project(point)
+        node, dist = self.graph.snap(x, y)
+        if dist > max_offroad:
+            return np.full(len(self.graph), np.inf)
+        offroad_sec = dist / (offroad_speed / 3.6)
+        times = dijkstra(matrix, directed=True, indices=node,
+                         limit=max(limit - offroad_sec, 0))
+        return times + offroad_sec
+
+    def _time_grid(self, times: np.ndarray, resolution: float,
+                   offroad_speed: float, max_offroad: float
+                   ) -> Tuple[np.ndarray, tuple]:
+        '''
+        travel times in seconds in a raster covering the reachable nodes, the
+        cells are reached off-road from the closest reachable node
+
+        Returns
+        -------
+        tuple
+            2d-array with travel times (inf if unreachable) and the geo
+            transform of the raster (GDAL-style)
+        '''
+        reachable = np.isfinite(times)
+        x = self.graph.x[reachable]
+        y = self.graph.y[reachable]
+        r_times = times[reachable]
+        x_min = x.min() - max_offroad
+        y_max = y.max() + max_offroad
+        n_cols = int(np.ceil((x.max() + max_offroad - x_min) / resolution))
+        n_rows = int(np.ceil((y_max - (y.min() - max_offroad)) / resolution))
+        cx = x_min + (np.arange(n_cols) + 0.5) * resolution
+        cy = y_max - (np.arange(n_rows) + 0.5) * resolution
+        grid_x, grid_y = np.meshgrid(cx, cy)
+        tree = cKDTree(np.column_stack([x, y]))
+        # the closest node is not necessarily the fastest one to reach the
+        # cell from, take the best of the closest ones
+        k = min(self.n_neighbours, len(x))
+        dist, idx = tree.query(
+            np.column_stack([grid_x.ravel(), grid_y.ravel()]), k=k,
+            distance_upper_bound=max_offroad)
+        dist = dist.reshape(-1, k)
+        idx = idx.reshape(-1, k)
+        found = np.isfinite(dist)
+        neighbour_times = np.full(dist.shape, np.inf)
+        neighbour_times[found] = (r_times[idx[found]] +
+                                  dist[found] / (offroad_speed / 3.6))
+        cell_times = neighbour_times.min(axis=1)
+        geotransform = (x_min, resolution, 0, y_max, 0, -resolution)
+        return cell_times.reshape(n_rows, n_cols), geotransform
+
+    def route(self, source: Point, destination: Point, mode: str = 'CAR'
+              ) -> List[Tuple[float, float]]:
+        sx, sy = self._project(source)
+        dx, dy = self._project(destination)
+        source_node, s_dist = self.graph.snap(sx, sy)
+        dest_node, d_dist = self.graph.snap(dx, dy)
+        if max(s_dist, d_dist) > self.snap_distance:
+            return []
+        times, predecessors = dijkstra(
+            self._matrix(mode), directed=True, indices=source_node,
+            return_predecessors=True)
+        if not np.isfinite(times[dest_node]):
+            return []
+        path = [dest_node]
+        while path[-1] != source_node:
+            path.append(predecessors[path[-1]])
+        path = np.array(path[::-1])
+        lon, lat = transform_coords(self.graph.x[path], self.graph.y[path],
+                                    self.epsg, 4326)
+        coords = list(zip(lat, lon))
+        # end at the destination itself (like the routes of OTP)
+        dlon, dlat = transform_coords([dx], [dy], self.epsg, 4326)
+        coords.append((dlat[0], dlon[0]))
+        return coords
+
+    def travel_time_raster(self, origin: Point, out_raster: str,
+                           speed: float = 30, cutoff_minutes: int = 70,
+                           resolution: int = 300, target_epsg: int = 4326,
+                           search_radius: int = 1000) -> str:
+        max_sec = (cutoff_minutes + 30) * 60
+        times = self._travel_times(origin, self._matrix('WALK', speed),
+                                   speed, search_radius, max_sec)
+        if not np.isfinite(times).any():
+            return None
+        cell_times, geotransform = self._time_grid(
+            times, resolution, speed, search_radius)
+        minutes = cell_times / 60
+        minutes[~np.isfinite(minutes) | (minutes > max_sec / 60)] = \
+            self.unreachable
+        n_rows, n_cols = minutes.shape
+        tmp_raster = out_raster if target_epsg == self.epsg \
+            else tempfile.NamedTemporaryFile(suffix='.tif').name
+        ds = gdal.GetDriverByName('GTiff').Create(
+            tmp_raster, n_cols, n_rows, 1, gdal.GDT_Float32)
+        ds.SetGeoTransform(geotransform)
+        ref = osr.SpatialReference()
+        ref.ImportFromEPSG(self.epsg)
+        ds.SetProjection(ref.ExportToWkt())
+        ds.GetRasterBand(1).WriteArray(minutes.astype(np.float32))
+        ds.FlushCache()
+        ds = None
+        if tmp_raster != out_raster:
+            gdal.Warp(out_raster, tmp_raster, dstSRS=f'EPSG:{target_epsg}',
+                      xRes=resolution if target_epsg != 4326 else None,
+                      yRes=resolution if target_epsg != 4326 else None)
+            os.remove(tmp_raster)
+        return out_raster
+
+    def isochrone(self, point: Point, mode: str, time_sec: int,
+                  speed: float) -> dict:
+        return self.isochrones(point, mode, [time_sec], speed)[0]
+
+    def isochrones(self, point: Point, mode: str, times_sec: List[int],
+                   speed: float) -> List[dict]:
+        # walking and cycling with given speed (in m/s), driving with the
+        # speeds of the roads
+        if mode == 'CAR':
+            matrix = self._matrix(mode)
+            offroad_speed = self.offroad_speed
+        else:
+            matrix = self._matrix(mode, speed * 3.6)
+            offroad_speed = speed * 3.6
+        # the travel times up to the largest limit are calculated only once
+        times = self._travel_times(point, matrix, offroad_speed,
+                                   self.offroad_distance, max(times_sec))
+        if not np.isfinite(times).any():
+            return [None] * len(times_sec)
+        cell_times, geotransform = self._time_grid(
+            times, self.isochrone_resolution, offroad_speed,
+            self.offroad_distance)
+        n_rows, n_cols = cell_times.shape
+        ref = osr.SpatialReference()
+        ref.ImportFromEPSG(self.epsg)
+        target = osr.SpatialReference()
+        target.ImportFromEPSG(4326)
+        for r in ref, target:
+            if hasattr(r, 'SetAxisMappingStrategy'):
+                r.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
+        transformation = osr.CoordinateTransformation(ref, target)
+        ds = gdal.GetDriverByName('MEM').Create('', n_cols, n_rows, 1,
+                                                gdal.GDT_Byte)
+        ds.SetGeoTransform(geotransform)
+        ds.SetProjection(ref.ExportToWkt())
+        band = ds.GetRasterBand(1)
+
+        geometries = []
+        for time_sec in times_sec:
+            mask = (cell_times <= time_sec).astype(np.uint8)
+            if not mask.any():
+                geometries.append(None)
+                continue
+            band.WriteArray(mask)
+            mem_ds = ogr.GetDriverByName('Memory').CreateDataSource(
+                'isochrone')
+            layer = mem_ds.CreateLayer('isochrone', srs=ref,
+                                       geom_type=ogr.wkbPolygon)
+            layer.CreateField(ogr.FieldDefn('reachable', ogr.OFTInteger))
+            gdal.Polygonize(band, band, layer, 0)
+            multi = ogr.Geometry(ogr.wkbMultiPolygon)
+            for feature in layer:
+                multi.AddGeometry(feature.GetGeometryRef())
+            geom = multi.UnionCascaded()
+            geom.Transform(transformation)
+            geometries.append(json.loads(geom.ExportToJson()))
+        return geometries
+
+
+def get_routing_backend() -> RoutingBackend:
+    '''
+    routing backend configured in the settings (settings.ROUTING_BACKEND),
+    'local' - routing on the road network in settings.ROUTING_GRAPH_PATH,
+    'otp' (default) - OpenTripPlanner web service at settings.OTP_ROUTER_URL
+
+    Returns
+    -------
+    RoutingBackend
+    '''
+    backend = getattr(settings, 'ROUTING_BACKEND', 'otp')
+    if backend == 'local':
+        return LocalBackend(settings.ROUTING_GRAPH_PATH,
+                            layer_name=settings.ROUTING_GRAPH_LAYER or None)
+    return OTPBackend()
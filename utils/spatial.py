@@ -4,7 +4,7 @@ from qgis.core import (QgsPointXY, QgsGeometry, QgsVectorLayer, QgsField,
                        QgsProject, QgsCoordinateReferenceSystem, QgsPoint,
                        QgsFeatureIterator)
 from qgis.PyQt.QtCore import QVariant
-from osgeo import gdal, osr
+from osgeo import gdal, ogr, osr
 from typing import Union, Tuple, List
 import os
 import tempfile
@@ -96,6 +96,45 @@ class Point(object):
         else:
             return Point(x, y, id=self.id, epsg=target_srid)
 
+def transform_coords(x: np.ndarray, y: np.ndarray, source_epsg: int,
+                     target_epsg: int) -> Tuple[np.ndarray, np.ndarray]:
+    '''
+    transform arrays of coordinates into a different projection in a single
+    call (way faster than transforming point by point with QGIS)
+
+    Parameters
+    ----------
+    x : array-like
+        x coordinates
+    y : array-like
+        y coordinates (same length as x)
+    source_epsg : int
+        epsg code of the projection the coordinates are in
+    target_epsg : int
+        epsg code of the projection to transform the coordinates into
+
+    Returns
+    ----------
+    tuple
+        arrays with transformed x and y coordinates
+    '''
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    if len(x) == 0 or source_epsg == target_epsg:
+        return x.copy(), y.copy()
+    srs = []
+    for epsg in source_epsg, target_epsg:
+        ref = osr.SpatialReference()
+        ref.ImportFromEPSG(int(epsg))
+        # GDAL >= 3 takes the axis order of the authority (lat/lon for 4326)
+        if hasattr(ref, 'SetAxisMappingStrategy'):
+            ref.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
+        srs.append(ref)
+    tr = osr.CoordinateTransformation(*srs)
+    transformed = np.array(tr.TransformPoints(np.column_stack([x, y])
+                                              .tolist()))
+    return transformed[:, 0], transformed[:, 1]
+
 def clip_raster(raster_file: str, bbox: Tuple[Point, Point]) -> Tuple[str, int]:
     '''
     clip a raster file with given bbox
@@ -129,6 +168,92 @@ def clip_raster(raster_file: str, bbox: Tuple[Point, Point]) -> Tuple[str, int]:
     clipped = ds = None
     return clipped_raster, int(raster_epsg)
 
+def read_raster(raster_file: str) -> Tuple[np.ndarray, tuple, int]:
+    '''
+    read the values of the first band of a raster file
+
+    Parameters
+    ----------
+    raster_file : str
+        full path to raster file
+
+    Returns
+    ----------
+    tuple
+        2d-array with the values, the geo transform (GDAL-style) and the epsg
+        code of the projection of the raster
+    '''
+    ds = gdal.OpenEx(raster_file)
+    try:
+        ref = ds.GetSpatialRef()
+    # gdal under linux does not seem to have the function above
+    except AttributeError:
+        ref = osr.SpatialReference(wkt=ds.GetProjection())
+    epsg = int(ref.GetAttrValue('AUTHORITY', 1))
+    values = ds.GetRasterBand(1).ReadAsArray()
+    geotransform = ds.GetGeoTransform()
+    ds = None
+    return values, geotransform, epsg
+
+def rasterize(geometries: List[QgsGeometry], geotransform: tuple,
+              shape: Tuple[int, int], epsg: int, raster_epsg: int = None
+              ) -> np.ndarray:
+    '''
+    burn geometries into a raster, cells are assigned to the geometry
+    containing their centers
+
+    Parameters
+    ----------
+    geometries : list
+        the (polygon) geometries
+    geotransform : tuple
+        GDAL-style geo transform of the raster
+    shape : tuple
+        number of rows and columns of the raster
+    epsg : int
+        epsg code of the projection of the geometries
+    raster_epsg : int, optional
+        epsg code of the projection of the raster, defaults to the one of the
+        geometries
+
+    Returns
+    ----------
+    ndarray
+        2d-array with the indices of the geometries in the list the cells are
+        covered by, -1 for cells not covered by any geometry
+    '''
+    raster_epsg = raster_epsg or epsg
+    refs = []
+    for e in epsg, raster_epsg:
+        ref = osr.SpatialReference()
+        ref.ImportFromEPSG(int(e))
+        if hasattr(ref, 'SetAxisMappingStrategy'):
+            ref.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
+        refs.append(ref)
+    tr = osr.CoordinateTransformation(*refs) if epsg != raster_epsg else None
+    mem_ds = ogr.GetDriverByName('Memory').CreateDataSource('rasterize')
+    layer = mem_ds.CreateLayer('geometries', srs=refs[1])
+    layer.CreateField(ogr.FieldDefn('idx', ogr.OFTInteger))
+    for i, geom in enumerate(geometries):
+        ogr_geom = ogr.CreateGeometryFromWkb(geom.asWkb().data())
+        if tr:
+            ogr_geom.Transform(tr)
+        feature = ogr.Feature(layer.GetLayerDefn())
+        feature.SetGeometry(ogr_geom)
+        feature.SetField('idx', i)
+        layer.CreateFeature(feature)
+    n_rows, n_cols = shape
+    ds = gdal.GetDriverByName('MEM').Create('', n_cols, n_rows, 1,
+                                            gdal.GDT_Int32)
+    ds.SetGeoTransform(geotransform)
+    ds.SetProjection(refs[1].ExportToWkt())
+    band = ds.GetRasterBand(1)
+    band.Fill(-1)
+    gdal.RasterizeLayer(ds, [1], layer, options=['ATTRIBUTE=idx'])
+    indices = band.ReadAsArray()
+    ds = mem_ds = None
+    return indices
+
 def get_bbox(table: Table) -> Tuple[Point, Point]:
     '''
     get the minimal bounding box covering all features in table
@@ -2,17 +2,19 @@ from qgis.core import (QgsCoordinateReferenceSystem,
                        QgsCoordinateTransform, QgsProject, QgsSymbol,
                        QgsSimpleFillSymbolLayer, QgsRectangle,
                        QgsRendererCategory, QgsCategorizedSymbolRenderer,
-                       QgsVectorLayer, QgsPointXY)
+                       QgsVectorLayer, QgsPointXY, QgsGeometry)
 from qgis.gui import QgsMapCanvas
 from qgis.PyQt.QtGui import QIcon
 from qgis.PyQt.QtWidgets import QToolBox, QLayout
 import os
 import sys
 import subprocess
+import shutil
+import sqlite3
 import pandas as pd
 import functools
 import threading
-from typing import Tuple, Union, List
+from typing import Tuple, Union, List, Callable
 
 from projektcheck.base.database import FeatureCollection, Database, Feature
 from projektcheck.settings import settings
@@ -152,23 +154,31 @@ def get_ags(features: Union[List[Feature], FeatureCollection],
     ags_table = workspace.get_table('bkg_gemeinden')
 
     target_crs = QgsCoordinateReferenceSystem(settings.EPSG)
+    if source_crs:
+        tr = QgsCoordinateTransform(
+            source_crs, target_crs, QgsProject.instance())
 
-    ags_feats = []
-
+    geoms = []
     for feat in features:
         geom = feat.geom if hasattr(feat, 'geom') else feat.geometry()
         if source_crs:
-            tr = QgsCoordinateTransform(
-                source_crs, target_crs, QgsProject.instance())
             geom.transform(tr)
-        wkt = geom.centroid().asWkt() if use_centroid else geom.asWkt()
-        ags_table.spatial_filter(wkt)
-        if len(ags_table) < 1:
+        geoms.append(geom.centroid() if use_centroid else geom)
+
+    # query the communities touched by any of the features only once and
+    # assign the features to them afterwards
+    ags_table.spatial_filter(QgsGeometry.collectGeometry(geoms).asWkt())
+    candidates = list(ags_table.features())
+
+    ags_feats = []
+    for feat, geom in zip(features, geoms):
+        matches = [c for c in candidates if c.geom.intersects(geom)]
+        if len(matches) < 1:
             raise Exception(f'Feature {feat.id()} liegt nicht in Deutschland.')
-        if len(ags_table) > 1:
+        if len(matches) > 1:
             raise Exception(
                 f'Feature {feat.id()} wurde mehreren Gemeinden zugeordnet.')
-        ags_feats.append(list(ags_table.features())[0])
+        ags_feats.append(matches[0])
     return ags_feats
 
 def clear_layout(layout: QLayout):
@@ -241,3 +251,75 @@ def open_file(path: str):
     else:
         opener = 'open' if sys.platform == 'darwin' else 'xdg-open'
         subprocess.call([opener, path])
+
+def reflink(source: str, target: str) -> bool:
+    '''
+    clone a file without copying its data (copy-on-write, both files share
+    the data blocks until one of them is modified), only supported by some
+    file systems (e.g. Btrfs, XFS, APFS)
+
+    Parameters
+    ----------
+    source : str
+        path to the file to clone
+    target : str
+        path to the clone, must not exist
+
+    Returns
+    -------
+    bool
+        True if the file was cloned, False if the platform or file system
+        doesn't support it (nothing is written then)
+    '''
+    if sys.platform.startswith('linux'):
+        import fcntl
+        # ioctl FICLONE
+        ficlone = 0x40049409
+        try:
+            with open(source, 'rb') as src, open(target, 'wb') as dst:
+                fcntl.ioctl(dst.fileno(), ficlone, src.fileno())
+            shutil.copystat(source, target)
+            return True
+        except OSError:
+            if os.path.exists(target):
+                os.remove(target)
+            return False
+    if sys.platform == 'darwin':
+        import ctypes
+        try:
+            libc = ctypes.CDLL(None, use_errno=True)
+            return libc.clonefile(source.encode(), target.encode(), 0) == 0
+        except (OSError, AttributeError):
+            return False
+    return False
+
+def copy_sqlite(source: str, target: str, progress: Callable = None,
+                pages: int = 1024):
+    '''
+    copy a SQLite database (e.g. a GeoPackage) page by page with the online
+    backup API of SQLite, the copy is consistent even if the database is in
+    use
+
+    Parameters
+    ----------
+    source : str
+        path to the database to copy
+    target : str
+        path to the copy
+    progress : function, optional
+        called after each step with the number of copied pages and the total
+        number of pages
+    pages : int, optional
+        number of pages copied per step, defaults to 1024
+    '''
+    def on_progress(status, remaining, total):
+        if progress:
+            progress(total - remaining, total)
+    src = sqlite3.connect(source)
+    dst = sqlite3.connect(target)
+    try:
+        with dst:
+            src.backup(dst, pages=pages, progress=on_progress)
+    finally:
+        dst.close()
+        src.close()